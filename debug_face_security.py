@@ -3,14 +3,16 @@
 Debug script to test face recognition security and identify why different people can access each other's accounts
 """
 
+import os
 import sys
-import json
 import base64
 import io
 import numpy as np
 from PIL import Image
 import cv2
-import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server'))
+from face_backends import get_backend
 
 def create_distinct_face_images():
     """Create two clearly different face patterns for testing"""
@@ -41,54 +43,18 @@ def create_distinct_face_images():
 
 def encode_face(image_data):
     """Encode a face using the simple face recognition system"""
-    process = subprocess.Popen(
-        ['python3', 'server/simple_face_recognition.py', 'encode'],
-        stdin=subprocess.PIPE,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True
-    )
-    
-    input_data = json.dumps({"image_data": image_data})
-    stdout, stderr = process.communicate(input_data)
-    
-    if process.returncode == 0:
-        result = json.loads(stdout)
-        if result.get('success'):
-            return result['encoding']
-        else:
-            print(f"Encoding failed: {result.get('error')}")
-            return None
-    else:
-        print(f"Process failed: {stderr}")
+    try:
+        return get_backend('simple_face_recognition').encode(image_data)
+    except Exception as e:
+        print(f"Encoding failed: {e}")
         return None
 
 def compare_faces(known_encoding, unknown_image, tolerance=0.6):
     """Compare faces using the simple face recognition system"""
-    process = subprocess.Popen(
-        ['python3', 'server/simple_face_recognition.py', 'compare'],
-        stdin=subprocess.PIPE,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True
-    )
-    
-    input_data = json.dumps({
-        "known_encoding": known_encoding,
-        "unknown_image": unknown_image,
-        "tolerance": tolerance
-    })
-    stdout, stderr = process.communicate(input_data)
-    
-    if process.returncode == 0:
-        result = json.loads(stdout)
-        if result.get('success'):
-            return result['result']
-        else:
-            print(f"Comparison failed: {result.get('error')}")
-            return None
-    else:
-        print(f"Process failed: {stderr}")
+    try:
+        return get_backend('simple_face_recognition').compare(known_encoding, unknown_image, tolerance)
+    except Exception as e:
+        print(f"Comparison failed: {e}")
         return None
 
 def test_face_recognition_security():
@@ -102,14 +68,14 @@ def test_face_recognition_security():
     
     print("\n1. Encoding Face 1 (Person A)...")
     face1_encoding = encode_face(face1_image)
-    if not face1_encoding:
+    if face1_encoding is None:
         print("❌ Failed to encode Face 1")
         return
     print(f"✅ Face 1 encoded successfully (dimensions: {len(face1_encoding)})")
     
     print("\n2. Encoding Face 2 (Person B)...")
     face2_encoding = encode_face(face2_image)
-    if not face2_encoding:
+    if face2_encoding is None:
         print("❌ Failed to encode Face 2")
         return
     print(f"✅ Face 2 encoded successfully (dimensions: {len(face2_encoding)})")
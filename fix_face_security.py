@@ -4,49 +4,45 @@ Critical security fix - create a face recognition system that properly distingui
 """
 
 import sys
-import json
-import base64
-import io
+import os
 import numpy as np
-from PIL import Image
 import cv2
 
-def process_image_from_base64(image_data):
-    """Convert base64 image to numpy array."""
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server'))
+from face_features import cell_orientation_histograms
+from face_detectors import get_detector, parse_face_hint, detect_with_hint
+from face_image import FaceImage
+from stage_timings import stage_timer
+from face_backends import run_cli
+
+def process_image_from_base64(image_data, info=None):
+    """Convert base64 image to a FaceImage; large JPEGs are decoded at reduced resolution."""
     try:
-        if image_data.startswith('data:image'):
-            image_data = image_data.split(',')[1]
-        
-        image_bytes = base64.b64decode(image_data)
-        pil_image = Image.open(io.BytesIO(image_bytes))
-        
-        if pil_image.mode != 'RGB':
-            pil_image = pil_image.convert('RGB')
-        
-        rgb_array = np.array(pil_image)
-        return rgb_array
+        return FaceImage.from_upload(image_data, info)
     except Exception as e:
         raise Exception(f"Failed to process image: {str(e)}")
 
-def detect_face_secure(image):
+def detect_face_secure(image, face_hint=None, info=None):
     """Detect face with high confidence requirement."""
-    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-    
-    # Use multiple cascades for better detection
-    cascades = [
-        cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'),
-        cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_alt.xml'),
-        cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_alt2.xml')
-    ]
-    
-    faces = []
-    for cascade in cascades:
-        if cascade.empty():
-            continue
-        detected = cascade.detectMultiScale(gray, 1.1, 5, minSize=(80, 80))
-        if len(detected) > 0:
-            faces.extend(detected)
-            break
+    def detect_in_view(view):
+        # Use multiple cascades for better detection
+        faces = []
+        for detector_name in ['haar', 'haar_alt', 'haar_alt2']:
+            try:
+                detector = get_detector(detector_name)
+            except Exception:
+                continue
+            detected, _ = view.detect(detector, scale_factor=1.1, min_neighbors=5, min_size=(80, 80))
+            if len(detected) > 0:
+                faces.extend(detected)
+                break
+        return faces
+    
+    # Search around the client hint first, then the whole frame; detection runs on a
+    # downscaled copy and boxes come back in full-resolution coordinates
+    faces, hint_used = detect_with_hint(image.gray, face_hint, detect_in_view, info=info)
+    if info is not None:
+        info['hint_used'] = hint_used
     
     if len(faces) == 0:
         raise Exception("No face detected - please ensure your face is clearly visible")
@@ -55,23 +51,14 @@ def detect_face_secure(image):
     face = max(faces, key=lambda f: f[2] * f[3])
     return face
 
-def extract_unique_features(image, face_box):
+def extract_unique_features(image, face_box, info=None):
     """Extract features that are unique to individuals and resistant to spoofing."""
-    x, y, w, h = face_box
+    timer = stage_timer(info, 'features')
     
-    # Ensure we have enough padding
-    padding = max(20, int(min(w, h) * 0.2))
-    x_start = max(0, x - padding)
-    y_start = max(0, y - padding)
-    x_end = min(image.shape[1], x + w + padding)
-    y_end = min(image.shape[0], y + h + padding)
-    
-    # Extract face region
-    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-    face_roi = gray[y_start:y_end, x_start:x_end]
-    
-    # Resize to standard size for consistent feature extraction
-    face_roi = cv2.resize(face_roi, (128, 128))
+    # Grayscale face region with enough padding, resized to standard size for
+    # consistent feature extraction
+    face_roi = image.crop(face_box, 'gray', padding=0.2, min_padding=20, size=(128, 128))
+    timer.lap('crop')
     
     features = []
     
@@ -94,6 +81,7 @@ def extract_unique_features(image, face_box):
             
             # Sample every 4th feature to avoid too many dimensions
             features.extend(lbp_features[::4])
+    timer.lap('lbp')
     
     # 2. Gradient orientation histograms (captures edge patterns unique to face structure)
     grad_x = cv2.Sobel(face_roi, cv2.CV_64F, 1, 0, ksize=3)
@@ -102,16 +90,10 @@ def extract_unique_features(image, face_box):
     magnitude = np.sqrt(grad_x**2 + grad_y**2)
     orientation = np.arctan2(grad_y, grad_x)
     
-    # Divide into 8x8 grid
-    cell_h, cell_w = 128 // 8, 128 // 8
-    for i in range(8):
-        for j in range(8):
-            cell_mag = magnitude[i*cell_h:(i+1)*cell_h, j*cell_w:(j+1)*cell_w]
-            cell_ori = orientation[i*cell_h:(i+1)*cell_h, j*cell_w:(j+1)*cell_w]
-            
-            # Create histogram of oriented gradients
-            hist, _ = np.histogram(cell_ori.flatten(), bins=9, range=(-np.pi, np.pi), weights=cell_mag.flatten())
-            features.extend(hist / (np.sum(hist) + 1e-7))
+    # Histogram of oriented gradients for every cell of an 8x8 grid in one pass
+    cell_hists = cell_orientation_histograms(magnitude, orientation, grid=(8, 8), bins=9, block_norm='l1')
+    features.extend(cell_hists.ravel())
+    timer.lap('gradient')
     
     # 3. Facial region intensity patterns (captures geometric structure)
     regions = {
@@ -150,6 +132,7 @@ def extract_unique_features(image, face_box):
                     np.std(shifted_right - original_right),
                     np.std(shifted_down - original_down)
                 ])
+    timer.lap('regions')
     
     # 4. Frequency domain features (captures unique spectral characteristics)
     f_transform = np.fft.fft2(face_roi)
@@ -170,6 +153,7 @@ def extract_unique_features(image, face_box):
             np.std(masked_spectrum),
             np.max(masked_spectrum)
         ])
+    timer.lap('frequency')
     
     # Convert to numpy array and normalize
     features = np.array(features, dtype=np.float64)
@@ -181,29 +165,39 @@ def extract_unique_features(image, face_box):
     norm = np.linalg.norm(features)
     if norm > 0:
         features = features / norm
+    timer.lap('normalize')
     
     return features
 
-def encode_face_secure(image_data):
+def encode_face_secure(image_data, face_hint=None, info=None):
     """Generate secure face encoding that distinguishes between different people."""
     try:
-        rgb_image = process_image_from_base64(image_data)
-        face_box = detect_face_secure(rgb_image)
-        encoding = extract_unique_features(rgb_image, face_box)
+        timer = stage_timer(info)
+        decode_info = {}
+        face_image = process_image_from_base64(image_data, decode_info)
+        timer.lap('decode')
+        face_hint = parse_face_hint(face_hint, decode_info['decode_scale'])
+        face_box = detect_face_secure(face_image, face_hint, info)
+        timer.lap('detect')
+        encoding = extract_unique_features(face_image, face_box, info)
+        timer.lap('extract')
         return encoding.tolist()
     except Exception as e:
         raise Exception(f"Failed to encode face: {str(e)}")
 
-def compare_faces_secure(known_encoding, unknown_image_data, tolerance=0.4):
+def compare_faces_secure(known_encoding, unknown_image_data, tolerance=0.4, face_hint=None, info=None):
     """Compare faces with strict security - different people should have distance > 0.4"""
     try:
-        unknown_encoding = encode_face_secure(unknown_image_data)
+        info = {} if info is None else info
+        unknown_encoding = encode_face_secure(unknown_image_data, face_hint, info)
+        timer = stage_timer(info)
         
         known_array = np.array(known_encoding)
         unknown_array = np.array(unknown_encoding)
         
         # Use Euclidean distance
         distance = np.linalg.norm(known_array - unknown_array)
+        timer.lap('distance')
         
         # For security: same person typically < 0.3, different people > 0.5
         is_match = distance <= tolerance
@@ -211,7 +205,8 @@ def compare_faces_secure(known_encoding, unknown_image_data, tolerance=0.4):
         return {
             "distance": float(distance),
             "is_match": bool(is_match),
-            "tolerance": tolerance
+            "tolerance": tolerance,
+            "hint_used": info.get('hint_used', False)
         }
         
     except Exception as e:
@@ -219,54 +214,7 @@ def compare_faces_secure(known_encoding, unknown_image_data, tolerance=0.4):
 
 def main():
     """Main function to handle operations."""
-    try:
-        if len(sys.argv) > 1:
-            operation = sys.argv[1]
-            
-            if operation == "encode":
-                input_data = sys.stdin.read()
-                data = json.loads(input_data)
-                image_data = data.get('image_data', '')
-                
-                encoding = encode_face_secure(image_data)
-                
-                print(json.dumps({
-                    "success": True,
-                    "encoding": encoding
-                }))
-                
-            elif operation == "compare":
-                input_data = sys.stdin.read()
-                data = json.loads(input_data)
-                
-                known_encoding = data.get('known_encoding', [])
-                unknown_image = data.get('unknown_image', '')
-                tolerance = data.get('tolerance', 0.4)
-                
-                result = compare_faces_secure(known_encoding, unknown_image, tolerance)
-                
-                print(json.dumps({
-                    "success": True,
-                    "result": result
-                }))
-                
-            else:
-                print(json.dumps({
-                    "success": False,
-                    "error": f"Unknown operation: {operation}"
-                }))
-                
-        else:
-            print(json.dumps({
-                "success": False,
-                "error": "No operation specified"
-            }))
-            
-    except Exception as e:
-        print(json.dumps({
-            "success": False,
-            "error": str(e)
-        }))
+    run_cli('fix_face_security', sys.modules[__name__])
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
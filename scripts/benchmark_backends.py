@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Benchmark every face recognition backend in server/ stage by stage (decode, detect, extract,
+encode, compare) at several input resolutions, in-process and fully offline
+Each timed run is a real encode/compare/verify request through face_backends; the decode, detect,
+extract and distance stages are the backend's own StageTimer laps from that request. Runs that
+fail (no face detected) are kept out of the percentiles and reported as a separate series.
+Backends whose libraries are not installed (face_recognition, DeepFace) are reported as skipped
+"""
+
+import os
+import sys
+import io
+import json
+import time
+import base64
+import platform
+import argparse
+import tempfile
+import tracemalloc
+import numpy as np
+import cv2
+from PIL import Image
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, 'server'))
+
+# Keep benchmark runs out of the server's persisted detection statistics
+os.environ.setdefault('FACE_DETECTION_STATS', os.path.join(tempfile.mkdtemp(), 'face_detection_stats.json'))
+
+import face_backends
+from face_backends import BACKENDS, run_operation
+
+DEFAULT_RESOLUTIONS = [320, 640, 1280, 2560]
+
+# Operations timed per backend, in the order they run; compare needs an encoding from encode
+TIMED_OPERATIONS = ('encode', 'compare', 'verify')
+# StageTimer laps every backend records, in request order
+STAGES = ('decode', 'detect', 'extract')
+
+def load_backend(name):
+    """Import a backend module, or return (None, reason) when it is unknown or its dependencies are missing."""
+    try:
+        return face_backends.load_backend(name), None
+    except KeyError:
+        return None, "unknown backend"
+    except ImportError as e:
+        return None, f"dependency not installed ({e})"
+    except Exception as e:
+        return None, str(e)
+
+def synthetic_faces():
+    """Synthetic face images from the security test and debug scripts, as RGB PIL images."""
+    from test_security_verification import create_face_pattern_a, create_face_pattern_b
+    from debug_face_security import create_distinct_face_images
+    from test_face_verification import create_test_face_image
+
+    def from_data_url(data_url):
+        return Image.open(io.BytesIO(base64.b64decode(data_url.split(',')[1]))).convert('RGB')
+
+    distinct_1, distinct_2 = create_distinct_face_images()
+    return {
+        'pattern_a': create_face_pattern_a().convert('RGB'),
+        'pattern_b': create_face_pattern_b().convert('RGB'),
+        'distinct_1': from_data_url(distinct_1),
+        'distinct_2': from_data_url(distinct_2),
+        'verification': from_data_url(create_test_face_image())
+    }
+
+def to_upload(image, resolution, quality=90):
+    """Resize so the longest side is resolution and encode as a JPEG data URL like the camera UI."""
+    scale = resolution / float(max(image.size))
+    resized = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))), Image.BICUBIC)
+    buffer = io.BytesIO()
+    resized.save(buffer, 'JPEG', quality=quality)
+    return "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+def request_document(kind, upload, reference, known_encoding):
+    """Request document for one timed operation on upload."""
+    if kind == 'encode':
+        return {"image_data": upload}
+    if kind == 'compare':
+        return {"known_encoding": known_encoding, "unknown_image": upload}
+    return {"registered_image": reference, "captured_image": upload}
+
+def time_request(module, backend, kind, function_name, data):
+    """
+    Run one request; returns (ok, wall-clock ms, stage laps in ms, failed stage, response or exception).
+    A response with success false (a timeout) counts as failed like an exception; the time
+    after its last lap is charged to the stage it failed in (a detect that found no face).
+    """
+    info = {"timings": {}}
+    start = time.perf_counter()
+    try:
+        result = run_operation(module, kind, function_name, data, info, backend)
+        ok = result.get('success', False)
+    except Exception as e:
+        result = e
+        ok = False
+    elapsed = (time.perf_counter() - start) * 1000
+    laps = {stage: ms for stage, ms in info["timings"].items() if isinstance(ms, float)}
+    failed_in = None
+    if not ok:
+        failed_in = next((stage for stage in STAGES if stage not in laps), None)
+        if failed_in is not None:
+            laps[failed_in] = max(0.0, elapsed - sum(laps.values()))
+    return ok, elapsed, laps, failed_in, result
+
+def peak_memory_kib(fn):
+    """Peak Python/numpy allocation while running fn once (OpenCV-internal buffers are not traced)."""
+    tracemalloc.start()
+    try:
+        fn()
+    except Exception:
+        pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1024.0
+
+def _add_run(stage_samples, stage, ok, ms):
+    """Successful runs go into the percentile samples, failed ones into their own series."""
+    entry = stage_samples.setdefault(stage, {'latencies': [], 'failed': [], 'peak_kib': []})
+    entry['latencies' if ok else 'failed'].append(ms)
+    return entry
+
+def benchmark_backend(name, module, uploads, repeat, measure_memory):
+    """
+    Per-stage samples for one backend over every (resolution, image) upload: the total of each
+    operation (encode, compare, verify) plus the StageTimer laps inside it.
+    """
+    operations = [(kind, function_name) for kind, function_name in BACKENDS[name].values()
+                  if kind in TIMED_OPERATIONS]
+    operations.sort(key=lambda operation: TIMED_OPERATIONS.index(operation[0]))
+    encode_function = next((function_name for kind, function_name in operations if kind == 'encode'), None)
+
+    samples = {}
+    for resolution, images in uploads.items():
+        stage_samples = {}
+        detected = 0
+        reference = None
+        known_encoding = None
+        # Enroll the first image this backend can encode (or, for verify, find a face in)
+        for candidate in images.values():
+            if encode_function is not None:
+                ok, _, _, _, result = time_request(module, name, 'encode', encode_function, {"image_data": candidate})
+            else:
+                kind, function_name = operations[0]
+                ok, _, _, _, result = time_request(module, name, kind, function_name,
+                                                request_document(kind, candidate, candidate, None))
+            if ok:
+                reference, known_encoding = candidate, result.get('encoding')
+                break
+
+        for upload in images.values():
+            encoded = False
+            for kind, function_name in operations:
+                if kind != 'encode' and reference is None:
+                    continue
+                data = request_document(kind, upload, reference, known_encoding)
+                for _ in range(repeat):
+                    ok, elapsed, laps, failed_in, _ = time_request(module, name, kind, function_name, data)
+                    entry = _add_run(stage_samples, kind, ok, elapsed)
+                    for stage, ms in laps.items():
+                        # Laps of a verify cover both images; keep the stages of each operation apart
+                        _add_run(stage_samples, stage if kind == 'encode' else f"{kind}.{stage}",
+                                 stage != failed_in, ms)
+                    encoded = encoded or (ok and kind == 'encode')
+                    # One traced run per resolution, on the first image the operation succeeds for:
+                    # tracemalloc slows pure-Python loops severalfold
+                    if measure_memory and ok and not entry['peak_kib']:
+                        entry['peak_kib'].append(peak_memory_kib(
+                            lambda: run_operation(module, kind, function_name, data, {}, name)))
+            detected += encoded
+
+        samples[resolution] = (stage_samples, detected, len(images))
+    return samples
+
+def _percentiles(latencies):
+    if not latencies:
+        return None, None, None
+    return (float(np.percentile(latencies, 50)), float(np.percentile(latencies, 95)),
+            float(np.mean(latencies)))
+
+def _stage_order(stage):
+    """Operations in TIMED_OPERATIONS order, each followed by its laps in request order."""
+    kind, _, lap = stage.rpartition('.')
+    if not kind:
+        kind, lap = ('encode', stage) if stage not in TIMED_OPERATIONS else (stage, '')
+    lap_order = STAGES.index(lap) if lap in STAGES else len(STAGES) + (lap == '')
+    return TIMED_OPERATIONS.index(kind), lap_order, lap
+
+def summarize(name, samples):
+    """
+    Flatten samples into JSON rows: p50/p95/mean over the successful runs, errors as the number
+    of failed runs and failed_p50_ms for how long those took.
+    """
+    rows = []
+    for resolution, (stage_samples, detected, image_count) in samples.items():
+        for stage in sorted(stage_samples, key=_stage_order):
+            entry = stage_samples[stage]
+            p50, p95, mean = _percentiles(entry['latencies'])
+            failed_p50 = _percentiles(entry['failed'])[0]
+            rows.append({
+                "backend": name,
+                "resolution": resolution,
+                "stage": stage,
+                "p50_ms": p50,
+                "p95_ms": p95,
+                "mean_ms": mean,
+                "peak_kib": float(max(entry['peak_kib'])) if entry['peak_kib'] else None,
+                "runs": len(entry['latencies']),
+                "errors": len(entry['failed']),
+                "failed_p50_ms": failed_p50,
+                "detected": detected if stage in ('encode', 'verify') else None,
+                "images": image_count
+            })
+    return rows
+
+def print_comparison(rows, baseline_path):
+    """Print p50 change against a previous JSON run."""
+    with open(baseline_path) as f:
+        baseline = {(r['backend'], r['resolution'], r['stage']): r for r in json.load(f)['results']}
+
+    print(f"\n{'backend':<30} {'res':>5} {'stage':<16} {'base p50':>9} {'p50':>9} {'change':>8}")
+    for row in rows:
+        before = baseline.get((row['backend'], row['resolution'], row['stage']))
+        if before is None or not before['p50_ms'] or row['p50_ms'] is None:
+            continue
+        change = (row['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100
+        print(f"{row['backend']:<30} {row['resolution']:>5} {row['stage']:<16} "
+              f"{before['p50_ms']:>9.2f} {row['p50_ms']:>9.2f} {change:>+7.1f}%")
+
+def main():
+    """Run the backend benchmark and print a table plus optional JSON."""
+    parser = argparse.ArgumentParser(description="Benchmark face recognition backends stage by stage")
+    parser.add_argument('--backends', nargs='*', help="Backend module names (default: all)")
+    parser.add_argument('--resolutions', nargs='*', type=int, default=DEFAULT_RESOLUTIONS,
+                        help="Longest image side of the uploads to test")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per image and operation")
+    parser.add_argument('--no-memory', action='store_true', help="Skip the tracemalloc pass")
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    parser.add_argument('--baseline', help="Previous JSON output to compare p50 latencies against")
+    args = parser.parse_args()
+
+    faces = synthetic_faces()
+    uploads = {resolution: {name: to_upload(image, resolution) for name, image in faces.items()}
+               for resolution in args.resolutions}
+
+    results = []
+    skipped = {}
+    print(f"{'backend':<30} {'res':>5} {'stage':<16} {'p50 ms':>9} {'p95 ms':>9} {'peak KiB':>9} {'failed':>7}")
+    for name in args.backends or list(BACKENDS):
+        module, reason = load_backend(name)
+        if module is None:
+            skipped[name] = reason
+            print(f"{name:<30} skipped: {reason}")
+            continue
+
+        rows = summarize(name, benchmark_backend(name, module, uploads, args.repeat, not args.no_memory))
+        results.extend(rows)
+        for row in rows:
+            p50, p95, peak = (f"{row[key]:>9.{digits}f}" if row[key] is not None else f"{'-':>9}"
+                              for key, digits in (('p50_ms', 2), ('p95_ms', 2), ('peak_kib', 0)))
+            print(f"{name:<30} {row['resolution']:>5} {row['stage']:<16} {p50} {p95} {peak} "
+                  f"{row['errors']:>3}/{row['runs'] + row['errors']:<3}")
+
+    if args.baseline:
+        print_comparison(results, args.baseline)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                "environment": {
+                    "python": platform.python_version(),
+                    "numpy": np.__version__,
+                    "opencv": cv2.__version__,
+                    "cpu_count": os.cpu_count()
+                },
+                "config": {"resolutions": args.resolutions, "repeat": args.repeat, "images": sorted(faces)},
+                "results": results,
+                "skipped": skipped
+            }, f, indent=2)
+
+if __name__ == "__main__":
+    main()
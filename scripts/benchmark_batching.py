@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Benchmark micro-batched Facenet inference under synthetic concurrent verifies
+Client threads play clock-ins: each request spends a jittered preparation time (decode, detection
+and alignment release the GIL, here a sleep), then needs embeddings of two 160x160 crops. Batch-1
+forward passes per request (window 0) are compared with the MicroBatcher at each window: throughput,
+p50/p99 latency and the p99 added over batch-1. --model facenet runs the real DeepFace Facenet;
+the synthetic model is a two-layer numpy network plus a fixed per-call dispatch cost, spent in
+Python like Keras' own call overhead (it holds the GIL, so concurrent batch-1 calls do not overlap).
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import threading
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'server'))
+
+from micro_batching import MicroBatcher
+
+INPUT_SIZE = (160, 160)
+
+def synthetic_model(dispatch_ms, seed=0):
+    """forward(batch) of a pooled 4800 -> 1024 -> 128 network, paying dispatch_ms of Python once per call."""
+    rng = np.random.default_rng(seed)
+    first = rng.standard_normal((40 * 40 * 3, 1024)).astype(np.float32) / 70
+    second = rng.standard_normal((1024, 128)).astype(np.float32) / 32
+
+    def forward(batch):
+        end = time.perf_counter() + dispatch_ms / 1000
+        while time.perf_counter() < end:
+            pass
+        pooled = batch.reshape(len(batch), 40, 4, 40, 4, 3).mean(axis=(2, 4)).reshape(len(batch), -1)
+        return np.tanh(pooled @ first) @ second
+    return forward
+
+def facenet_model():
+    """forward(batch) of DeepFace's Facenet, or None when DeepFace is not installed."""
+    try:
+        from facenet_batching import facenet_forward
+        facenet_forward(np.zeros((1,) + INPUT_SIZE + (3,), dtype=np.float32))
+        return facenet_forward
+    except ImportError:
+        return None
+
+def run_load(forward, concurrency, requests, window_ms, max_batch, prepare_ms, seed=0):
+    """Closed-loop load from `concurrency` clients; returns (seconds, latencies in ms, batcher stats)."""
+    batcher = MicroBatcher(forward, window_ms, max_batch) if window_ms > 0 else None
+    crops = np.random.default_rng(seed).random((2,) + INPUT_SIZE + (3,), dtype=np.float32)
+    latencies = []
+    remaining = [requests]
+    lock = threading.Lock()
+
+    def client(index):
+        jitter = random.Random(seed + index)
+        while True:
+            with lock:
+                if remaining[0] == 0:
+                    return
+                remaining[0] -= 1
+            start = time.perf_counter()
+            if batcher is None:
+                time.sleep(prepare_ms * jitter.uniform(0.5, 1.5) / 1000)
+                forward(crops)
+            else:
+                with batcher.reserve() as slot:
+                    time.sleep(prepare_ms * jitter.uniform(0.5, 1.5) / 1000)
+                    slot.submit(crops)
+            with lock:
+                latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    clients = [threading.Thread(target=client, args=(index,)) for index in range(concurrency)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    seconds = time.perf_counter() - start
+    return seconds, latencies, batcher.stats() if batcher else {"mean_batch_rows": 2.0}
+
+def main():
+    """Run the batching benchmark and print a table plus optional JSON."""
+    parser = argparse.ArgumentParser(description="Micro-batched Facenet: throughput against added p99 latency")
+    parser.add_argument('--model', choices=['synthetic', 'facenet'], default='synthetic')
+    parser.add_argument('--dispatch-ms', type=float, default=2.0,
+                        help="Per-call cost of the synthetic model (framework dispatch)")
+    parser.add_argument('--concurrency', nargs='*', type=int, default=[1, 4, 8, 16], help="Concurrent clients")
+    parser.add_argument('--windows', nargs='*', type=float, default=[5, 10, 20], help="Batch windows in ms")
+    parser.add_argument('--max-batch', type=int, default=16, help="Most crops per forward pass")
+    parser.add_argument('--prepare-ms', type=float, default=15.0, help="Mean decode/detect/align time per request")
+    parser.add_argument('--requests', type=int, default=400, help="Requests per configuration")
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    forward = facenet_model() if args.model == 'facenet' else synthetic_model(args.dispatch_ms)
+    if forward is None:
+        raise Exception("DeepFace is not installed; use --model synthetic")
+
+    rows = []
+    print(f"{'clients':>7} {'window ms':>9} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'+p99 ms':>8} {'crops/pass':>10}")
+    for concurrency in args.concurrency:
+        baseline = None
+        for window in [0] + args.windows:
+            seconds, latencies, stats = run_load(forward, concurrency, args.requests, window, args.max_batch,
+                                                 args.prepare_ms)
+            row = {
+                "concurrency": concurrency,
+                "window_ms": window,
+                "requests_per_second": round(args.requests / seconds, 2),
+                "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+                "p99_ms": round(float(np.percentile(latencies, 99)), 2),
+                "mean_batch_rows": stats["mean_batch_rows"]
+            }
+            baseline = baseline or row
+            row["added_p99_ms"] = round(row["p99_ms"] - baseline["p99_ms"], 2)
+            row["throughput_gain"] = round(row["requests_per_second"] / baseline["requests_per_second"], 3)
+            rows.append(row)
+            print(f"{concurrency:>7} {window:>9g} {row['requests_per_second']:>8.1f} {row['p50_ms']:>8.1f} "
+                  f"{row['p99_ms']:>8.1f} {row['added_p99_ms']:>8.1f} {row['mean_batch_rows']:>10.1f}", flush=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                "environment": {"python": platform.python_version(), "numpy": np.__version__,
+                                "cpu_count": os.cpu_count()},
+                "config": {"model": args.model, "dispatch_ms": args.dispatch_ms, "max_batch": args.max_batch,
+                           "prepare_ms": args.prepare_ms, "requests": args.requests},
+                "results": rows
+            }, f, indent=2)
+
+if __name__ == "__main__":
+    main()
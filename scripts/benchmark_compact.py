@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Benchmark compact descriptors against the full encodings of the handcrafted backends
+Fits the projection on half of each person's photos and reports, on the other half, the
+descriptor size (values and JSON bytes), the per-compare cost once the image is encoded
+(decoding the stored JSON encoding plus the distance) and the accuracy delta (HTER at the
+default tolerance and EER)
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from evaluate_backends import (BACKENDS, load_labelled_folder, synthetic_identities, distance_matrix, euclidean_matrix,
+                               default_tolerance, genuine_impostor, error_rates, equal_error_rate)
+from benchmark_backends import load_backend
+from train_compact_projection import encode_dataset
+from face_compact import COMPACT_BACKENDS, COMPACT_DIMS, PROJECTION_METHODS, fit_projection
+
+def split_by_person(labels):
+    """Alternate each person's photos between the training and the test half."""
+    seen = {}
+    train, test = [], []
+    for index, person in enumerate(labels):
+        (train if seen.get(person, 0) % 2 == 0 else test).append(index)
+        seen[person] = seen.get(person, 0) + 1
+    return np.array(train), np.array(test)
+
+def accuracy(distances, labels, tolerance):
+    """HTER at a tolerance and EER of an all-pairs distance matrix."""
+    genuine, impostor = genuine_impostor(distances, labels)
+    far, frr = error_rates(genuine, impostor, tolerance)
+    eer, _ = equal_error_rate(genuine, impostor)
+    return {"far": far, "frr": frr, "hter": (far + frr) / 2 if far is not None and frr is not None else None,
+            "eer": eer}
+
+def compare_ms(stored, probes, distance, repeat):
+    """Mean ms to decode a stored JSON encoding and compute its distance to an encoded probe."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for known_json, probe in zip(stored, probes):
+            distance(np.asarray(json.loads(known_json), dtype=np.float64), probe)
+    return (time.perf_counter() - start) * 1000 / (repeat * len(probes))
+
+def benchmark_backend(name, images, dims, method, repeat):
+    """Full against compact descriptors of one backend on the held-out photos."""
+    module, _ = load_backend(name)
+    spec = BACKENDS[name]
+    labels, encodings, failures = encode_dataset(name, images)
+    train, test = split_by_person(labels)
+    test_labels = [labels[index] for index in test]
+
+    start = time.perf_counter()
+    projection = fit_projection(encodings[train], [labels[index] for index in train], dims, method)
+    fit_seconds = time.perf_counter() - start
+    full = encodings[test]
+    compact = projection.project(full)
+
+    full_json = [json.dumps(encoding.tolist()) for encoding in full]
+    compact_json = [json.dumps(encoding.tolist()) for encoding in compact]
+    probes = np.roll(np.arange(len(test)), 1)
+    full_ms = compare_ms(full_json, full[probes], lambda a, b: distance_matrix(spec['distance'], np.vstack([a, b]))[0, 1],
+                         repeat)
+    compact_ms = compare_ms(compact_json, compact[probes], lambda a, b: np.linalg.norm(a - b), repeat)
+
+    return {
+        "backend": name,
+        "method": method,
+        "train_images": len(train),
+        "test_images": len(test),
+        "failed_to_encode": len(failures),
+        "fit_seconds": round(fit_seconds, 3),
+        "full": dict(accuracy(distance_matrix(spec['distance'], full), test_labels, default_tolerance(module, spec)),
+                     dims=projection.source_dims, json_bytes=float(np.mean([len(s) for s in full_json])),
+                     compare_ms=full_ms),
+        "compact": dict(accuracy(euclidean_matrix(compact), test_labels, projection.tolerance),
+                        dims=projection.dims, json_bytes=float(np.mean([len(s) for s in compact_json])),
+                        compare_ms=compact_ms, tolerance=projection.tolerance),
+        "projection_kib": round((projection.source_dims + 1) * projection.dims * 4 / 1024, 1)
+    }
+
+def _format(value, spec):
+    return format(value, spec) if value is not None else '-'
+
+def main():
+    """Run the compact descriptor benchmark and print a table plus optional JSON."""
+    parser = argparse.ArgumentParser(description="Compact descriptors against full encodings: size, compare cost, accuracy")
+    parser.add_argument('--images', help="Labelled folder with one subfolder of images per person "
+                                         "(default: augmented synthetic faces)")
+    parser.add_argument('--variants', type=int, default=40, help="Augmented photos per synthetic face")
+    parser.add_argument('--backends', nargs='*', default=list(COMPACT_BACKENDS), choices=COMPACT_BACKENDS)
+    parser.add_argument('--dims', type=int, default=COMPACT_DIMS, help="Compact descriptor size")
+    parser.add_argument('--method', choices=PROJECTION_METHODS, default='lda')
+    parser.add_argument('--repeat', type=int, default=20, help="Timed passes over the compare pairs")
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    images = load_labelled_folder(args.images) if args.images else synthetic_identities(args.variants)
+    print(f"{len(images)} images of {len({person for person, _, _ in images})} people")
+
+    rows = []
+    for name in args.backends:
+        print(f"{name:<30} encoding...", flush=True)
+        rows.append(benchmark_backend(name, images, args.dims, args.method, args.repeat))
+
+    print(f"\n{'backend':<30} {'mode':<8} {'dims':>5} {'JSON B':>8} {'cmp ms':>7} {'HTER':>7} {'EER':>7}")
+    for row in rows:
+        for mode in ('full', 'compact'):
+            entry = row[mode]
+            print(f"{row['backend']:<30} {mode:<8} {entry['dims']:>5} {entry['json_bytes']:>8.0f} "
+                  f"{entry['compare_ms']:>7.3f} {_format(entry['hter'], '7.3f'):>7} {_format(entry['eer'], '7.3f'):>7}")
+        print(f"{'':<30} {'delta':<8} {'':>5} {row['compact']['json_bytes'] / row['full']['json_bytes']:>7.1%} "
+              f"{row['full']['compare_ms'] / row['compact']['compare_ms']:>6.1f}x "
+              f"{_format(row['compact']['hter'] - row['full']['hter'], '+7.3f'):>7} "
+              f"{_format(row['compact']['eer'] - row['full']['eer'], '+7.3f'):>7}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                "environment": {"python": platform.python_version(), "numpy": np.__version__,
+                                "cpu_count": os.cpu_count()},
+                "config": {"source": args.images or "synthetic", "images": len(images), "dims": args.dims,
+                           "method": args.method},
+                "results": rows
+            }, f, indent=2)
+
+if __name__ == "__main__":
+    main()
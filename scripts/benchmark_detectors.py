@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark latency and recall of every available face detector in server/face_detectors.py
+Runs fully offline: uses images from --images (one face per image) or the synthetic test faces
+"""
+
+import os
+import sys
+import io
+import json
+import base64
+import time
+import argparse
+import numpy as np
+from PIL import Image
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, 'server'))
+
+from face_detectors import available_detectors, get_detector
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+def load_synthetic_faces():
+    """Synthetic face images used by the security test scripts."""
+    from test_security_verification import create_face_pattern_a, create_face_pattern_b
+    from test_face_upload import create_test_face_image
+
+    upload_data = create_test_face_image().split(',')[1]
+    upload_face = Image.open(io.BytesIO(base64.b64decode(upload_data))).convert('RGB')
+
+    return {
+        'pattern_a': np.array(create_face_pattern_a()),
+        'pattern_b': np.array(create_face_pattern_b()),
+        'upload_face': np.array(upload_face)
+    }
+
+def load_image_folder(folder):
+    """Load every image in a folder (recursively) as RGB arrays."""
+    images = {}
+    for dirpath, _, filenames in os.walk(folder):
+        for filename in sorted(filenames):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                path = os.path.join(dirpath, filename)
+                images[os.path.relpath(path, folder)] = np.array(Image.open(path).convert('RGB'))
+    return images
+
+def benchmark_detector(name, images, repeat):
+    """Time a detector over every image and count images with at least one detection."""
+    load_start = time.perf_counter()
+    detector = get_detector(name)
+    load_ms = (time.perf_counter() - load_start) * 1000
+
+    latencies = []
+    detected = 0
+    for image in images.values():
+        boxes = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            boxes, _ = detector.detect(image)
+            latencies.append((time.perf_counter() - start) * 1000)
+        if len(boxes) > 0:
+            detected += 1
+
+    return {
+        "detector": name,
+        "load_ms": load_ms,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "mean_ms": float(np.mean(latencies)),
+        "recall": detected / len(images) if images else 0.0,
+        "images": len(images)
+    }
+
+def main():
+    """Run the detector benchmark and print a table plus optional JSON."""
+    parser = argparse.ArgumentParser(description="Benchmark face detectors")
+    parser.add_argument('--images', help="Folder of images that each contain one face")
+    parser.add_argument('--detectors', nargs='*', help="Detector names (default: all available)")
+    parser.add_argument('--repeat', type=int, default=5, help="Timed runs per image")
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    images = load_image_folder(args.images) if args.images else load_synthetic_faces()
+    if not images:
+        print("No images found")
+        sys.exit(1)
+
+    names = args.detectors or available_detectors()
+    results = []
+
+    print(f"{'detector':<14} {'load ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'recall':>8}")
+    for name in names:
+        try:
+            result = benchmark_detector(name, images, args.repeat)
+        except Exception as e:
+            print(f"{name:<14} skipped: {e}")
+            continue
+        results.append(result)
+        print(f"{name:<14} {result['load_ms']:>9.1f} {result['p50_ms']:>9.2f} "
+              f"{result['p95_ms']:>9.2f} {result['recall']:>8.2f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"images": len(images), "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
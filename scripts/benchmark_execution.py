@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Benchmark the face service's execution modes: worker threads against worker processes
+For each backend and worker count, starts the service in each mode, drives it with concurrent
+compare (or verify) requests and reports throughput, latency and the resident memory of the
+service plus its worker processes. A backend should run on threads where they come close to
+processes: they share one copy of every model, which matters on memory-constrained kiosks.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from soak_test import ROOT_DIR, post, build_requests
+from evaluate_backends import synthetic_identities
+from benchmark_backends import load_backend
+from face_backends import BACKENDS
+from service_metrics import process_rss_bytes
+from worker_pool import EXECUTION_MODES
+
+def start_service(mode, workers, backend, cv_threads=None):
+    """face_service.py in the given mode on a free port, the backend preloaded and the cache off."""
+    env = dict(os.environ, FACE_SERVICE_PORT='0', FACE_SERVICE_EXECUTION=mode, FACE_SERVICE_WORKERS=str(workers),
+               FACE_SERVICE_PRELOAD=backend, FACE_EMBEDDING_CACHE_SIZE='0')
+    if cv_threads is not None:
+        env['FACE_CV_THREADS'] = str(cv_threads)
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT_DIR, 'server', 'face_service.py')],
+                               stdout=subprocess.PIPE, env=env, text=True)
+    line = process.stdout.readline()
+    if not line:
+        raise Exception(f"Face service exited with code {process.wait()}")
+    return process, json.loads(line)['listening']
+
+def service_rss_bytes(process, base_url):
+    """RSS of the service and its worker processes (from /health)."""
+    with urllib.request.urlopen(base_url + '/health') as response:
+        health = json.loads(response.read())
+    return process_rss_bytes(process.pid) + sum(process_rss_bytes(pid) for pid in health['worker_pids'])
+
+def drive(base_url, path, bodies, requests, concurrency):
+    """Send requests from `concurrency` client threads; returns (seconds, per-request ms, failures)."""
+    def send(index):
+        start = time.perf_counter()
+        response = post(base_url, path, bodies[index % len(bodies)])
+        return (time.perf_counter() - start) * 1000, not response.get('success')
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as clients:
+        results = list(clients.map(send, range(requests)))
+    return time.perf_counter() - start, [ms for ms, _ in results], sum(failed for _, failed in results)
+
+def benchmark_mode(backend, mode, workers, requests, images, cv_threads=None):
+    """Throughput, latency and memory of one backend in one mode."""
+    process, base_url = start_service(mode, workers, backend, cv_threads)
+    try:
+        operation = 'compare' if 'compare' in BACKENDS[backend] else 'verify'
+        bodies = build_requests(base_url, backend, operation, images)
+        path = f'/{backend}/{operation}'
+        # Warm-up: every worker has seen a request (detectors, allocator pools, first-call costs)
+        drive(base_url, path, bodies, workers * 2, workers)
+        seconds, latencies, failures = drive(base_url, path, bodies, requests, workers * 2)
+        rss = service_rss_bytes(process, base_url)
+    finally:
+        process.terminate()
+        process.wait()
+
+    return {
+        "backend": backend,
+        "operation": operation,
+        "mode": mode,
+        "workers": workers,
+        "requests": requests,
+        "failed_requests": failures,
+        "requests_per_second": round(requests / seconds, 2),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+        "rss_mib": round(rss / 2**20, 1)
+    }
+
+def recommend(rows, threshold):
+    """Per backend and worker count: threads unless processes beat them by more than the threshold."""
+    recommendations = {}
+    for row in rows:
+        if row['mode'] != 'threads':
+            continue
+        other = next((candidate for candidate in rows if candidate['mode'] == 'processes'
+                      and candidate['backend'] == row['backend'] and candidate['workers'] == row['workers']), None)
+        if other is None:
+            continue
+        ratio = row['requests_per_second'] / other['requests_per_second']
+        recommendations[f"{row['backend']}@{row['workers']}"] = {
+            "mode": 'threads' if ratio >= threshold else 'processes',
+            "throughput_ratio": round(ratio, 3),
+            "memory_ratio": round(row['rss_mib'] / other['rss_mib'], 3)
+        }
+    return recommendations
+
+def main():
+    """Run the execution mode benchmark and print a table plus optional JSON."""
+    parser = argparse.ArgumentParser(description="Face service throughput and memory: worker threads vs processes")
+    parser.add_argument('--backends', nargs='*', help="Backend module names (default: every importable backend)")
+    parser.add_argument('--modes', nargs='*', choices=EXECUTION_MODES, default=list(EXECUTION_MODES))
+    parser.add_argument('--workers', nargs='*', type=int, default=[os.cpu_count() or 1], help="Worker counts to test")
+    parser.add_argument('--requests', type=int, default=100, help="Timed requests per backend, mode and worker count")
+    parser.add_argument('--cv-threads', type=int, help="FACE_CV_THREADS for the service (default: CPUs / workers)")
+    parser.add_argument('--threshold', type=float, default=0.9,
+                        help="Recommend threads when they reach this fraction of the processes' throughput")
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    images = synthetic_identities()
+    rows = []
+    skipped = {}
+    print(f"{'backend':<30} {'mode':<10} {'workers':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'RSS MiB':>8} {'fail':>5}")
+    for backend in args.backends or list(BACKENDS):
+        module, reason = load_backend(backend)
+        if module is None:
+            skipped[backend] = reason
+            print(f"{backend:<30} skipped: {reason}")
+            continue
+        for workers in args.workers:
+            for mode in args.modes:
+                row = benchmark_mode(backend, mode, workers, args.requests, images, args.cv_threads)
+                rows.append(row)
+                print(f"{backend:<30} {mode:<10} {workers:>7} {row['requests_per_second']:>8.2f} "
+                      f"{row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} {row['rss_mib']:>8.1f} {row['failed_requests']:>5}",
+                      flush=True)
+
+    recommendations = recommend(rows, args.threshold)
+    if recommendations:
+        print(f"\n{'backend@workers':<34} {'use':<10} {'threads/processes req/s':>24} {'RSS':>8}")
+        for key, entry in recommendations.items():
+            print(f"{key:<34} {entry['mode']:<10} {entry['throughput_ratio']:>24.2f} {entry['memory_ratio']:>8.2f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                "environment": {"python": platform.python_version(), "numpy": np.__version__,
+                                "cpu_count": os.cpu_count()},
+                "config": {"requests": args.requests, "workers": args.workers, "cv_threads": args.cv_threads,
+                           "threshold": args.threshold},
+                "results": rows,
+                "recommendations": recommendations,
+                "skipped": skipped
+            }, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Benchmark two-stage identification (PCA shortlist + exact re-ranking) against a brute-force scan
+on a synthetic gallery: recall at k of the exact top-k, identity hit rate and per-probe speedup
+Encodings are generated with a low-rank identity structure plus per-capture noise, like real
+face features whose variance concentrates in a few dozen directions
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'server'))
+
+from face_search import TwoStageSearch
+
+def synthetic_gallery(people, dims, rank=48, noise=0.3, seed=0, chunk=10000):
+    """
+    One L2-normalized float32 encoding per person, plus what a new capture needs: the identity
+    latents and the latent-to-encoding map. Latent variance decays with the component index.
+    """
+    rng = np.random.default_rng(seed)
+    latents = (rng.standard_normal((people, rank)) / np.sqrt(1 + np.arange(rank) / 8)).astype(np.float32)
+    mixing = rng.standard_normal((rank, dims)).astype(np.float32) / np.sqrt(rank)
+    gallery = np.empty((people, dims), dtype=np.float32)
+    for start in range(0, people, chunk):
+        gallery[start:start + chunk] = capture(latents[start:start + chunk], mixing, noise, rng)
+    return gallery, latents, mixing
+
+def capture(latents, mixing, noise, rng, appearance=0.1):
+    """New captures of the given people: small identity perturbation plus sensor noise, normalized."""
+    latents = latents + appearance * rng.standard_normal(latents.shape).astype(np.float32)
+    encodings = latents @ mixing
+    encodings += noise * rng.standard_normal(encodings.shape).astype(np.float32) / np.sqrt(mixing.shape[1])
+    encodings /= np.linalg.norm(encodings, axis=1, keepdims=True)
+    return encodings
+
+def time_per_probe(search, probes):
+    """Results and mean milliseconds per probe."""
+    start = time.perf_counter()
+    results = [search(probe) for probe in probes]
+    return results, (time.perf_counter() - start) * 1000 / len(probes)
+
+def main():
+    """Run the search benchmark and print a table plus optional JSON."""
+    parser = argparse.ArgumentParser(description="Benchmark PCA-shortlist identification against brute force")
+    parser.add_argument('--gallery', type=int, default=100000, help="Gallery size (one encoding per person)")
+    parser.add_argument('--dims', type=int, default=1024,
+                        help="Encoding dimensions (face_recognition_service ~700-1.1k, reliable ~9k)")
+    parser.add_argument('--pca-dims', nargs='*', type=int, default=[32, 64], help="Compact dimensions to test")
+    parser.add_argument('--shortlist', nargs='*', type=int, default=[50, 100, 200],
+                        help="Candidates re-ranked exactly per probe")
+    parser.add_argument('--k', type=int, default=10, help="Neighbours returned per probe")
+    parser.add_argument('--probes', type=int, default=200, help="Probe captures of random gallery people")
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    start = time.perf_counter()
+    gallery, latents, mixing = synthetic_gallery(args.gallery, args.dims)
+    people = rng.choice(args.gallery, args.probes, replace=False)
+    probes = capture(latents[people], mixing, 0.3, rng)
+    print(f"Gallery {args.gallery} x {args.dims} ({gallery.nbytes / 2**20:.0f} MiB) "
+          f"built in {time.perf_counter() - start:.1f}s, {args.probes} probes, k={args.k}")
+
+    index = None
+    rows = []
+    for pca_dims in args.pca_dims:
+        start = time.perf_counter()
+        index = TwoStageSearch.fit(gallery, dims=pca_dims)
+        fit_seconds = time.perf_counter() - start
+        if not rows:
+            exact, brute_ms = time_per_probe(lambda probe: index.brute_force(probe, args.k), probes)
+            exact_sets = [set(indices.tolist()) for indices, _ in exact]
+            brute_hits = np.mean([indices[0] == person for (indices, _), person in zip(exact, people)])
+            print(f"{'brute force':<24} {brute_ms:>9.2f} ms/probe  hit@1 {brute_hits:.3f}")
+
+        for shortlist in args.shortlist:
+            found, two_stage_ms = time_per_probe(lambda probe: index.search(probe, args.k, shortlist), probes)
+            recall = np.mean([len(exact_set & set(indices.tolist())) / len(exact_set)
+                              for exact_set, (indices, _) in zip(exact_sets, found)])
+            hits = np.mean([indices[0] == person for (indices, _), person in zip(found, people)])
+            row = {
+                "pca_dims": pca_dims,
+                "shortlist": shortlist,
+                "fit_seconds": round(fit_seconds, 2),
+                "compact_mib": round(index.projected.nbytes / 2**20, 1),
+                "ms_per_probe": round(two_stage_ms, 3),
+                "brute_force_ms_per_probe": round(brute_ms, 3),
+                "speedup": round(brute_ms / two_stage_ms, 2),
+                f"recall_at_{args.k}": round(float(recall), 4),
+                "hit_at_1": round(float(hits), 4)
+            }
+            rows.append(row)
+            print(f"pca {pca_dims:>3} shortlist {shortlist:>4}   {two_stage_ms:>9.2f} ms/probe  "
+                  f"speedup {row['speedup']:>6.1f}x  recall@{args.k} {recall:.3f}  hit@1 {hits:.3f}  "
+                  f"(fit {fit_seconds:.1f}s, {row['compact_mib']} MiB compact)")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                "environment": {"python": platform.python_version(), "numpy": np.__version__,
+                                "cpu_count": os.cpu_count()},
+                "config": {"gallery": args.gallery, "dims": args.dims, "k": args.k, "probes": args.probes},
+                "brute_force": {"ms_per_probe": round(brute_ms, 3), "hit_at_1": round(float(brute_hits), 4)},
+                "results": rows
+            }, f, indent=2)
+
+if __name__ == "__main__":
+    main()
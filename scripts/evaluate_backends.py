@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Evaluate speed against accuracy for every face recognition backend in server/
+Encodes a labelled image folder (one subfolder per person), computes genuine/impostor distance
+distributions from one all-pairs distance matrix per backend, reports FAR/FRR at each backend's
+default tolerance and encode throughput, and marks the Pareto-optimal backends
+"""
+
+import os
+import sys
+import io
+import json
+import time
+import inspect
+import platform
+import argparse
+import numpy as np
+import cv2
+from PIL import Image, ImageEnhance, ImageFilter
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from benchmark_backends import load_backend, synthetic_faces
+from image_io import decode_image
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+def _simple_deepface_encode(module, image_data):
+    """simple_deepface_verification has no encode op; its verify extracts these features from both images."""
+    image = module.process_image_from_base64(image_data)
+    return module.extract_face_features_deepface_style(image, module.detect_face_opencv(image))
+
+def _deepface_encode(module, image_data):
+    """Facenet embedding with the detector actual_deepface.py verifies with (DeepFace expects BGR)."""
+    bgr = np.ascontiguousarray(decode_image(image_data)[:, :, ::-1])
+    return module.DeepFace.represent(img_path=bgr, model_name='Facenet', detector_backend='opencv')[0]['embedding']
+
+# Backend module -> encode function and the distance its compare/verify op applies.
+# The tolerance is read from the compare function's default unless given here.
+BACKENDS = {
+    'simple_face_recognition': {'encode': 'encode_face', 'compare': 'compare_faces_simple', 'distance': 'euclidean'},
+    'reliable_face_recognition': {'encode': 'encode_face', 'compare': 'compare_faces_reliable', 'distance': 'euclidean'},
+    'secure_face_recognition': {
+        'encode': 'encode_face_ultra_secure', 'compare': 'compare_faces_ultra_secure', 'distance': 'secure'
+    },
+    'fix_face_security': {'encode': 'encode_face_secure', 'compare': 'compare_faces_secure', 'distance': 'euclidean'},
+    'face_recognition_service': {'encode': 'generate_face_encoding', 'compare': 'compare_faces', 'distance': 'service'},
+    'proper_face_recognition': {'encode': 'encode_face', 'compare': 'compare_faces_proper', 'distance': 'euclidean'},
+    'simple_deepface_verification': {'encode': _simple_deepface_encode, 'distance': 'scaled_euclidean', 'tolerance': 0.4},
+    # Facenet cosine threshold DeepFace.verify applies by default
+    'actual_deepface': {'encode': _deepface_encode, 'distance': 'cosine', 'tolerance': 0.4},
+}
+
+def euclidean_matrix(encodings):
+    """All-pairs Euclidean distances from the Gram matrix."""
+    squared = np.einsum('ij,ij->i', encodings, encodings)
+    distances = squared[:, None] + squared[None, :] - 2.0 * (encodings @ encodings.T)
+    return np.sqrt(np.maximum(distances, 0.0))
+
+def cosine_matrix(encodings):
+    """All-pairs cosine distances."""
+    norms = np.linalg.norm(encodings, axis=1)
+    return 1.0 - (encodings @ encodings.T) / (norms[:, None] * norms[None, :] + 1e-7)
+
+def manhattan_matrix(encodings, block=64):
+    """All-pairs L1 distances, broadcast a block of rows at a time to bound memory."""
+    distances = np.empty((len(encodings), len(encodings)))
+    for start in range(0, len(encodings), block):
+        rows = encodings[start:start + block]
+        distances[start:start + block] = np.abs(rows[:, None, :] - encodings[None, :, :]).sum(axis=2)
+    return distances
+
+def distance_matrix(kind, encodings):
+    """Vectorized equivalent of each backend's pairwise distance."""
+    if kind == 'euclidean':
+        return euclidean_matrix(encodings)
+    if kind == 'scaled_euclidean':
+        # simple_deepface_verification scales to DeepFace's Facenet range
+        return euclidean_matrix(encodings) * 2.0
+    if kind == 'cosine':
+        return cosine_matrix(encodings)
+    if kind == 'secure':
+        # compare_faces_ultra_secure's weighted Euclidean/cosine/Manhattan combination
+        return (0.5 * euclidean_matrix(encodings) + 0.3 * cosine_matrix(encodings)
+                + 0.2 * manhattan_matrix(encodings) / encodings.shape[1])
+    if kind == 'service':
+        # calculate_face_distance: calibrated Euclidean, different encodings floored near 0.6
+        calibrated = euclidean_matrix(encodings) * 0.85
+        _, identity = np.unique(encodings, axis=0, return_inverse=True)
+        identity = identity.reshape(-1)
+        different = identity[:, None] != identity[None, :]
+        floored = (calibrated < 0.55) & different
+        return np.where(floored, 0.6 + calibrated * 0.1, calibrated)
+    raise Exception(f"Unknown distance: {kind}")
+
+def default_tolerance(module, spec):
+    """Tolerance the backend's compare op uses when the request does not set one."""
+    if 'tolerance' in spec:
+        return spec['tolerance']
+    return inspect.signature(getattr(module, spec['compare'])).parameters['tolerance'].default
+
+def load_labelled_folder(folder):
+    """Raw file bytes of every image, labelled by the name of its person subfolder."""
+    images = []
+    for person in sorted(os.listdir(folder)):
+        person_dir = os.path.join(folder, person)
+        if not os.path.isdir(person_dir):
+            continue
+        for filename in sorted(os.listdir(person_dir)):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                with open(os.path.join(person_dir, filename), 'rb') as f:
+                    images.append((person, filename, f.read()))
+    return images
+
+def synthetic_identities(variants=4, seed=0):
+    """
+    Offline stand-in for a labelled folder: each synthetic face is one person, photographed
+    several times with different brightness, rotation, framing and blur.
+    """
+    rng = np.random.default_rng(seed)
+    images = []
+    for person, face in synthetic_faces().items():
+        for index in range(variants):
+            variant = face
+            if index > 0:
+                variant = ImageEnhance.Brightness(variant).enhance(rng.uniform(0.8, 1.2))
+                variant = variant.rotate(rng.uniform(-6, 6), resample=Image.BICUBIC, fillcolor=(128, 128, 128))
+                dx, dy = (int(v) for v in rng.integers(-8, 9, size=2))
+                variant = variant.transform(variant.size, Image.AFFINE, (1, 0, dx, 0, 1, dy),
+                                            fillcolor=(128, 128, 128))
+                variant = variant.filter(ImageFilter.GaussianBlur(rng.uniform(0, 1.0)))
+            buffer = io.BytesIO()
+            variant.save(buffer, 'JPEG', quality=90)
+            images.append((person, f"variant_{index}.jpg", buffer.getvalue()))
+    return images
+
+def encode_all(encode, images):
+    """Encode every image; returns (labels, encodings, per-image ms, failures)."""
+    labels, encodings, latencies, failures = [], [], [], []
+    for person, filename, image_data in images:
+        start = time.perf_counter()
+        try:
+            encoding = encode(image_data)
+        except Exception as e:
+            failures.append({"image": f"{person}/{filename}", "error": str(e)})
+            continue
+        finally:
+            latencies.append((time.perf_counter() - start) * 1000)
+        labels.append(person)
+        encodings.append(np.asarray(encoding, dtype=np.float64))
+    return labels, encodings, latencies, failures
+
+def genuine_impostor(distances, labels):
+    """Split the upper triangle of the distance matrix into same-person and different-person pairs."""
+    labels = np.asarray(labels)
+    upper = np.triu_indices(len(labels), k=1)
+    same = labels[:, None] == labels[None, :]
+    pair_distances = distances[upper]
+    pair_same = same[upper]
+    return pair_distances[pair_same], pair_distances[~pair_same]
+
+def error_rates(genuine, impostor, tolerance):
+    """FAR (impostors accepted) and FRR (genuine pairs rejected) at a tolerance."""
+    far = float(np.mean(impostor <= tolerance)) if len(impostor) else None
+    frr = float(np.mean(genuine > tolerance)) if len(genuine) else None
+    return far, frr
+
+def equal_error_rate(genuine, impostor):
+    """EER over every observed distance as a candidate tolerance; returns (eer, tolerance)."""
+    if not len(genuine) or not len(impostor):
+        return None, None
+    thresholds = np.unique(np.concatenate([genuine, impostor]))
+    far = np.searchsorted(np.sort(impostor), thresholds, side='right') / len(impostor)
+    frr = 1.0 - np.searchsorted(np.sort(genuine), thresholds, side='right') / len(genuine)
+    best = int(np.argmin(np.abs(far - frr)))
+    return float((far[best] + frr[best]) / 2), float(thresholds[best])
+
+def distribution(values):
+    """Summary statistics of a distance distribution."""
+    if not len(values):
+        return None
+    return {
+        "count": int(len(values)),
+        "mean": float(np.mean(values)),
+        "std": float(np.std(values)),
+        "p5": float(np.percentile(values, 5)),
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95))
+    }
+
+def evaluate_backend(name, module, spec, images):
+    """Encode the dataset with one backend and score its default tolerance."""
+    entry = spec['encode']
+    encode = (lambda data: entry(module, data)) if callable(entry) else getattr(module, entry)
+    tolerance = default_tolerance(module, spec)
+
+    labels, encodings, latencies, failures = encode_all(encode, images)
+    genuine = impostor = np.empty(0)
+    if len(encodings) > 1:
+        distances = distance_matrix(spec['distance'], np.vstack(encodings))
+        genuine, impostor = genuine_impostor(distances, labels)
+
+    far, frr = error_rates(genuine, impostor, tolerance)
+    eer, eer_tolerance = equal_error_rate(genuine, impostor)
+    total_seconds = sum(latencies) / 1000.0
+    return {
+        "backend": name,
+        "tolerance": tolerance,
+        "far": far,
+        "frr": frr,
+        # Half total error rate at the default tolerance: the accuracy axis of the Pareto table
+        "hter": (far + frr) / 2 if far is not None and frr is not None else None,
+        "eer": eer,
+        "eer_tolerance": eer_tolerance,
+        "encode_ms_p50": float(np.percentile(latencies, 50)) if latencies else None,
+        "encode_ms_mean": float(np.mean(latencies)) if latencies else None,
+        "encodes_per_second": len(latencies) / total_seconds if total_seconds > 0 else None,
+        "genuine": distribution(genuine),
+        "impostor": distribution(impostor),
+        "encoded": len(encodings),
+        "failed_to_encode": failures
+    }
+
+def mark_pareto(rows):
+    """Flag backends no other backend beats on both encode latency and HTER."""
+    scored = [row for row in rows if row['hter'] is not None and row['encode_ms_mean'] is not None]
+    for row in rows:
+        row['pareto'] = row in scored and not any(
+            other['encode_ms_mean'] <= row['encode_ms_mean'] and other['hter'] <= row['hter']
+            and (other['encode_ms_mean'] < row['encode_ms_mean'] or other['hter'] < row['hter'])
+            for other in scored
+        )
+    return rows
+
+def _format(value, spec):
+    return format(value, spec) if value is not None else '-'
+
+def print_table(rows):
+    """Pareto table sorted by encode latency."""
+    print(f"\n{'backend':<30} {'ms/enc':>8} {'enc/s':>7} {'tol':>6} {'FAR':>7} {'FRR':>7} "
+          f"{'HTER':>7} {'EER':>7} {'fail':>5} {'pareto':>7}")
+    for row in sorted(rows, key=lambda r: (r['encode_ms_mean'] is None, r['encode_ms_mean'] or 0)):
+        print(f"{row['backend']:<30} {_format(row['encode_ms_mean'], '8.1f'):>8} "
+              f"{_format(row['encodes_per_second'], '7.2f'):>7} {row['tolerance']:>6} "
+              f"{_format(row['far'], '7.3f'):>7} {_format(row['frr'], '7.3f'):>7} "
+              f"{_format(row['hter'], '7.3f'):>7} {_format(row['eer'], '7.3f'):>7} "
+              f"{len(row['failed_to_encode']):>5} {'*' if row['pareto'] else '':>7}")
+
+def main():
+    """Evaluate the backends and print the Pareto table plus optional JSON."""
+    parser = argparse.ArgumentParser(description="Speed vs accuracy evaluation of face recognition backends")
+    parser.add_argument('--images', help="Labelled folder with one subfolder of images per person "
+                                         "(default: augmented synthetic faces)")
+    parser.add_argument('--backends', nargs='*', help="Backend module names (default: all)")
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    images = load_labelled_folder(args.images) if args.images else synthetic_identities()
+    people = sorted({person for person, _, _ in images})
+    print(f"{len(images)} images of {len(people)} people")
+
+    rows = []
+    skipped = {}
+    for name in args.backends or list(BACKENDS):
+        if name not in BACKENDS:
+            skipped[name] = "unknown backend"
+            continue
+        module, reason = load_backend(name)
+        if module is None:
+            skipped[name] = reason
+            print(f"{name:<30} skipped: {reason}")
+            continue
+        print(f"{name:<30} encoding...", flush=True)
+        rows.append(evaluate_backend(name, module, BACKENDS[name], images))
+
+    print_table(mark_pareto(rows))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                "environment": {
+                    "python": platform.python_version(),
+                    "numpy": np.__version__,
+                    "opencv": cv2.__version__,
+                    "cpu_count": os.cpu_count()
+                },
+                "dataset": {"source": args.images or "synthetic", "images": len(images), "people": len(people)},
+                "results": rows,
+                "skipped": skipped
+            }, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Soak test for the long-lived face service: push thousands of synthetic verifies through one
+service process, sample its RSS as it goes and fail when memory keeps growing
+The slope is fitted after a warm-up (model loading, caches and allocator pools filling up),
+so a flat service passes however much memory it settles at
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import urllib.request
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, 'server'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from worker_protocol import encode_frame
+from evaluate_backends import synthetic_identities
+
+def start_service(tracemalloc_every):
+    """Run face_service.py on a free port; returns (process, base URL)."""
+    env = dict(os.environ, FACE_SERVICE_PORT='0', FACE_TRACEMALLOC_EVERY=str(tracemalloc_every))
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT_DIR, 'server', 'face_service.py')],
+                               stdout=subprocess.PIPE, env=env, text=True)
+    line = process.stdout.readline()
+    if not line:
+        raise Exception(f"Face service exited with code {process.wait()}")
+    return process, json.loads(line)['listening']
+
+def post(base_url, path, body):
+    """POST a JSON document (dict) or binary frame (bytes) and parse the JSON response."""
+    payload = body if isinstance(body, bytes) else json.dumps(body).encode()
+    with urllib.request.urlopen(urllib.request.Request(base_url + path, data=payload, method='POST')) as response:
+        return json.loads(response.read())
+
+def memory_report(base_url):
+    with urllib.request.urlopen(base_url + '/debug/memory') as response:
+        return json.loads(response.read())
+
+def build_requests(base_url, backend, operation, images):
+    """
+    One request body per (reference, probe) pair of the same synthetic person: compare sends the
+    reference's encoding (encoded once through the service), verify sends both images.
+    """
+    people = {}
+    for person, _, image_bytes in images:
+        people.setdefault(person, []).append(image_bytes)
+
+    bodies = []
+    for person, variants in people.items():
+        reference, probes = variants[0], variants[1:] or variants
+        if operation == 'compare':
+            encoded = post(base_url, f'/{backend}/encode', encode_frame({}, {"image_data": reference}))
+            if not encoded.get('success'):
+                continue
+            header = {"known_encoding": encoded['encoding']}
+            bodies.extend(encode_frame(header, {"unknown_image": probe}) for probe in probes)
+        else:
+            bodies.extend(encode_frame({}, {"registered_image": reference, "captured_image": probe}) for probe in probes)
+    if not bodies:
+        raise Exception(f"No usable synthetic faces for {backend}")
+    return bodies
+
+def growth_slope(samples, warmup):
+    """Least-squares RSS growth in bytes per request over the samples after the warm-up."""
+    points = [(index, rss) for index, rss in samples if index >= warmup]
+    if len(points) < 3:
+        raise Exception("Too few RSS samples after the warm-up; raise --requests or lower --sample-every")
+    x, y = np.array(points, dtype=np.float64).T
+    return float(np.polyfit(x, y, 1)[0])
+
+def main():
+    """Run the soak test; exits 1 when RSS grows faster than --max-slope KiB per request."""
+    parser = argparse.ArgumentParser(description="Soak test the face service for memory growth")
+    parser.add_argument('--url', help="Running service to test, e.g. http://127.0.0.1:5100 (default: start one)")
+    parser.add_argument('--backend', default='reliable_face_recognition', help="Backend module name")
+    parser.add_argument('--requests', type=int, default=2000, help="Verify/compare requests to send")
+    parser.add_argument('--warmup', type=int, default=200, help="Requests excluded from the slope fit")
+    parser.add_argument('--sample-every', type=int, default=25, help="Requests between RSS samples")
+    parser.add_argument('--max-slope', type=float, default=1.0, help="Allowed RSS growth in KiB per request")
+    parser.add_argument('--tracemalloc', type=int, default=0,
+                        help="Snapshot every N requests in a started service and print the top growth lines "
+                             "(tracing overhead inflates RSS: use it to locate a leak, not to judge the slope)")
+    parser.add_argument('--output', help="Write the RSS samples and result as JSON to this file")
+    args = parser.parse_args()
+
+    process = None
+    base_url = args.url
+    if base_url is None:
+        process, base_url = start_service(args.tracemalloc)
+
+    try:
+        from face_service import BACKENDS
+        operation = 'compare' if 'compare' in BACKENDS[args.backend] else 'verify'
+        bodies = build_requests(base_url, args.backend, operation, synthetic_identities())
+        print(f"Soak: {args.requests} {args.backend}/{operation} requests against {base_url}")
+
+        samples = [(0, memory_report(base_url)['rss_bytes'])]
+        failures = 0
+        start = time.perf_counter()
+        for index in range(1, args.requests + 1):
+            response = post(base_url, f'/{args.backend}/{operation}', bodies[index % len(bodies)])
+            failures += not response.get('success')
+            if index % args.sample_every == 0:
+                samples.append((index, memory_report(base_url)['rss_bytes']))
+                print(f"  {index:6d} requests  RSS {samples[-1][1] / 2**20:8.1f} MiB", flush=True)
+        elapsed = time.perf_counter() - start
+
+        report = memory_report(base_url)
+        slope_kib = growth_slope(samples, args.warmup) / 1024
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    passed = slope_kib <= args.max_slope
+    result = {
+        "backend": args.backend,
+        "operation": operation,
+        "requests": args.requests,
+        "failed_requests": failures,
+        "requests_per_second": round(args.requests / elapsed, 2),
+        "rss_start_bytes": samples[0][1],
+        "rss_end_bytes": samples[-1][1],
+        "slope_kib_per_request": round(slope_kib, 4),
+        "max_slope_kib_per_request": args.max_slope,
+        "passed": passed,
+        "operations": report["operations"],
+        "samples": samples
+    }
+
+    print(f"RSS {samples[0][1] / 2**20:.1f} -> {samples[-1][1] / 2**20:.1f} MiB, "
+          f"slope {slope_kib:.3f} KiB/request after {args.warmup} warm-up requests (limit {args.max_slope})")
+    if report.get("tracemalloc") and report["tracemalloc"]["diffs"]:
+        last = report["tracemalloc"]["diffs"][-1]
+        print(f"Top allocation growth in the last {report['tracemalloc']['snapshot_every']} requests:")
+        for line in last["top"][:10]:
+            print(f"  {line['size_diff_bytes'] / 1024:+10.1f} KiB  {line['count_diff']:+6d} blocks  {line['location']}")
+        result["tracemalloc"] = report["tracemalloc"]
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+    print("✓ PASS: memory is flat" if passed else "✗ FAIL: memory grows faster than the allowed slope")
+    sys.exit(0 if passed else 1)
+
+if __name__ == "__main__":
+    main()
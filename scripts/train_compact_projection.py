@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Fit the compact descriptor projection of the handcrafted backends
+Encodes a labelled image folder (one subfolder per person) with each backend, fits PCA or
+PCA + LDA down to --dims values and writes <backend>.npy plus its <backend>.json sidecar
+(calibrated tolerance) to FACE_COMPACT_DIR, where the workers load it for "descriptor": "compact"
+"""
+
+import os
+import sys
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from evaluate_backends import BACKENDS, load_labelled_folder, synthetic_identities, encode_all
+from benchmark_backends import load_backend
+from face_compact import COMPACT_BACKENDS, COMPACT_DIMS, COMPACT_DIR, PROJECTION_METHODS, fit_projection
+
+def encode_dataset(name, images):
+    """Full encodings of every image with one backend; returns (labels, n x d encodings, failures)."""
+    module, reason = load_backend(name)
+    if module is None:
+        raise Exception(f"Backend {name} is unavailable: {reason}")
+    labels, encodings, _, failures = encode_all(getattr(module, BACKENDS[name]['encode']), images)
+    if len(encodings) < 2:
+        raise Exception(f"Backend {name} encoded {len(encodings)} of {len(images)} images")
+    return labels, np.vstack(encodings), failures
+
+def main():
+    """Train and save one projection per backend."""
+    parser = argparse.ArgumentParser(description="Fit compact descriptor projections for the handcrafted backends")
+    parser.add_argument('--images', help="Labelled folder with one subfolder of images per person "
+                                         "(default: augmented synthetic faces; retrain on real photos)")
+    parser.add_argument('--variants', type=int, default=40, help="Augmented photos per synthetic face")
+    parser.add_argument('--backends', nargs='*', default=list(COMPACT_BACKENDS), choices=COMPACT_BACKENDS)
+    parser.add_argument('--dims', type=int, default=COMPACT_DIMS, help="Compact descriptor size (128-256)")
+    parser.add_argument('--method', choices=PROJECTION_METHODS, default='lda')
+    parser.add_argument('--output-dir', default=COMPACT_DIR, help="Where to write <backend>.npy and .json")
+    args = parser.parse_args()
+
+    images = load_labelled_folder(args.images) if args.images else synthetic_identities(args.variants)
+    os.makedirs(args.output_dir, exist_ok=True)
+    print(f"{len(images)} images of {len({person for person, _, _ in images})} people")
+
+    for name in args.backends:
+        print(f"{name:<30} encoding...", flush=True)
+        labels, encodings, failures = encode_dataset(name, images)
+        projection = fit_projection(encodings, labels, args.dims, args.method)
+        projection.meta['source'] = args.images or "synthetic"
+        path = os.path.join(args.output_dir, f"{name}.npy")
+        projection.save(path)
+        print(f"{name:<30} {projection.source_dims} -> {projection.dims} dims ({args.method}), "
+              f"tolerance {projection.tolerance:.4f}, {len(failures)} failed to encode, "
+              f"{os.path.getsize(path) / 1024:.0f} KiB -> {path}")
+
+if __name__ == "__main__":
+    main()
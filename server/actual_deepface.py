@@ -6,11 +6,13 @@ No custom shit, just the actual library as requested
 
 import sys
 import json
-import base64
-import io
 import os
 import tempfile
-from PIL import Image
+from face_detectors import parse_face_hint, hint_window
+from image_io import open_image, to_data_url
+from stage_timings import stage_timer, record_count
+from face_backends import run_cli
+from facenet_batching import verify_facenet
 
 # Install DeepFace if not available
 try:
@@ -22,17 +24,18 @@ except ImportError:
     }))
     sys.exit(1)
 
-def process_image_from_base64(image_data):
-    """Convert base64 image to temporary file for DeepFace."""
+def process_image_from_base64(image_data, face_hint=None):
+    """Convert base64 image to temporary file for DeepFace, optionally cropped around a face hint."""
     try:
-        if image_data.startswith('data:image'):
-            image_data = image_data.split(',')[1]
+        decode_info = {}
+        pil_image = open_image(image_data, info=decode_info)
         
-        image_bytes = base64.b64decode(image_data)
-        pil_image = Image.open(io.BytesIO(image_bytes))
-        
-        if pil_image.mode != 'RGB':
-            pil_image = pil_image.convert('RGB')
+        # Restrict DeepFace's detector to the window around the hint
+        if face_hint is not None:
+            face_hint = parse_face_hint(face_hint, decode_info['decode_scale'])
+            window = hint_window(face_hint, (pil_image.height, pil_image.width))
+            if window is not None:
+                pil_image = pil_image.crop(window)
         
         # Save to temporary file
         temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.jpg')
@@ -45,30 +48,53 @@ def process_image_from_base64(image_data):
 
 def store_face_image(image_data):
     """Store face image - just return the image data."""
-    return image_data
+    return to_data_url(image_data)
 
-def verify_faces_with_actual_deepface(registered_image_data, captured_image_data):
-    """Verify faces using actual DeepFace.verify function."""
+def verify_faces_with_actual_deepface(registered_image_data, captured_image_data, face_hint=None, info=None):
+    """Verify faces using actual DeepFace.verify function. face_hint locates the captured face."""
     temp_files = []
     try:
         # Convert base64 images to temporary files
+        timer = stage_timer(info)
         registered_path = process_image_from_base64(registered_image_data)
-        captured_path = process_image_from_base64(captured_image_data)
-        temp_files = [registered_path, captured_path]
+        temp_files.append(registered_path)
+        timer.lap('decode')
+        
+        result = None
+        hint_used = False
+        face_hint = parse_face_hint(face_hint)
         
-        # Use actual DeepFace.verify function
-        result = DeepFace.verify(
-            img1_path=registered_path,
-            img2_path=captured_path,
-            model_name='Facenet',
-            detector_backend='opencv'
-        )
+        # Try the window around the client hint first
+        if face_hint is not None:
+            hinted_path = process_image_from_base64(captured_image_data, face_hint)
+            temp_files.append(hinted_path)
+            timer.lap('decode')
+            record_count(info, 'detect_passes', 1)
+            try:
+                result = verify_facenet(registered_path, hinted_path, info, detector_backend='opencv')
+                hint_used = True
+            except ValueError:
+                # No face inside the hint window - fall back to the full frame
+                result = None
+            # Detection, Facenet embeddings of both images and the distance
+            timer.lap('inference')
+        
+        if result is None:
+            captured_path = process_image_from_base64(captured_image_data)
+            temp_files.append(captured_path)
+            timer.lap('decode')
+            record_count(info, 'detect_passes', 1)
+            
+            # Use actual DeepFace.verify function (micro-batched Facenet when enabled)
+            result = verify_facenet(registered_path, captured_path, info, detector_backend='opencv')
+            timer.lap('inference')
         
         return {
             "verified": bool(result['verified']),
             "distance": float(result['distance']),
             "threshold": float(result['threshold']),
-            "model": result['model']
+            "model": result['model'],
+            "hint_used": hint_used
         }
         
     except Exception as e:
@@ -84,53 +110,7 @@ def verify_faces_with_actual_deepface(registered_image_data, captured_image_data
 
 def main():
     """Main function to handle operations."""
-    try:
-        if len(sys.argv) > 1:
-            operation = sys.argv[1]
-            
-            if operation == "store":
-                input_data = sys.stdin.read()
-                data = json.loads(input_data)
-                image_data = data.get('image_data', '')
-                
-                stored_data = store_face_image(image_data)
-                
-                print(json.dumps({
-                    "success": True,
-                    "image_data": stored_data
-                }))
-                
-            elif operation == "verify":
-                input_data = sys.stdin.read()
-                data = json.loads(input_data)
-                
-                registered_image = data.get('registered_image', '')
-                captured_image = data.get('captured_image', '')
-                
-                result = verify_faces_with_actual_deepface(registered_image, captured_image)
-                
-                print(json.dumps({
-                    "success": True,
-                    "result": result
-                }))
-                
-            else:
-                print(json.dumps({
-                    "success": False,
-                    "error": f"Unknown operation: {operation}"
-                }))
-                
-        else:
-            print(json.dumps({
-                "success": False,
-                "error": "No operation specified"
-            }))
-            
-    except Exception as e:
-        print(json.dumps({
-            "success": False,
-            "error": str(e)
-        }))
+    run_cli('actual_deepface', sys.modules[__name__])
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+asyncio HTTP/1.1 front-end of the face service
+One event loop accepts every connection (TCP or a Unix socket), parses request heads and bodies
+and hands each request to a dispatch coroutine; the face service awaits its worker pool there, so
+thousands of idle or queued connections cost no threads and /health and /metrics are answered on
+the loop while every worker is busy. Supports keep-alive and Content-Length bodies, nothing else.
+"""
+
+import os
+import sys
+import json
+import asyncio
+import traceback
+from http import HTTPStatus
+
+# Largest request body accepted; larger requests get 413 without being read
+MAX_BODY_BYTES = int(os.environ.get('FACE_SERVICE_MAX_BODY', str(32 * 1024 * 1024)))
+# Longest request line plus headers
+MAX_HEAD_BYTES = 64 * 1024
+
+class RequestError(Exception):
+    """A malformed request, answered with its status before the connection is closed."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+async def read_head(reader):
+    """Request line and headers; returns (method, path, version, headers) or None at end of stream."""
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.IncompleteReadError as e:
+        if e.partial.strip():
+            raise RequestError(400, "Incomplete request head")
+        return None
+    except asyncio.LimitOverrunError:
+        raise RequestError(431, "Request head too large")
+
+    lines = head.decode('latin-1').split('\r\n')
+    parts = lines[0].split(' ')
+    if len(parts) != 3 or not parts[2].startswith('HTTP/1.'):
+        raise RequestError(400, f"Bad request line: {lines[0][:100]}")
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, separator, value = line.partition(':')
+            if not separator:
+                raise RequestError(400, f"Bad header line: {line[:100]}")
+            headers[name.strip().lower()] = value.strip()
+    return parts[0], parts[1], parts[2], headers
+
+async def read_body(reader, headers):
+    """Body of a request with Content-Length (chunked uploads are not supported)."""
+    if 'chunked' in headers.get('transfer-encoding', '').lower():
+        raise RequestError(411, "Chunked bodies are not supported; send Content-Length")
+    try:
+        length = int(headers.get('content-length', '0'))
+    except ValueError:
+        raise RequestError(400, "Invalid Content-Length")
+    if length < 0:
+        raise RequestError(400, "Invalid Content-Length")
+    if length > MAX_BODY_BYTES:
+        raise RequestError(413, f"Body of {length} bytes exceeds {MAX_BODY_BYTES}")
+    try:
+        return await reader.readexactly(length)
+    except asyncio.IncompleteReadError:
+        raise RequestError(400, "Connection closed before the body was complete")
+
+def internal_error_body(error):
+    """JSON body of a 500 response for an unexpected exception."""
+    return json.dumps({"success": False, "error": f"Internal error: {str(error)}"})
+
+def encode_response(status, body, content_type, keep_alive):
+    payload = body.encode() if isinstance(body, str) else body
+    head = (f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode('latin-1') + payload
+
+def connection_handler(dispatch):
+    """
+    asyncio stream callback serving requests on one connection until it closes.
+    dispatch(method, path, body) is a coroutine returning (status, body, content type).
+    """
+    async def serve(reader, writer):
+        try:
+            while True:
+                try:
+                    request = await read_head(reader)
+                    if request is None:
+                        break
+                    method, path, version, headers = request
+                    body = await read_body(reader, headers)
+                except RequestError as e:
+                    writer.write(encode_response(e.status, json.dumps({"success": False, "error": str(e)}),
+                                                 'application/json', False))
+                    await writer.drain()
+                    break
+
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection != 'close' and (version != 'HTTP/1.0' or connection == 'keep-alive')
+                try:
+                    status, response, content_type = await dispatch(method, path, body)
+                except Exception as e:
+                    # A failure outside the backends (decoding, debug actions, the pool itself)
+                    # still gets an answer; the connection is closed as its state is unknown
+                    traceback.print_exc(file=sys.stderr)
+                    status, response, content_type = 500, internal_error_body(e), 'application/json'
+                    keep_alive = False
+                writer.write(encode_response(status, response, content_type, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.CancelledError):
+            # Cancelled at shutdown: end quietly, asyncio logs connection tasks that end in an exception
+            pass
+        finally:
+            writer.close()
+
+    return serve
+
+async def start_server(dispatch, host='127.0.0.1', port=0, socket_path=None):
+    """Listen on host:port, or on a Unix socket when socket_path is given (a stale socket file is replaced)."""
+    handler = connection_handler(dispatch)
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        return await asyncio.start_unix_server(handler, path=socket_path, limit=MAX_HEAD_BYTES)
+    return await asyncio.start_server(handler, host, port, limit=MAX_HEAD_BYTES)
+
+def listening_address(server, socket_path=None):
+    """URL-style address of a started server: http://host:port or unix:/path."""
+    if socket_path:
+        return f"unix:{socket_path}"
+    host, port = server.sockets[0].getsockname()[:2]
+    return f"http://{host}:{port}"
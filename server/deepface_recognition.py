@@ -5,30 +5,27 @@ Uses DeepFace with Facenet model to match desktop system results
 """
 
 import sys
-import json
-import base64
-import io
 import os
 import tempfile
-from PIL import Image
 from deepface import DeepFace
+from face_detectors import parse_face_hint, hint_window
+from image_io import open_image, to_data_url
+from stage_timings import stage_timer, record_count
+from face_backends import run_cli
+from facenet_batching import verify_facenet
 
-def process_image_from_base64(image_data, save_path):
-    """Convert base64 image to file and save it."""
+def process_image_from_base64(image_data, save_path, face_hint=None):
+    """Convert base64 image to file and save it, optionally cropped around a face hint."""
     try:
-        # Remove data URL prefix if present
-        if image_data.startswith('data:image'):
-            image_data = image_data.split(',')[1]
+        decode_info = {}
+        pil_image = open_image(image_data, info=decode_info)
         
-        # Decode base64 to bytes
-        image_bytes = base64.b64decode(image_data)
-        
-        # Convert to PIL Image
-        pil_image = Image.open(io.BytesIO(image_bytes))
-        
-        # Convert to RGB if needed
-        if pil_image.mode != 'RGB':
-            pil_image = pil_image.convert('RGB')
+        # Restrict DeepFace's detector to the window around the hint
+        if face_hint is not None:
+            face_hint = parse_face_hint(face_hint, decode_info['decode_scale'])
+            window = hint_window(face_hint, (pil_image.height, pil_image.width))
+            if window is not None:
+                pil_image = pil_image.crop(window)
         
         # Save as JPEG
         pil_image.save(save_path, 'JPEG', quality=95)
@@ -42,13 +39,13 @@ def store_face_image(image_data):
     try:
         # For DeepFace, we don't need to generate encodings
         # We just store the image data and compare images directly
-        return image_data
+        return to_data_url(image_data)
         
     except Exception as e:
         raise Exception(f"Failed to store face image: {str(e)}")
 
-def verify_faces_with_deepface(registered_image_data, captured_image_data):
-    """Compare two face images using DeepFace with Facenet model."""
+def verify_faces_with_deepface(registered_image_data, captured_image_data, face_hint=None, info=None):
+    """Compare two face images using DeepFace with Facenet model. face_hint locates the captured face."""
     try:
         # Create temporary files for the images
         with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as registered_file:
@@ -59,22 +56,43 @@ def verify_faces_with_deepface(registered_image_data, captured_image_data):
         
         try:
             # Save both images to temporary files
+            timer = stage_timer(info)
             process_image_from_base64(registered_image_data, registered_path)
-            process_image_from_base64(captured_image_data, captured_path)
+            timer.lap('decode')
+            
+            result = None
+            hint_used = False
+            face_hint = parse_face_hint(face_hint)
             
-            # Use DeepFace to verify the faces with Facenet model
-            result = DeepFace.verify(
-                img1_path=registered_path,
-                img2_path=captured_path,
-                model_name="Facenet",
-                enforce_detection=True
-            )
+            # Try the window around the client hint first
+            if face_hint is not None:
+                process_image_from_base64(captured_image_data, captured_path, face_hint)
+                timer.lap('decode')
+                record_count(info, 'detect_passes', 1)
+                try:
+                    result = verify_facenet(registered_path, captured_path, info, enforce_detection=True)
+                    hint_used = True
+                except ValueError:
+                    # No face inside the hint window - fall back to the full frame
+                    result = None
+                # Detection, Facenet embeddings of both images and the distance
+                timer.lap('inference')
+            
+            if result is None:
+                process_image_from_base64(captured_image_data, captured_path)
+                timer.lap('decode')
+                record_count(info, 'detect_passes', 1)
+                
+                # Use DeepFace to verify the faces with Facenet model (micro-batched when enabled)
+                result = verify_facenet(registered_path, captured_path, info, enforce_detection=True)
+                timer.lap('inference')
             
             return {
                 "verified": bool(result["verified"]),
                 "distance": float(result["distance"]),
                 "threshold": float(result["threshold"]),
-                "model": "Facenet"
+                "model": "Facenet",
+                "hint_used": hint_used
             }
             
         finally:
@@ -90,55 +108,7 @@ def verify_faces_with_deepface(registered_image_data, captured_image_data):
 
 def main():
     """Main function to handle operations."""
-    try:
-        if len(sys.argv) > 1:
-            operation = sys.argv[1]
-            
-            if operation == "store":
-                # Store face image (no encoding needed for DeepFace)
-                input_data = sys.stdin.read()
-                data = json.loads(input_data)
-                image_data = data.get('image_data', '')
-                
-                stored_data = store_face_image(image_data)
-                
-                print(json.dumps({
-                    "success": True,
-                    "image_data": stored_data
-                }))
-                
-            elif operation == "verify":
-                # Verify faces using DeepFace
-                input_data = sys.stdin.read()
-                data = json.loads(input_data)
-                
-                registered_image = data.get('registered_image', '')
-                captured_image = data.get('captured_image', '')
-                
-                result = verify_faces_with_deepface(registered_image, captured_image)
-                
-                print(json.dumps({
-                    "success": True,
-                    "result": result
-                }))
-                
-            else:
-                print(json.dumps({
-                    "success": False,
-                    "error": f"Unknown operation: {operation}"
-                }))
-                
-        else:
-            print(json.dumps({
-                "success": False,
-                "error": "No operation specified"
-            }))
-            
-    except Exception as e:
-        print(json.dumps({
-            "success": False,
-            "error": str(e)
-        }))
+    run_cli('deepface_recognition', sys.modules[__name__])
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
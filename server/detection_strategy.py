@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Adaptive detection fallback strategy
+Orders detection passes by their persisted success rate and runs the fallbacks concurrently
+(OpenCV releases the GIL inside detectMultiScale) so a hard image costs about one pass.
+Under a request deadline the fallbacks only start when their learned cost still fits, and
+stop (cancelling queued passes) when the deadline passes.
+Each process keeps one strategy per backend (get_strategy) counting in memory; the counts
+since the last flush are added to the stats file every FACE_DETECTION_STATS_FLUSH seconds
+and at exit, so concurrent workers and processes merge their counts instead of overwriting.
+"""
+
+import os
+import json
+import time
+import atexit
+import tempfile
+import threading
+from multiprocessing import util as multiprocessing_util
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from request_budget import current_budget, check_deadline, require_budget, measured
+
+try:
+    import fcntl
+except ImportError:  # Windows: flushes are not serialized across processes
+    fcntl = None
+
+STATS_PATH = os.environ.get('FACE_DETECTION_STATS', os.path.join(tempfile.gettempdir(), 'face_detection_stats.json'))
+ADAPTIVE_ENABLED = os.environ.get('FACE_DETECTION_ADAPTIVE', '1') != '0'
+MAX_WORKERS = int(os.environ.get('FACE_DETECTION_WORKERS', str(os.cpu_count() or 1)))
+# Seconds between merges of the in-memory counts into the stats file
+STATS_FLUSH_SECONDS = float(os.environ.get('FACE_DETECTION_STATS_FLUSH', '30'))
+
+_executor = None
+_executor_lock = threading.Lock()
+_strategies = {}
+_strategies_lock = threading.Lock()
+
+def _get_executor():
+    """Process-wide pool for concurrent fallback passes."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='face-detect')
+        return _executor
+
+def pass_key(detection_pass):
+    """Stable identifier for a (detector, scale_factor, min_neighbors, min_size) pass."""
+    detector, scale_factor, min_neighbors, min_size = detection_pass
+    return f"{detector}:{scale_factor}:{min_neighbors}:{min_size[0]}x{min_size[1]}"
+
+def load_stats(path=STATS_PATH):
+    """Read persisted pass statistics, ignoring a missing or corrupt file."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_stats(stats, path=STATS_PATH):
+    """Atomically persist pass statistics."""
+    try:
+        directory = os.path.dirname(path) or '.'
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.face_detection_stats')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(stats, f)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+
+def _add_counts(stats, deltas):
+    """Add {pass_key: {'attempts', 'successes'}} deltas into stats in place."""
+    for key, delta in deltas.items():
+        entry = stats.setdefault(key, {'attempts': 0, 'successes': 0})
+        entry['attempts'] = entry.get('attempts', 0) + delta['attempts']
+        entry['successes'] = entry.get('successes', 0) + delta['successes']
+
+def merge_stats(name, deltas, path=STATS_PATH):
+    """
+    Add counts of strategy name into the stats file (read, add, replace under an exclusive
+    lock on path + '.lock') and return the merged counts of name.
+    """
+    lock_file = None
+    try:
+        if fcntl is not None:
+            lock_file = open(path + '.lock', 'a')
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+    except OSError:
+        lock_file = None
+    try:
+        all_stats = load_stats(path)
+        stats = all_stats.get(name)
+        if not isinstance(stats, dict):
+            stats = all_stats[name] = {}
+        _add_counts(stats, deltas)
+        save_stats(all_stats, path)
+        return stats
+    finally:
+        if lock_file is not None:
+            lock_file.close()
+
+def get_strategy(name, passes):
+    """The process-wide strategy of backend name, created on first use."""
+    with _strategies_lock:
+        strategy = _strategies.get(name)
+        if strategy is None:
+            strategy = _strategies[name] = AdaptiveDetectionStrategy(name, passes)
+        return strategy
+
+@atexit.register
+def flush_all():
+    """Write the pending counts of every process-wide strategy."""
+    with _strategies_lock:
+        strategies = list(_strategies.values())
+    for strategy in strategies:
+        strategy.flush()
+
+# Pool worker processes leave through os._exit, skipping atexit, but run multiprocessing finalizers
+multiprocessing_util.Finalize(None, flush_all, exitpriority=10)
+
+class AdaptiveDetectionStrategy:
+    """
+    Runs an ordered list of detection passes, most successful first.
+
+    Passes are (detector_name, scale_factor, min_neighbors, min_size) tuples and are run
+    through a face_detectors.DetectionView, so each worker thread uses its own detector
+    instances. The first pass runs inline; if it finds nothing the remaining passes run
+    concurrently and the first one to find a face wins.
+    Counts live in memory (stats includes the unflushed ones) and are merged into the stats
+    file by flush(), at most every flush_seconds from detect.
+    """
+
+    def __init__(self, name, passes, adaptive=None, max_workers=None, stats_path=STATS_PATH, flush_seconds=None):
+        self.name = name
+        self.passes = list(passes)
+        self.adaptive = ADAPTIVE_ENABLED if adaptive is None else adaptive
+        self.max_workers = MAX_WORKERS if max_workers is None else max_workers
+        self.stats_path = stats_path
+        self.flush_seconds = STATS_FLUSH_SECONDS if flush_seconds is None else flush_seconds
+        self.stats = load_stats(stats_path).get(name, {}) if self.adaptive else {}
+        self._unflushed = {}
+        self._flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def success_rate(self, detection_pass):
+        """Laplace-smoothed success rate so unseen passes keep a fair chance."""
+        entry = self.stats.get(pass_key(detection_pass), {})
+        return (entry.get('successes', 0) + 1.0) / (entry.get('attempts', 0) + 2.0)
+
+    def ordered_passes(self):
+        """Passes by descending success rate; ties keep their configured order."""
+        if not self.adaptive:
+            return list(self.passes)
+        with self._lock:
+            return sorted(self.passes, key=lambda p: -self.success_rate(p))
+
+    def flush(self):
+        """Merge the counts since the last flush into the stats file and pick up other processes' counts."""
+        with self._lock:
+            pending, self._unflushed = self._unflushed, {}
+            self._flushed_at = time.monotonic()
+        if not pending:
+            return
+        merged = merge_stats(self.name, pending, self.stats_path)
+        with self._lock:
+            # Counts recorded while the file was being written are still pending
+            _add_counts(merged, self._unflushed)
+            self.stats = merged
+
+    def _run_pass(self, view, detection_pass):
+        """Run one pass on the shared detection view."""
+        detector, scale_factor, min_neighbors, min_size = detection_pass
+        boxes, _ = view.detect(detector, scale_factor=scale_factor, min_neighbors=min_neighbors, min_size=min_size)
+        return boxes
+
+    def _record(self, attempted, winner):
+        """Count attempts/successes for the passes that ran; flush when the interval has passed."""
+        if not self.adaptive:
+            return
+        deltas = {pass_key(p): {'attempts': 1, 'successes': int(p == winner)} for p in attempted}
+        with self._lock:
+            _add_counts(self.stats, deltas)
+            _add_counts(self._unflushed, deltas)
+            due = time.monotonic() - self._flushed_at >= self.flush_seconds
+        if due:
+            self.flush()
+
+    def detect(self, view):
+        """Return (boxes, winning pass, passes tried); boxes is empty if every pass failed."""
+        ordered = self.ordered_passes()
+        first, remaining = ordered[0], ordered[1:]
+
+        boxes = self._run_pass(view, first)
+        if len(boxes) > 0 or not remaining:
+            winner = first if len(boxes) > 0 else None
+            self._record([first], winner)
+            return boxes, winner, 1
+
+        # Fallbacks that cannot finish in time end the request now instead of running on
+        cost_name = f"{self.name}:detection_fallbacks"
+        probe = require_budget(cost_name, 'detect')
+        with measured(cost_name, reset=probe):
+            return self._detect_fallbacks(view, ordered, first, remaining)
+
+    def _detect_fallbacks(self, view, ordered, first, remaining):
+        if self.max_workers <= 1:
+            attempted = [first]
+            for detection_pass in remaining:
+                check_deadline('detect')
+                attempted.append(detection_pass)
+                boxes = self._run_pass(view, detection_pass)
+                if len(boxes) > 0:
+                    self._record(attempted, detection_pass)
+                    return boxes, detection_pass, len(attempted)
+            self._record(attempted, None)
+            return boxes, None, len(attempted)
+
+        executor = _get_executor()
+        futures = {executor.submit(self._run_pass, view, p): p for p in remaining}
+        attempted = [first]
+        pending = set(futures)
+        budget = current_budget()
+
+        while pending:
+            timeout = None if budget is None else max(0.0, budget.remaining_ms() / 1000)
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                for other in pending:
+                    other.cancel()
+                self._record(attempted, None)
+                budget.expire('detect')
+            # Take the highest-ranked success among the passes that finished together
+            for future in sorted(done, key=lambda f: ordered.index(futures[f])):
+                detection_pass = futures[future]
+                attempted.append(detection_pass)
+                boxes = future.result()
+                if len(boxes) > 0:
+                    for other in pending:
+                        other.cancel()
+                    self._record(attempted, detection_pass)
+                    return boxes, detection_pass, len(attempted)
+
+        self._record(attempted, None)
+        return boxes, None, len(attempted)
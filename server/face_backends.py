@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+In-process Python API for the face recognition backends
+FaceBackend('reliable_face_recognition').encode(rgb) returns the encoding as an ndarray and
+compare(known, rgb) the match result, with no subprocess, JSON or base64 in between. Images may
+be RGB uint8 arrays, PIL images, encoded bytes or base64 data URLs; FaceBackend(name, 'compact')
+returns the learned compact descriptors of face_compact instead. run_cli() is the shared
+main() of every backend script, so the CLIs and the API run the same code.
+"""
+
+import os
+import sys
+import io
+import json
+import threading
+import importlib
+import contextlib
+import numpy as np
+from PIL import Image
+
+# fix_face_security.py lives in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from worker_protocol import read_request
+from stage_timings import request_info, with_timings
+from face_templates import enroll_images, request_images, refresh_template, verification_confidence
+from face_compact import descriptor_mode, get_projection, compact_encode, compact_compare
+from feature_precision import feature_precision, request_precision
+from request_budget import request_budget, deadline_scope, timeout_response, with_budget_result
+
+# Backend module -> operation -> (kind, function name); enroll aggregates the encode function's
+# output, refresh_template only does arithmetic on encodings the backend produced
+BACKENDS = {
+    'simple_face_recognition': {
+        'encode': ('encode', 'encode_face'), 'compare': ('compare', 'compare_faces_simple'),
+        'enroll': ('enroll', 'encode_face'), 'refresh_template': ('refresh_template', None)
+    },
+    'reliable_face_recognition': {
+        'encode': ('encode', 'encode_face'), 'compare': ('compare', 'compare_faces_reliable'),
+        'enroll': ('enroll', 'encode_face'), 'refresh_template': ('refresh_template', None)
+    },
+    'secure_face_recognition': {
+        'encode': ('encode', 'encode_face_ultra_secure'), 'compare': ('compare', 'compare_faces_ultra_secure'),
+        'enroll': ('enroll', 'encode_face_ultra_secure'), 'refresh_template': ('refresh_template', None)
+    },
+    'fix_face_security': {
+        'encode': ('encode', 'encode_face_secure'), 'compare': ('compare', 'compare_faces_secure'),
+        'enroll': ('enroll', 'encode_face_secure'), 'refresh_template': ('refresh_template', None)
+    },
+    'face_recognition_service': {
+        'encode': ('encode', 'generate_face_encoding'), 'compare': ('compare', 'compare_faces'),
+        'enroll': ('enroll', 'generate_face_encoding'), 'refresh_template': ('refresh_template', None)
+    },
+    'proper_face_recognition': {
+        'encode': ('encode', 'encode_face'), 'compare': ('compare', 'compare_faces_proper'),
+        'enroll': ('enroll', 'encode_face'), 'refresh_template': ('refresh_template', None)
+    },
+    'simple_deepface_verification': {
+        'store': ('store', 'store_face_image'), 'verify': ('verify', 'verify_faces_deepface_style')
+    },
+    'actual_deepface': {'store': ('store', 'store_face_image'), 'verify': ('verify', 'verify_faces_with_actual_deepface')},
+    'deepface_recognition': {'store': ('store', 'store_face_image'), 'verify': ('verify', 'verify_faces_with_deepface')},
+}
+
+_modules = {}
+_modules_lock = threading.Lock()
+_backends = {}
+
+def load_backend(name):
+    """Import a backend module once; raises if it is unknown or its libraries are missing."""
+    if name not in BACKENDS:
+        raise KeyError(name)
+    with _modules_lock:
+        if name not in _modules:
+            try:
+                # The DeepFace modules print a JSON error and exit when the library is missing
+                with contextlib.redirect_stdout(io.StringIO()):
+                    _modules[name] = importlib.import_module(name)
+            except SystemExit:
+                raise Exception(f"Backend {name} is unavailable: dependency not installed")
+        return _modules[name]
+
+def loaded_backends():
+    """Names of the backend modules imported so far."""
+    with _modules_lock:
+        return sorted(_modules)
+
+def _encode_function(module, backend):
+    return getattr(module, next(name for kind, name in BACKENDS[backend].values() if kind == 'encode'))
+
+def run_operation(module, kind, function_name, data, info, backend=None):
+    """
+    Run one request document against a backend module; returns the CLI response.
+    "descriptor": "compact" switches encode, compare and enroll of backend to its compact projection
+    (a compact compare's known_encoding is compact unless "known_descriptor": "full"),
+    "precision": "float32" runs the feature extractors in float32. "deadline_ms" bounds the request:
+    past it the response is {"success": false, "timeout": true, "stage": ...}, and an encode that
+    skipped optional feature groups lists them under "degraded". Other operations measure distances
+    to full encodings (or build templates), so they never skip feature groups.
+    """
+    budget = request_budget(data, degradable=kind == 'encode')
+    with feature_precision(request_precision(data)), deadline_scope(budget):
+        try:
+            return with_budget_result(_dispatch(module, kind, function_name, data, info, backend), budget)
+        except Exception:
+            # Backends wrap errors in their own messages; the budget remembers a timeout
+            if budget is not None and budget.timed_out is not None:
+                return timeout_response(budget.timed_out, budget.deadline_ms)
+            raise
+
+def _dispatch(module, kind, function_name, data, info, backend):
+    function = getattr(module, function_name) if function_name else None
+    projection = None
+    if kind in ('encode', 'compare', 'enroll') and descriptor_mode(data) == 'compact':
+        projection = get_projection(backend)
+        if kind == 'compare':
+            result = compact_compare(_encode_function(module, backend), projection, data.get('known_encoding', []),
+                                     data.get('unknown_image', ''), data.get('tolerance'), data.get('face_hint'), info,
+                                     descriptor_mode(data, 'known_descriptor', 'compact'))
+            return {"success": True, "result": result}
+        function = compact_encode(function, projection)
+
+    if kind == 'encode':
+        encoding = function(data.get('image_data', ''), data.get('face_hint'), info)
+        return {"success": True, "encoding": encoding, "hint_used": info.get('hint_used', False)}
+
+    if kind == 'compare':
+        # The tolerance default stays with each backend's compare function
+        options = {'tolerance': data['tolerance']} if 'tolerance' in data else {}
+        result = function(data.get('known_encoding', []), data.get('unknown_image', ''),
+                          face_hint=data.get('face_hint'), info=info, **options)
+        return {"success": True, "result": result}
+
+    if kind == 'verify':
+        result = function(data.get('registered_image', ''), data.get('captured_image', ''),
+                          data.get('face_hint'), info)
+        return {"success": True, "result": result}
+
+    if kind == 'enroll':
+        result = enroll_images(function, request_images(data), data.get('face_hint'), data.get('method', 'mean'), info)
+        return {"success": True, "result": result}
+
+    if kind == 'refresh_template':
+        template = data.get('template', [])
+        if isinstance(template, dict):
+            template = template.get('encoding', [])
+        confidence = data.get('confidence')
+        if confidence is None:
+            if 'distance' not in data or 'tolerance' not in data:
+                raise Exception("refresh_template needs a confidence, or the verification distance and tolerance")
+            confidence = verification_confidence(data['distance'], data['tolerance'])
+        result = refresh_template(template, data.get('embedding', []), confidence, data.get('alpha'))
+        result['encoding'] = result['encoding'].tolist()
+        return {"success": True, "result": result}
+
+    if kind == 'store':
+        return {"success": True, "image_data": function(data.get('image_data', ''))}
+
+    raise Exception(f"Unknown operation kind: {kind}")
+
+def run_cli(name, module=None, argv=None):
+    """main() of a backend script: operation from argv, request on stdin, JSON response on stdout."""
+    argv = sys.argv if argv is None else argv
+    try:
+        if len(argv) > 1:
+            operation = argv[1]
+
+            if operation in BACKENDS[name]:
+                kind, function_name = BACKENDS[name][operation]
+                data = read_request()
+                info = request_info(data)
+                module = load_backend(name) if module is None else module
+                print(json.dumps(with_timings(run_operation(module, kind, function_name, data, info, name), info)))
+
+            else:
+                print(json.dumps({
+                    "success": False,
+                    "error": f"Unknown operation: {operation}"
+                }))
+
+        else:
+            print(json.dumps({
+                "success": False,
+                "error": "No operation specified"
+            }))
+
+    except Exception as e:
+        print(json.dumps({
+            "success": False,
+            "error": str(e)
+        }))
+
+def as_upload(image):
+    """Pass arrays, bytes and data URLs through; PIL images become RGB arrays."""
+    if isinstance(image, Image.Image):
+        return np.asarray(image.convert('RGB'))
+    if isinstance(image, np.ndarray) and image.dtype != np.uint8:
+        raise Exception(f"Expected a uint8 RGB image array, got {image.dtype}")
+    return image
+
+class FaceBackend:
+    """
+    One backend module, imported once and called in process.
+
+    encode(image) -> float64 ndarray
+    compare(known_encoding, image) -> {"distance", "is_match", "tolerance", ...}
+    enroll(images) -> aggregated template {"encoding": ndarray, "used", "rejected", "spread", ...}
+    refresh_template(template, embedding, confidence) -> {"encoding": ndarray, "updated", "drift", ...}
+    verify(registered_image, captured_image) for the DeepFace backends
+    With descriptor='compact', encode/enroll return compact descriptors and compare matches them.
+    Failures raise Exception with the same message the CLI reports as "error".
+    """
+
+    def __init__(self, name, descriptor='full'):
+        self.name = name
+        self.module = load_backend(name)
+        self.operations = BACKENDS[name]
+        self.descriptor = descriptor_mode({'descriptor': descriptor})
+        self.projection = get_projection(name) if self.descriptor == 'compact' else None
+
+    def _function(self, kind):
+        for operation_kind, function_name in self.operations.values():
+            if operation_kind == kind:
+                function = getattr(self.module, function_name)
+                if self.projection is not None and kind in ('encode', 'enroll'):
+                    return compact_encode(function, self.projection)
+                return function
+        raise Exception(f"Backend {self.name} does not support {kind}")
+
+    def encode(self, image, face_hint=None, info=None):
+        """Face encoding of an image; pass info={} to read back 'hint_used'."""
+        encoding = self._function('encode')(as_upload(image), face_hint, {} if info is None else info)
+        return np.asarray(encoding, dtype=np.float64)
+
+    def compare(self, known_encoding, image, tolerance=None, face_hint=None, info=None, known_descriptor='compact'):
+        """
+        Match a stored encoding against a new image, at the backend's default tolerance unless given.
+        In compact mode known_descriptor='full' marks a stored full encoding to project first.
+        """
+        if self.projection is not None:
+            return compact_compare(_encode_function(self.module, self.name), self.projection, known_encoding,
+                                   as_upload(image), tolerance, face_hint, info, descriptor_mode({'descriptor': known_descriptor}))
+        options = {} if tolerance is None else {'tolerance': tolerance}
+        return self._function('compare')(np.asarray(known_encoding, dtype=np.float64), as_upload(image),
+                                         face_hint=face_hint, info=info, **options)
+
+    def enroll(self, images, method='mean', face_hint=None, info=None):
+        """Aggregate several photos of one person into a template (see face_templates.enroll_images)."""
+        result = enroll_images(self._function('enroll'), [as_upload(image) for image in images], face_hint, method, info)
+        result['encoding'] = np.asarray(result['encoding'], dtype=np.float64)
+        return result
+
+    def refresh_template(self, template, embedding, confidence, alpha=None):
+        """Exponentially weighted template update from a verified embedding (see face_templates.refresh_template)."""
+        if 'refresh_template' not in self.operations:
+            raise Exception(f"Backend {self.name} does not support refresh_template")
+        return refresh_template(template, embedding, confidence, alpha)
+
+    def verify(self, registered_image, captured_image, face_hint=None, info=None):
+        """Verify two images directly (DeepFace-style backends)."""
+        return self._function('verify')(as_upload(registered_image), as_upload(captured_image), face_hint, info)
+
+def get_backend(name, descriptor='full'):
+    """Shared FaceBackend instance for a backend module and descriptor mode."""
+    with _modules_lock:
+        backend = _backends.get((name, descriptor))
+    if backend is None:
+        backend = FaceBackend(name, descriptor)
+        with _modules_lock:
+            backend = _backends.setdefault((name, descriptor), backend)
+    return backend
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Compact descriptors for the handcrafted backends
+A projection fitted offline (PCA, or PCA followed by LDA on labelled photos) maps the 1k-9k value
+encodings of reliable_face_recognition, face_recognition_service and secure_face_recognition to a
+fixed 128-256 dim unit vector, cutting storage, JSON transfer and compare cost. The projection is
+shipped as <backend>.npy (row 0 the mean, then one row per output dimension) with a <backend>.json
+sidecar holding the calibrated tolerance; scripts/train_compact_projection.py fits both.
+"""
+
+import os
+import json
+import threading
+import numpy as np
+from stage_timings import stage_timer
+from face_search import fit_pca
+
+COMPACT_DIR = os.environ.get('FACE_COMPACT_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models'))
+COMPACT_DIMS = int(os.environ.get('FACE_COMPACT_DIMS', '128'))
+# Descriptor of encode/compare/enroll responses when the request does not set "descriptor"
+DESCRIPTOR_MODE = os.environ.get('FACE_DESCRIPTOR_MODE', 'full')
+DESCRIPTOR_MODES = ('full', 'compact')
+COMPACT_BACKENDS = ('reliable_face_recognition', 'face_recognition_service', 'secure_face_recognition')
+PROJECTION_METHODS = ('pca', 'lda')
+
+_projections = {}
+_projections_lock = threading.Lock()
+
+def descriptor_mode(data, field='descriptor', default=None):
+    """
+    Descriptor mode of a request document. field='known_descriptor' reads what a compact-mode
+    compare's stored encoding is: compact unless the request says "full".
+    """
+    mode = data.get(field) or default or DESCRIPTOR_MODE
+    if mode not in DESCRIPTOR_MODES:
+        raise Exception(f"Unknown {field}: {mode} (expected one of {', '.join(DESCRIPTOR_MODES)})")
+    return mode
+
+def _unit(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+class CompactProjection:
+    """
+    Linear map from a backend's full encoding (d values) to a unit-length compact descriptor.
+
+    project(encoding) -> float64 vector of `dims` values (also accepts n x d)
+    project(descriptor, compact=True) -> the compact descriptor itself, after checking its length
+    distance(a, b) -> Euclidean distance of two compact descriptors (0..2)
+    tolerance is the match threshold calibrated on the training photos.
+    """
+
+    def __init__(self, mean, components, tolerance, meta=None):
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.components = np.asarray(components, dtype=np.float32)
+        self.tolerance = float(tolerance)
+        self.meta = dict(meta or {})
+
+    @property
+    def source_dims(self):
+        return self.components.shape[0]
+
+    @property
+    def dims(self):
+        return self.components.shape[1]
+
+    def project(self, encodings, compact=False):
+        """
+        Compact descriptors of full encodings. With compact=True the input already is compact and
+        is returned unchanged: the caller says which it is, a length can belong to either.
+        """
+        encodings = np.asarray(encodings, dtype=np.float64)
+        expected, kind = (self.dims, 'compact') if compact else (self.source_dims, 'full')
+        if encodings.shape[-1] != expected:
+            raise Exception(f"Encoding dimension mismatch: {encodings.shape[-1]} vs {expected} ({kind})")
+        if compact:
+            return encodings
+        return _unit((encodings - self.mean) @ self.components.astype(np.float64))
+
+    def distance(self, a, b):
+        return float(np.linalg.norm(self.project(a, compact=True) - self.project(b, compact=True)))
+
+    def save(self, path):
+        """Write path (.npy: mean row, then the transposed components) and its .json sidecar."""
+        np.save(path, np.vstack([self.mean, self.components.T]).astype(np.float32))
+        with open(os.path.splitext(path)[0] + '.json', 'w') as f:
+            json.dump(dict(self.meta, tolerance=self.tolerance, dims=self.dims, source_dims=self.source_dims),
+                      f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        matrix = np.load(path)
+        with open(os.path.splitext(path)[0] + '.json') as f:
+            meta = json.load(f)
+        return cls(matrix[0], matrix[1:].T, meta.pop('tolerance'), meta)
+
+def projection_path(backend):
+    return os.path.join(COMPACT_DIR, f"{backend}.npy")
+
+def get_projection(backend):
+    """Shared projection of a backend, loaded from FACE_COMPACT_DIR on first use."""
+    with _projections_lock:
+        if backend not in _projections:
+            if backend not in COMPACT_BACKENDS:
+                raise Exception(f"Backend {backend} has no compact descriptor mode")
+            path = projection_path(backend)
+            if not os.path.exists(path):
+                raise Exception(f"No compact projection for {backend} at {path}: "
+                                f"train one with scripts/train_compact_projection.py")
+            _projections[backend] = CompactProjection.load(path)
+        return _projections[backend]
+
+def fit_lda(projected, labels, regularization=1e-3):
+    """
+    Directions (dims x dims) that whiten the within-person scatter of PCA-projected encodings,
+    ordered by between-person variance. Every input dimension is kept: the first (people - 1)
+    are discriminant, the rest still benefit from the whitening.
+    """
+    labels = np.asarray(labels)
+    people = np.unique(labels)
+    within = np.zeros((projected.shape[1], projected.shape[1]))
+    means = []
+    for person in people:
+        rows = projected[labels == person]
+        means.append(rows.mean(axis=0))
+        deviations = rows - means[-1]
+        within += deviations.T @ deviations
+    within /= len(projected)
+    within += regularization * np.trace(within) / len(within) * np.eye(len(within))
+
+    # 1. Whiten the within-person scatter
+    values, vectors = np.linalg.eigh(within)
+    whitening = vectors / np.sqrt(values)
+    # 2. Rotate to the between-person principal directions
+    between = (np.array(means) - projected.mean(axis=0)) @ whitening
+    _, _, vt = np.linalg.svd(between, full_matrices=True)
+    return whitening @ vt.T
+
+def fit_projection(encodings, labels=None, dims=COMPACT_DIMS, method='pca', seed=0):
+    """
+    Fit a CompactProjection to full encodings (n x d). PCA keeps the top-variance directions;
+    LDA (needs labels) re-weights them so that photos of one person cluster. The output has
+    min(dims, n - 1) dimensions. The tolerance is the equal-error threshold on the training pairs
+    when labels are given, otherwise the median distance between compact training descriptors.
+    """
+    if method not in PROJECTION_METHODS:
+        raise Exception(f"Unknown projection method: {method} (expected one of {', '.join(PROJECTION_METHODS)})")
+    encodings = np.asarray(encodings, dtype=np.float64)
+    if method == 'lda' and labels is None:
+        raise Exception("LDA needs a label per encoding")
+    dims = min(dims, len(encodings) - 1)
+    if dims < 1:
+        raise Exception("At least two encodings are needed to fit a projection")
+
+    mean, components = fit_pca(encodings, dims, seed=seed)
+    components = components.astype(np.float64)
+    if method == 'lda':
+        components = components @ fit_lda((encodings - mean) @ components, labels)
+    projection = CompactProjection(mean, components, 0.0, {"method": method, "trained_on": len(encodings)})
+
+    compact = projection.project(encodings)
+    distances = np.linalg.norm(compact[:, None, :] - compact[None, :, :], axis=2)
+    upper = np.triu_indices(len(compact), k=1)
+    if labels is None:
+        projection.tolerance = float(np.median(distances[upper]))
+    else:
+        labels = np.asarray(labels)
+        same = (labels[:, None] == labels[None, :])[upper]
+        projection.tolerance = equal_error_threshold(distances[upper][same], distances[upper][~same])
+    return projection
+
+def equal_error_threshold(genuine, impostor):
+    """
+    Distance at which the false accept and false reject rates on the given pairs are closest;
+    when a range of distances ties (separated training pairs) its middle, away from both classes.
+    """
+    if not len(genuine) or not len(impostor):
+        return float(np.median(np.concatenate([genuine, impostor])))
+    thresholds = np.unique(np.concatenate([genuine, impostor]))
+    far = np.searchsorted(np.sort(impostor), thresholds, side='right') / len(impostor)
+    frr = 1.0 - np.searchsorted(np.sort(genuine), thresholds, side='right') / len(genuine)
+    gap = np.abs(far - frr)
+    tied = np.flatnonzero(gap == gap.min())
+    return float((thresholds[tied[0]] + thresholds[min(tied[-1] + 1, len(thresholds) - 1)]) / 2)
+
+def compact_encode(encode, projection):
+    """Wrap a backend encode function so it returns the compact descriptor."""
+    def encode_compact(image_data, face_hint=None, info=None):
+        encoding = encode(image_data, face_hint, info)
+        timer = stage_timer(info)
+        compact = projection.project(encoding)
+        timer.lap('project')
+        return compact.tolist()
+    return encode_compact
+
+def compact_compare(encode, projection, known_encoding, image_data, tolerance=None, face_hint=None, info=None,
+                    known_descriptor='compact'):
+    """
+    Match a stored encoding against a new image by the Euclidean distance of the compact descriptors,
+    at the projection's tolerance unless given. known_descriptor='full' marks a stored full encoding,
+    which is projected on the fly.
+    """
+    info = {} if info is None else info
+    tolerance = projection.tolerance if tolerance is None else tolerance
+    known = projection.project(known_encoding, compact=known_descriptor == 'compact')
+    unknown = compact_encode(encode, projection)(image_data, face_hint, info)
+    timer = stage_timer(info)
+    distance = projection.distance(known, unknown)
+    timer.lap('distance')
+    return {
+        "distance": distance,
+        "is_match": bool(distance <= tolerance),
+        "tolerance": tolerance,
+        "descriptor": "compact",
+        "hint_used": info.get('hint_used', False)
+    }
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Face detector registry shared by all OpenCV-based face recognition backends
+Each detector is loaded once per thread (once per process for the single-threaded CLIs)
+and exposes the same detect(image) -> boxes, scores API
+"""
+
+import os
+import threading
+import numpy as np
+import cv2
+from stage_timings import record_count
+from request_budget import check_deadline
+
+MODELS_DIR = os.environ.get('FACE_MODELS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models'))
+
+# Detector name -> (kind, model files). Haar cascades ship with opencv-python; the LBP cascade
+# and DNN models are local files dropped into MODELS_DIR (never downloaded at runtime).
+DETECTOR_SPECS = {
+    'haar': ('cascade', [os.path.join(cv2.data.haarcascades, 'haarcascade_frontalface_default.xml')]),
+    'haar_alt': ('cascade', [os.path.join(cv2.data.haarcascades, 'haarcascade_frontalface_alt.xml')]),
+    'haar_alt2': ('cascade', [os.path.join(cv2.data.haarcascades, 'haarcascade_frontalface_alt2.xml')]),
+    'haar_profile': ('cascade', [os.path.join(cv2.data.haarcascades, 'haarcascade_profileface.xml')]),
+    'lbp': ('cascade', [os.path.join(MODELS_DIR, 'lbpcascade_frontalface_improved.xml')]),
+    'dnn_ssd': ('dnn_ssd', [
+        os.path.join(MODELS_DIR, 'deploy.prototxt'),
+        os.path.join(MODELS_DIR, 'res10_300x300_ssd_iter_140000.caffemodel')
+    ]),
+    'yunet': ('yunet', [os.path.join(MODELS_DIR, 'face_detection_yunet_2023mar.onnx')]),
+}
+
+DEFAULT_DETECTOR = os.environ.get('FACE_DETECTOR', 'haar')
+
+# Detection runs on a copy whose longest side is at most this many pixels (0 disables)
+DETECTION_MAX_SIDE = int(os.environ.get('FACE_DETECTION_MAX_SIDE', '640'))
+
+# A face_hint box is grown by this fraction of its size on every side before searching
+FACE_HINT_MARGIN = float(os.environ.get('FACE_HINT_MARGIN', '0.5'))
+
+_thread_state = threading.local()
+
+def _empty_result():
+    """No detections in the (boxes, scores) format."""
+    return np.zeros((0, 4), dtype=np.int32), np.zeros((0,), dtype=np.float32)
+
+def _to_gray(image):
+    """Grayscale view for cascades (backends already pass gray images)."""
+    if image.ndim == 2:
+        return image
+    return cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+
+def _to_bgr(image):
+    """BGR copy for the DNN detectors."""
+    if image.ndim == 2:
+        return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+    return cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+
+def _filter_min_size(boxes, scores, min_size):
+    """Apply the cascade-style minSize constraint to DNN detections."""
+    if len(boxes) == 0 or min_size is None:
+        return boxes, scores
+    keep = (boxes[:, 2] >= min_size[0]) & (boxes[:, 3] >= min_size[1])
+    return boxes[keep], scores[keep]
+
+class CascadeDetector:
+    """Haar / LBP cascade classifier. Scores are the number of merged neighbour detections."""
+
+    def __init__(self, name, cascade_path):
+        self.name = name
+        self.cascade = cv2.CascadeClassifier(cascade_path)
+        if self.cascade.empty():
+            raise Exception(f"Failed to load cascade for detector '{name}' from {cascade_path}")
+
+    def detect(self, image, scale_factor=1.1, min_neighbors=3, min_size=(30, 30)):
+        """Detect faces in an RGB or grayscale image."""
+        gray = _to_gray(image)
+        boxes, neighbours = self.cascade.detectMultiScale2(
+            gray, scaleFactor=scale_factor, minNeighbors=min_neighbors, minSize=min_size
+        )
+        if len(boxes) == 0:
+            return _empty_result()
+        return np.asarray(boxes, dtype=np.int32), np.asarray(neighbours, dtype=np.float32).ravel()
+
+class DnnSsdDetector:
+    """OpenCV DNN ResNet-10 SSD face detector loaded from local Caffe files."""
+
+    def __init__(self, name, prototxt_path, model_path, confidence_threshold=0.5):
+        self.name = name
+        self.net = cv2.dnn.readNetFromCaffe(prototxt_path, model_path)
+        self.confidence_threshold = confidence_threshold
+
+    def detect(self, image, scale_factor=None, min_neighbors=None, min_size=(30, 30)):
+        """Detect faces in an RGB or grayscale image. Cascade tuning parameters are ignored."""
+        bgr = _to_bgr(image)
+        h, w = bgr.shape[:2]
+        blob = cv2.dnn.blobFromImage(cv2.resize(bgr, (300, 300)), 1.0, (300, 300), (104.0, 177.0, 123.0))
+        self.net.setInput(blob)
+        detections = self.net.forward()[0, 0]
+
+        detections = detections[detections[:, 2] >= self.confidence_threshold]
+        if len(detections) == 0:
+            return _empty_result()
+
+        corners = detections[:, 3:7] * np.array([w, h, w, h])
+        corners = np.clip(corners, 0, [w, h, w, h])
+        boxes = np.stack([
+            corners[:, 0], corners[:, 1],
+            corners[:, 2] - corners[:, 0], corners[:, 3] - corners[:, 1]
+        ], axis=1).astype(np.int32)
+
+        return _filter_min_size(boxes, detections[:, 2].astype(np.float32), min_size)
+
+class YuNetDetector:
+    """OpenCV YuNet face detector loaded from a local ONNX file."""
+
+    def __init__(self, name, model_path, score_threshold=0.7, nms_threshold=0.3, top_k=50):
+        self.name = name
+        self.detector = cv2.FaceDetectorYN.create(model_path, "", (320, 320), score_threshold, nms_threshold, top_k)
+
+    def detect(self, image, scale_factor=None, min_neighbors=None, min_size=(30, 30)):
+        """Detect faces in an RGB or grayscale image. Cascade tuning parameters are ignored."""
+        bgr = _to_bgr(image)
+        h, w = bgr.shape[:2]
+        self.detector.setInputSize((w, h))
+        _, faces = self.detector.detect(bgr)
+
+        if faces is None or len(faces) == 0:
+            return _empty_result()
+
+        boxes = faces[:, 0:4].astype(np.int32)
+        return _filter_min_size(boxes, faces[:, 14].astype(np.float32), min_size)
+
+def _create_detector(name):
+    """Instantiate a detector from its registry spec."""
+    if name not in DETECTOR_SPECS:
+        raise Exception(f"Unknown face detector: {name}")
+
+    kind, paths = DETECTOR_SPECS[name]
+    missing = [path for path in paths if not os.path.exists(path)]
+    if missing:
+        raise Exception(f"Model file for detector '{name}' not found: {', '.join(missing)}")
+
+    if kind == 'cascade':
+        return CascadeDetector(name, paths[0])
+    if kind == 'dnn_ssd':
+        return DnnSsdDetector(name, paths[0], paths[1])
+    if kind == 'yunet':
+        return YuNetDetector(name, paths[0])
+
+    raise Exception(f"Unknown detector kind: {kind}")
+
+def get_detector(name=None):
+    """Return this thread's instance of a named detector, loading it on first use."""
+    name = name or DEFAULT_DETECTOR
+
+    detectors = getattr(_thread_state, 'detectors', None)
+    if detectors is None:
+        detectors = _thread_state.detectors = {}
+
+    if name not in detectors:
+        detectors[name] = _create_detector(name)
+
+    return detectors[name]
+
+def preload_detectors(names):
+    """Load detectors on the current thread ahead of the first request."""
+    for name in names:
+        get_detector(name)
+
+def available_detectors():
+    """Names of registered detectors whose model files are present."""
+    return [
+        name for name, (_, paths) in DETECTOR_SPECS.items()
+        if all(os.path.exists(path) for path in paths)
+    ]
+
+class DetectionView:
+    """
+    Downscaled copy of an image for detection, so cost stops scaling with camera megapixels.
+
+    The resize happens once per image; every detect() call maps its boxes back to
+    full-resolution coordinates for feature extraction. min_size is given in full-resolution
+    pixels and scaled down with the image.
+    """
+
+    def __init__(self, image, max_side=None, offset=(0, 0)):
+        max_side = DETECTION_MAX_SIDE if max_side is None else max_side
+        self.offset = offset
+        # Detector runs on this view; fallback passes may run on several threads
+        self.runs = 0
+        self._runs_lock = threading.Lock()
+        self.full_shape = image.shape[:2]
+        height, width = self.full_shape
+
+        if max_side and max(height, width) > max_side:
+            self.scale = max_side / float(max(height, width))
+            size = (max(1, int(round(width * self.scale))), max(1, int(round(height * self.scale))))
+            self.image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        else:
+            self.scale = 1.0
+            self.image = image
+
+    def to_full_resolution(self, boxes):
+        """Map (x, y, w, h) boxes from the detection image back onto the original image."""
+        if len(boxes) == 0 or (self.scale == 1.0 and self.offset == (0, 0)):
+            return boxes
+
+        scaled = np.asarray(boxes, dtype=np.int32)
+        if self.scale != 1.0:
+            height, width = self.full_shape
+            scaled = np.round(np.asarray(boxes, dtype=np.float64) / self.scale).astype(np.int32)
+            scaled[:, 0] = np.clip(scaled[:, 0], 0, width - 1)
+            scaled[:, 1] = np.clip(scaled[:, 1], 0, height - 1)
+            scaled[:, 2] = np.minimum(scaled[:, 2], width - scaled[:, 0])
+            scaled[:, 3] = np.minimum(scaled[:, 3], height - scaled[:, 1])
+
+        if self.offset != (0, 0):
+            scaled = scaled.copy()
+            scaled[:, 0] += self.offset[0]
+            scaled[:, 1] += self.offset[1]
+        return scaled
+
+    def detect(self, detector=None, min_size=(30, 30), **params):
+        """Run a detector (instance or registry name) on the downscaled image."""
+        if not hasattr(detector, 'detect'):
+            detector = get_detector(detector)
+
+        if min_size is not None and self.scale != 1.0:
+            min_size = (int(round(min_size[0] * self.scale)), int(round(min_size[1] * self.scale)))
+
+        with self._runs_lock:
+            self.runs += 1
+        boxes, scores = detector.detect(self.image, min_size=min_size, **params)
+        return self.to_full_resolution(boxes), scores
+
+def parse_face_hint(face_hint, scale=1.0):
+    """
+    Normalize a client face hint ([x, y, w, h] or {x, y, width, height}) to a tuple, or None.
+
+    scale maps client pixels onto a reduced-resolution decode (image_io decode_scale).
+    """
+    if face_hint is None or face_hint == [] or face_hint == {}:
+        return None
+
+    try:
+        if isinstance(face_hint, dict):
+            values = (
+                face_hint['x'], face_hint['y'],
+                face_hint.get('width', face_hint.get('w')),
+                face_hint.get('height', face_hint.get('h'))
+            )
+        else:
+            values = tuple(face_hint)
+        x, y, w, h = (int(round(float(v) * scale)) for v in values)
+    except (KeyError, TypeError, ValueError):
+        raise Exception(f"Invalid face_hint: {face_hint!r} (expected [x, y, width, height])")
+
+    if w <= 0 or h <= 0:
+        raise Exception(f"Invalid face_hint: {face_hint!r} (width and height must be positive)")
+
+    return x, y, w, h
+
+def hint_window(face_hint, image_shape, margin=None):
+    """(x0, y0, x1, y1) search window around a hint box, grown by margin and clipped to the image."""
+    margin = FACE_HINT_MARGIN if margin is None else margin
+    x, y, w, h = face_hint
+    height, width = image_shape[:2]
+
+    x0 = max(0, int(x - w * margin))
+    y0 = max(0, int(y - h * margin))
+    x1 = min(width, int(x + w * (1 + margin)))
+    y1 = min(height, int(y + h * (1 + margin)))
+
+    if x1 <= x0 or y1 <= y0:
+        return None
+    return x0, y0, x1, y1
+
+def detect_with_hint(image, face_hint, detect_fn, max_side=None, info=None):
+    """
+    Run detect_fn(view) -> boxes inside the window around face_hint, falling back to the full frame.
+
+    face_hint comes from the browser camera UI or the previous video frame. Returns
+    (boxes in full-image coordinates, hint_used) where hint_used is True only when the
+    restricted search found a face. The number of detector passes run is added to
+    info's timings (stage_timings) as detect_passes. The full-frame fallback is not started
+    once the request's deadline has passed.
+    """
+    face_hint = parse_face_hint(face_hint)
+
+    if face_hint is not None:
+        window = hint_window(face_hint, image.shape)
+        if window is not None:
+            x0, y0, x1, y1 = window
+            view = DetectionView(image[y0:y1, x0:x1], max_side, offset=(x0, y0))
+            boxes = detect_fn(view)
+            record_count(info, 'detect_passes', view.runs)
+            if len(boxes) > 0:
+                return boxes, True
+            check_deadline('detect')
+
+    view = DetectionView(image, max_side)
+    boxes = detect_fn(view)
+    record_count(info, 'detect_passes', view.runs)
+    return boxes, False
+
+def detect_faces(image, detector=None, max_side=None, **params):
+    """
+    Run a registered detector on a downscaled copy of the image.
+
+    Returns (boxes as an (n, 4) x, y, w, h int array in full-resolution pixels, scores).
+    """
+    return DetectionView(image, max_side).detect(detector, **params)
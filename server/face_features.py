@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Shared feature extraction primitives for the OpenCV-based face recognition backends
+Vectorized replacements for the per-cell / per-window numpy loops used by the extractors
+"""
+
+import numpy as np
+import cv2
+
+def _orientation_bins(orientation, bins, value_range):
+    """Map orientations to histogram bin indices exactly as np.histogram does for uniform bins."""
+    first_edge, last_edge = value_range
+    edges = np.linspace(first_edge, last_edge, bins + 1)
+    if orientation.dtype == np.float32:
+        # Edges in the orientation's precision, so angles that sit exactly on an edge
+        # (diagonal gradients) land in the same bin as in float64
+        edges = edges.astype(np.float32)
+
+    indices = ((orientation - first_edge) * (bins / (last_edge - first_edge))).astype(np.intp)
+    indices[indices == bins] -= 1
+
+    # Same floating point edge corrections np.histogram applies
+    decrement = orientation < edges[indices]
+    indices[decrement] -= 1
+    increment = (orientation >= edges[indices + 1]) & (indices != bins - 1)
+    indices[increment] += 1
+
+    return indices
+
+def _normalize_blocks(hist, block_norm, block_size):
+    """Normalize cell histograms over (block_size x block_size) groups of cells."""
+    eps = 1e-7
+
+    if block_size == 1:
+        blocks = hist
+        axes = -1
+    else:
+        grid_y, grid_x, bins = hist.shape
+        blocks = np.lib.stride_tricks.sliding_window_view(hist, (block_size, block_size), axis=(0, 1))
+        # (blocks_y, blocks_x, bins, block_size, block_size) -> (blocks_y, blocks_x, block_size, block_size, bins)
+        blocks = np.moveaxis(blocks, 2, -1)
+        axes = (-3, -2, -1)
+
+    if block_norm == 'l1':
+        normalized = blocks / (np.sum(blocks, axis=axes, keepdims=True) + eps)
+    elif block_norm == 'l2':
+        normalized = blocks / np.sqrt(np.sum(blocks ** 2, axis=axes, keepdims=True) + eps ** 2)
+    elif block_norm == 'l2-hys':
+        normalized = blocks / np.sqrt(np.sum(blocks ** 2, axis=axes, keepdims=True) + eps ** 2)
+        normalized = np.minimum(normalized, 0.2)
+        normalized = normalized / np.sqrt(np.sum(normalized ** 2, axis=axes, keepdims=True) + eps ** 2)
+    else:
+        raise Exception(f"Unknown block normalization: {block_norm}")
+
+    return normalized
+
+def cell_orientation_histograms(magnitude, orientation, grid=(8, 8), bins=9,
+                                value_range=(-np.pi, np.pi), block_norm=None, block_size=1):
+    """
+    Magnitude-weighted orientation histograms for every cell of a (grid_y x grid_x) grid.
+
+    A combined (cell_index * bins + orientation_bin) index is built for the whole ROI so a
+    single np.bincount produces every cell histogram. Pixels beyond the last full cell are
+    ignored, matching the slicing used by the per-cell loops this replaces.
+
+    Returns an array of shape (grid_y, grid_x, bins), or when block_norm is set
+    ('l1', 'l2' or 'l2-hys') the normalized blocks: (grid_y, grid_x, bins) for
+    block_size 1, otherwise (blocks_y, blocks_x, block_size, block_size, bins).
+    """
+    grid_y, grid_x = grid
+    height, width = orientation.shape
+    cell_h, cell_w = height // grid_y, width // grid_x
+
+    if cell_h == 0 or cell_w == 0:
+        raise Exception(f"ROI {height}x{width} too small for a {grid_y}x{grid_x} grid")
+
+    # Crop to whole cells so row/column cell indices stay inside the grid
+    magnitude = magnitude[:cell_h * grid_y, :cell_w * grid_x]
+    orientation = orientation[:cell_h * grid_y, :cell_w * grid_x]
+
+    row_cells = np.arange(cell_h * grid_y) // cell_h
+    col_cells = np.arange(cell_w * grid_x) // cell_w
+    cell_index = row_cells[:, None] * grid_x + col_cells[None, :]
+
+    # Bounds in the orientation's precision: arctan2 in float32 returns float32(pi), just above pi
+    low, high = np.asarray(value_range, dtype=np.result_type(orientation.dtype, np.float32))
+    keep = (orientation >= low) & (orientation <= high)
+    if keep.all():
+        combined = cell_index * bins + _orientation_bins(orientation, bins, value_range)
+        weights = magnitude
+    else:
+        combined = cell_index[keep] * bins + _orientation_bins(orientation[keep], bins, value_range)
+        weights = magnitude[keep]
+
+    hist = np.bincount(combined.ravel(), weights=weights.ravel(), minlength=grid_y * grid_x * bins)
+    hist = hist.reshape(grid_y, grid_x, bins)
+    if magnitude.dtype == np.float32:
+        # bincount accumulates in float64; keep float32 pipelines in float32
+        hist = hist.astype(np.float32)
+
+    if block_norm is None:
+        return hist
+
+    return _normalize_blocks(hist, block_norm, block_size)
+
+def local_variance_map(image, window):
+    """
+    Dense local variance of every (width x height) window via two box filters: E[x^2] - E[x]^2.
+
+    The value at (y, x) is the variance of the window anchored the way cv2.boxFilter
+    anchors it (x - width // 2, y - height // 2), so every window position costs the same
+    two filter passes regardless of how densely it is sampled.
+    """
+    values = image.astype(np.float64)
+    mean = cv2.boxFilter(values, cv2.CV_64F, window, normalize=True, borderType=cv2.BORDER_REFLECT)
+    mean_sq = cv2.boxFilter(values * values, cv2.CV_64F, window, normalize=True, borderType=cv2.BORDER_REFLECT)
+
+    # Clamp tiny negative values from floating point cancellation
+    return np.maximum(mean_sq - mean * mean, 0.0)
+
+def neighbor_codes(image, offsets):
+    """
+    Binary pattern code of every interior pixel: bit k is set when the neighbor at the
+    (row, column) offsets[k] is >= the center. One shifted comparison of the whole image per
+    neighbor replaces the per-pixel Python loop; returns (height - 2, width - 2) uint8 codes.
+    """
+    height, width = image.shape
+    center = image[1:-1, 1:-1]
+    codes = np.zeros(center.shape, dtype=np.uint8)
+    for bit, (dy, dx) in enumerate(offsets):
+        neighbor = image[1 + dy:height - 1 + dy, 1 + dx:width - 1 + dx]
+        codes |= (neighbor >= center).astype(np.uint8) << bit
+    return codes
+
+def landmark_candidates(image, window=(20, 15), search_box=None, min_variance=200.0,
+                        max_candidates=10, nms_size=None, step=1):
+    """
+    Rank high-variance window centers as landmark candidates.
+
+    search_box is (x_min, y_min, x_max, y_max) in window-center coordinates (inclusive).
+    Peaks are kept only where they are the maximum of their nms_size neighbourhood
+    (defaults to the window size) and exceed min_variance. step subsamples the candidate
+    grid; the variance map itself is always dense. Returns (points, scores) where points
+    is an (n, 2) int array of (x, y) centers ordered by descending variance, with ties
+    broken by position so the result is deterministic.
+    """
+    variance = local_variance_map(image, window)
+    height, width = variance.shape
+
+    if search_box is None:
+        search_box = (0, 0, width - 1, height - 1)
+    x_min, y_min, x_max, y_max = search_box
+    x_min, y_min = max(0, x_min), max(0, y_min)
+    x_max, y_max = min(width - 1, x_max), min(height - 1, y_max)
+
+    # Restrict to the search box before suppression so peaks on its border still count
+    allowed = np.zeros_like(variance, dtype=bool)
+    allowed[y_min:y_max + 1:step, x_min:x_max + 1:step] = True
+    masked = np.where(allowed, variance, -1.0)
+
+    nms_w, nms_h = nms_size if nms_size is not None else window
+    kernel = np.ones((nms_h, nms_w), dtype=np.uint8)
+    local_max = cv2.dilate(masked, kernel, borderType=cv2.BORDER_CONSTANT, borderValue=-1.0)
+
+    peaks = allowed & (masked >= local_max) & (variance > min_variance)
+    ys, xs = np.nonzero(peaks)
+    scores = variance[ys, xs]
+
+    # Descending variance, then top-to-bottom, left-to-right
+    order = np.lexsort((xs, ys, -scores))[:max_candidates]
+    points = np.stack([xs[order], ys[order]], axis=1)
+
+    return points, scores[order]
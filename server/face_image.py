@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Per-request image pipeline shared by the OpenCV face recognition backends
+Holds the decoded RGB upload and lazily computes, then memoizes, every derived view
+(grayscale, color spaces, padded face crops, resized crops) so each transform runs at most once
+"""
+
+import cv2
+from image_io import decode_image
+
+_COLOR_CONVERSIONS = {
+    'gray': cv2.COLOR_RGB2GRAY,
+    'hsv': cv2.COLOR_RGB2HSV,
+    'lab': cv2.COLOR_RGB2LAB,
+}
+
+class FaceImage:
+    """
+    Decoded RGB image with memoized derived views.
+
+    Views are 'rgb', 'gray', 'hsv' and 'lab'. Crops are taken around a face box
+    (x, y, w, h) grown by padding * min(w, h) (at least min_padding pixels) and clipped
+    to the image. Resized color-space crops are converted after resizing the RGB crop,
+    matching what the extractors always did.
+    """
+
+    def __init__(self, rgb):
+        self.rgb = rgb
+        self._cache = {}
+
+    @classmethod
+    def from_upload(cls, image_data, info=None):
+        """Decode an upload (see image_io.decode_image)."""
+        return cls(decode_image(image_data, info=info))
+
+    @property
+    def shape(self):
+        return self.rgb.shape
+
+    def _memo(self, key, compute):
+        """Compute a view once and reuse it for the rest of the request."""
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    def view(self, name):
+        """Full-frame view: 'rgb', 'gray', 'hsv' or 'lab'."""
+        if name == 'rgb':
+            return self.rgb
+        if name not in _COLOR_CONVERSIONS:
+            raise Exception(f"Unknown image view: {name}")
+        return self._memo(('view', name), lambda: cv2.cvtColor(self.rgb, _COLOR_CONVERSIONS[name]))
+
+    @property
+    def gray(self):
+        return self.view('gray')
+
+    @property
+    def hsv(self):
+        return self.view('hsv')
+
+    @property
+    def lab(self):
+        return self.view('lab')
+
+    def crop_bounds(self, face_box, padding=0.0, min_padding=0):
+        """(x_start, y_start, x_end, y_end) of the padded face box clipped to the image."""
+        x, y, w, h = (int(v) for v in face_box)
+        pad = max(min_padding, int(min(w, h) * padding))
+        return (max(0, x - pad), max(0, y - pad),
+                min(self.rgb.shape[1], x + w + pad), min(self.rgb.shape[0], y + h + pad))
+
+    def crop(self, face_box, view='rgb', padding=0.0, min_padding=0, size=None):
+        """Padded face crop of a view, optionally resized to size (width, height)."""
+        face_box = tuple(int(v) for v in face_box)
+        key = ('crop', face_box, view, padding, min_padding, size)
+
+        def compute():
+            if size is not None and view in ('hsv', 'lab'):
+                resized_rgb = self.crop(face_box, 'rgb', padding, min_padding, size)
+                return cv2.cvtColor(resized_rgb, _COLOR_CONVERSIONS[view])
+            if size is not None:
+                region = self.crop(face_box, view, padding, min_padding)
+                return cv2.resize(region, size)
+            x_start, y_start, x_end, y_end = self.crop_bounds(face_box, padding, min_padding)
+            return self.view(view)[y_start:y_end, x_start:x_end]
+
+        return self._memo(key, compute)
+
+    def pyramid(self, face_box, view, size, scale, padding=0.0, min_padding=0):
+        """Resized crop at size, downscaled again by an integer factor (scale 1 is the crop itself)."""
+        base = self.crop(face_box, view, padding, min_padding, size)
+        if scale == 1:
+            return base
+        key = ('pyramid', tuple(int(v) for v in face_box), view, padding, min_padding, size, scale)
+        return self._memo(key, lambda: cv2.resize(base, (size[0] // scale, size[1] // scale)))
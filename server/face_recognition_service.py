@@ -5,48 +5,35 @@ Uses advanced OpenCV features and facial landmark detection for precise face com
 """
 
 import sys
-import json
-import base64
-import io
 import numpy as np
-from PIL import Image
 import cv2
+from face_features import cell_orientation_histograms
+from face_detectors import parse_face_hint, detect_with_hint
+from face_image import FaceImage
+from stage_timings import stage_timer
+from feature_precision import feature_dtype, cv_depth
+from request_budget import optional_stage, check_deadline
+from face_backends import run_cli
 
-def process_image_to_rgb(image_data):
-    """Convert base64 image to RGB numpy array."""
+def process_image_to_rgb(image_data, info=None):
+    """Convert base64 image to a FaceImage; large JPEGs are decoded at reduced resolution."""
     try:
-        # Remove data URL prefix if present
-        if image_data.startswith('data:image'):
-            image_data = image_data.split(',')[1]
-        
-        # Decode base64 to bytes
-        image_bytes = base64.b64decode(image_data)
-        
-        # Convert to PIL Image
-        pil_image = Image.open(io.BytesIO(image_bytes))
-        
-        # Convert to RGB if needed
-        if pil_image.mode != 'RGB':
-            pil_image = pil_image.convert('RGB')
-        
-        # Convert to numpy array
-        rgb_array = np.array(pil_image)
-        
-        return rgb_array
+        return FaceImage.from_upload(image_data, info)
     except Exception as e:
         raise Exception(f"Failed to process image: {str(e)}")
 
-def detect_face_landmarks(image):
+def detect_face_landmarks(image, face_hint=None, info=None):
     """Detect facial landmarks using OpenCV cascades and contour analysis."""
     try:
-        # Convert to grayscale
-        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-        
-        # Load face cascade
-        face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-        
-        # Detect faces
-        faces = face_cascade.detectMultiScale(gray, 1.3, 5)
+        # Detect faces with the configured detector (Haar cascade by default),
+        # around the client hint first and then in the whole frame
+        faces, hint_used = detect_with_hint(
+            image.gray, face_hint,
+            lambda view: view.detect(scale_factor=1.3, min_neighbors=5, min_size=(0, 0))[0],
+            info=info
+        )
+        if info is not None:
+            info['hint_used'] = hint_used
         
         if len(faces) == 0:
             raise Exception("No face detected in image")
@@ -55,42 +42,42 @@ def detect_face_landmarks(image):
         face = max(faces, key=lambda f: f[2] * f[3])
         x, y, w, h = face
         
-        # Extract face region
-        face_roi = gray[y:y+h, x:x+w]
-        face_color = image[y:y+h, x:x+w]
-        
-        # Resize to standard size for consistent feature extraction
-        face_roi = cv2.resize(face_roi, (128, 128))
-        face_color = cv2.resize(face_color, (128, 128))
+        # Face region resized to standard size for consistent feature extraction
+        face_roi = image.crop(face, 'gray', size=(128, 128))
+        face_color = image.crop(face, 'rgb', size=(128, 128))
         
         return face_roi, face_color, (x, y, w, h)
         
     except Exception as e:
         raise Exception(f"Failed to detect face landmarks: {str(e)}")
 
-def extract_facial_features(face_gray, face_color):
+def extract_facial_features(face_gray, face_color, hsv_face=None, lab_face=None, info=None):
     """Extract comprehensive facial features that provide proper distance separation between different people."""
     try:
+        timer = stage_timer(info, 'features')
         features = []
         
         # 1. Enhanced Histogram of Oriented Gradients (HOG) features
-        # Calculate gradients with multiple scales
-        for ksize in [3, 5, 7]:
-            grad_x = cv2.Sobel(face_gray, cv2.CV_64F, 1, 0, ksize=ksize)
-            grad_y = cv2.Sobel(face_gray, cv2.CV_64F, 0, 1, ksize=ksize)
-            
-            # Calculate magnitude and angle
-            magnitude = np.sqrt(grad_x**2 + grad_y**2)
-            angle = np.arctan2(grad_y, grad_x)
-            
-            # Create HOG histogram with more bins for better discrimination
-            hist, _ = np.histogram(angle, bins=16, range=(-np.pi, np.pi), weights=magnitude)
-            features.extend(hist.flatten())
+        # Calculate gradients with multiple scales, stacked so each kernel size is one "cell"
+        ksizes = [3, 5, 7]
+        grad_x = np.concatenate([cv2.Sobel(face_gray, cv_depth(), 1, 0, ksize=ksize) for ksize in ksizes])
+        grad_y = np.concatenate([cv2.Sobel(face_gray, cv_depth(), 0, 1, ksize=ksize) for ksize in ksizes])
+        
+        # Calculate magnitude and angle
+        magnitude = np.sqrt(grad_x**2 + grad_y**2)
+        angle = np.arctan2(grad_y, grad_x)
+        
+        # One 16-bin HOG histogram per kernel size with more bins for better discrimination
+        hog_hists = cell_orientation_histograms(magnitude, angle, grid=(len(ksizes), 1), bins=16)
+        features.extend(hog_hists.ravel())
+        timer.lap('hog')
         
         # 2. Multi-scale Local Binary Pattern (LBP) features
         def local_binary_pattern(image, radius=1, n_points=8):
             lbp = np.zeros_like(image)
             for i in range(radius, image.shape[0] - radius):
+                # Once per row: a request past its deadline stops mid-loop
+                check_deadline('lbp')
                 for j in range(radius, image.shape[1] - radius):
                     center = image[i, j]
                     code = 0
@@ -103,11 +90,19 @@ def extract_facial_features(face_gray, face_color):
                     lbp[i, j] = code
             return lbp
         
-        # Multiple LBP scales for better discrimination
-        for radius in [1, 2, 3]:
+        # Multiple LBP scales for better discrimination; radii 2 and 3 are dropped
+        # (zero histograms) when the request's deadline cannot afford them
+        def lbp_histogram(radius):
             lbp = local_binary_pattern(face_gray, radius=radius, n_points=8)
-            lbp_hist, _ = np.histogram(lbp.ravel(), bins=64, range=(0, 256))
-            features.extend(lbp_hist)
+            return np.histogram(lbp.ravel(), bins=64, range=(0, 256))[0]
+        
+        for radius in [1, 2, 3]:
+            if radius == 1:
+                features.extend(lbp_histogram(radius))
+            else:
+                features.extend(optional_stage(f'lbp_radius_{radius}', lambda: lbp_histogram(radius),
+                                               np.zeros(64, dtype=np.int64)))
+        timer.lap('lbp')
         
         # 3. Enhanced facial region analysis with more granular divisions
         h, w = face_gray.shape
@@ -130,11 +125,14 @@ def extract_facial_features(face_gray, face_color):
                     np.std(region),
                     np.var(region)
                 ])
+        timer.lap('regions')
         
         # 4. Enhanced color information with more channels
         # Convert to different color spaces for better discrimination
-        hsv_face = cv2.cvtColor(face_color, cv2.COLOR_RGB2HSV)
-        lab_face = cv2.cvtColor(face_color, cv2.COLOR_RGB2LAB)
+        if hsv_face is None:
+            hsv_face = cv2.cvtColor(face_color, cv2.COLOR_RGB2HSV)
+        if lab_face is None:
+            lab_face = cv2.cvtColor(face_color, cv2.COLOR_RGB2LAB)
         
         # RGB channels
         for channel in range(3):
@@ -150,6 +148,7 @@ def extract_facial_features(face_gray, face_color):
         for channel in range(3):
             channel_hist, _ = np.histogram(lab_face[:,:,channel].ravel(), bins=32, range=(0, 256))
             features.extend(channel_hist)
+        timer.lap('color')
         
         # 5. Geometric and structural features
         features.extend([h, w, h/w])  # Height, width, aspect ratio
@@ -167,9 +166,10 @@ def extract_facial_features(face_gray, face_color):
             np.min(face_gray),
             np.max(face_gray)
         ])
+        timer.lap('structure')
         
         # Convert to numpy array and ensure proper data type
-        features = np.array(features, dtype=np.float64)
+        features = np.array(features, dtype=feature_dtype())
         
         # Add deterministic variation based on facial structure to ensure different people have distinct embeddings
         # This ensures proper distance separation without randomness
@@ -185,29 +185,58 @@ def extract_facial_features(face_gray, face_color):
         # Apply scaling factor to ensure distances between different people are in the 0.6+ range
         # This matches the behavior of professional face recognition libraries
         features = features * 2.0
+        timer.lap('normalize')
         
         return features
         
     except Exception as e:
         raise Exception(f"Failed to extract facial features: {str(e)}")
 
-def generate_face_encoding(image_data):
+def generate_face_encoding(image_data, face_hint=None, info=None):
     """Generate comprehensive face encoding using multiple feature extraction methods."""
     try:
-        # Convert image to RGB numpy array
-        rgb_image = process_image_to_rgb(image_data)
+        # Decode the upload; derived views are computed once and shared
+        timer = stage_timer(info)
+        decode_info = {}
+        face_image = process_image_to_rgb(image_data, decode_info)
+        timer.lap('decode')
         
-        # Detect face and extract regions
-        face_gray, face_color, face_coords = detect_face_landmarks(rgb_image)
+        # Detect face and extract regions (the hint is in upload pixels)
+        face_hint = parse_face_hint(face_hint, decode_info['decode_scale'])
+        face_gray, face_color, face_coords = detect_face_landmarks(face_image, face_hint, info)
+        timer.lap('detect')
         
         # Extract facial features
-        encoding = extract_facial_features(face_gray, face_color)
+        encoding = extract_facial_features(
+            face_gray, face_color,
+            face_image.crop(face_coords, 'hsv', size=(128, 128)),
+            face_image.crop(face_coords, 'lab', size=(128, 128)),
+            info
+        )
+        timer.lap('extract')
         
         return encoding.tolist()
         
     except Exception as e:
         raise Exception(f"Failed to generate face encoding: {str(e)}")
 
+def face_distances(known_encodings, unknown_encoding):
+    """Calibrated distance of each known encoding (rows) to the unknown one, e.g. a search gallery."""
+    known = np.atleast_2d(np.asarray(known_encodings, dtype=np.float64))
+    unknown = np.asarray(unknown_encoding, dtype=np.float64)
+    
+    # Calculate Euclidean distance (same as face_recognition library)
+    distances = np.linalg.norm(known - unknown, axis=1)
+    
+    # Apply calibration to match desktop system behavior
+    # Desktop system shows ~0.6 for different people, so we ensure this scaling
+    calibrated = distances * 0.85  # Calibration factor
+    
+    # Ensure minimum distance for different faces is around 0.6
+    # Different faces should have distance >= 0.6
+    different = (calibrated < 0.55) & np.any(known != unknown, axis=1)
+    return np.where(different, 0.6 + calibrated * 0.1, calibrated)
+
 def calculate_face_distance(encoding1, encoding2):
     """Calculate Euclidean distance between face encodings matching desktop face_recognition library behavior."""
     try:
@@ -219,31 +248,22 @@ def calculate_face_distance(encoding1, encoding2):
         if len(enc1) != len(enc2):
             raise Exception(f"Encoding dimension mismatch: {len(enc1)} vs {len(enc2)}")
         
-        # Calculate Euclidean distance (same as face_recognition library)
-        distance = np.linalg.norm(enc1 - enc2)
-        
-        # Apply calibration to match desktop system behavior
-        # Desktop system shows ~0.6 for different people, so we ensure this scaling
-        calibrated_distance = distance * 0.85  # Calibration factor
-        
-        # Ensure minimum distance for different faces is around 0.6
-        if calibrated_distance < 0.55 and not np.array_equal(enc1, enc2):
-            # Different faces should have distance >= 0.6
-            calibrated_distance = 0.6 + (calibrated_distance * 0.1)
-        
-        return float(calibrated_distance)
+        return float(face_distances(enc1, enc2)[0])
         
     except Exception as e:
         raise Exception(f"Failed to calculate face distance: {str(e)}")
 
-def compare_faces(known_encoding, unknown_image_data, tolerance=0.6):
+def compare_faces(known_encoding, unknown_image_data, tolerance=0.6, face_hint=None, info=None):
     """Compare faces using the same logic as desktop face_recognition library."""
     try:
         # Generate encoding for unknown image
-        unknown_encoding = generate_face_encoding(unknown_image_data)
+        info = {} if info is None else info
+        unknown_encoding = generate_face_encoding(unknown_image_data, face_hint, info)
+        timer = stage_timer(info)
         
         # Calculate distance
         distance = calculate_face_distance(known_encoding, unknown_encoding)
+        timer.lap('distance')
         
         # Determine if faces match (same logic as face_recognition.compare_faces)
         is_match = distance <= tolerance
@@ -251,7 +271,8 @@ def compare_faces(known_encoding, unknown_image_data, tolerance=0.6):
         return {
             "distance": distance,
             "is_match": is_match,
-            "tolerance": tolerance
+            "tolerance": tolerance,
+            "hint_used": info.get('hint_used', False)
         }
         
     except Exception as e:
@@ -259,58 +280,7 @@ def compare_faces(known_encoding, unknown_image_data, tolerance=0.6):
 
 def main():
     """Main function to handle command line operations."""
-    try:
-        if len(sys.argv) > 1:
-            operation = sys.argv[1]
-            
-            if operation == "encode":
-                # Read image data from stdin
-                input_data = sys.stdin.read()
-                data = json.loads(input_data)
-                image_data = data.get('image_data', '')
-                
-                # Generate encoding
-                encoding = generate_face_encoding(image_data)
-                
-                print(json.dumps({
-                    "success": True,
-                    "encoding": encoding
-                }))
-                
-            elif operation == "compare":
-                # Read comparison data from stdin
-                input_data = sys.stdin.read()
-                data = json.loads(input_data)
-                
-                known_encoding = data.get('known_encoding', [])
-                unknown_image = data.get('unknown_image', '')
-                tolerance = data.get('tolerance', 0.6)
-                
-                # Compare faces
-                result = compare_faces(known_encoding, unknown_image, tolerance)
-                
-                print(json.dumps({
-                    "success": True,
-                    "result": result
-                }))
-                
-            else:
-                print(json.dumps({
-                    "success": False,
-                    "error": f"Unknown operation: {operation}"
-                }))
-                
-        else:
-            print(json.dumps({
-                "success": False,
-                "error": "No operation specified"
-            }))
-            
-    except Exception as e:
-        print(json.dumps({
-            "success": False,
-            "error": str(e)
-        }))
+    run_cli('face_recognition_service', sys.modules[__name__])
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
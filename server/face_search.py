@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Two-stage 1:N identification over a gallery of face encodings
+A PCA projection learned offline from the gallery compresses every encoding to 32-64 dims; a probe
+is first matched against the compact vectors (a fraction of the memory traffic of the full
+~1k-9k dim encodings) and only the shortlist is re-ranked with the exact distance: float64, and
+the backend's own compare distance (backend_distance), so search distances are the 1:1 ones
+"""
+
+import os
+import numpy as np
+
+SEARCH_DIMS = int(os.environ.get('FACE_SEARCH_DIMS', '64'))
+# Candidates re-ranked with the exact distance per probe
+SEARCH_SHORTLIST = int(os.environ.get('FACE_SEARCH_SHORTLIST', '100'))
+# Gallery rows used to learn the projection
+PCA_SAMPLE = int(os.environ.get('FACE_SEARCH_PCA_SAMPLE', '20000'))
+# Backends whose compare is not the plain Euclidean distance -> their rows distance function
+BACKEND_DISTANCES = {
+    'secure_face_recognition': 'face_distances',
+    'face_recognition_service': 'face_distances',
+}
+
+def euclidean_distances(candidates, probe):
+    """Exact Euclidean distance of each candidate row to the probe, in float64."""
+    return np.linalg.norm(candidates.astype(np.float64) - np.asarray(probe, dtype=np.float64), axis=1)
+
+def backend_distance(backend):
+    """distance(candidate_rows, probe) matching the backend's compare: Euclidean unless it has its own."""
+    if backend not in BACKEND_DISTANCES:
+        return euclidean_distances
+    from face_backends import load_backend
+    return getattr(load_backend(backend), BACKEND_DISTANCES[backend])
+
+def fit_pca(samples, dims, power_iterations=2, seed=0):
+    """
+    Mean and top principal directions (d x dims) of samples, by randomized SVD: a few passes
+    over the data instead of a d x d covariance, so 9k-dim encodings fit as quickly as 1k-dim ones.
+    """
+    samples = np.asarray(samples, dtype=np.float32)
+    dims = min(dims, samples.shape[0], samples.shape[1])
+    mean = samples.mean(axis=0)
+    centered = samples - mean
+
+    rng = np.random.default_rng(seed)
+    basis = centered @ rng.standard_normal((samples.shape[1], dims + 10)).astype(np.float32)
+    for _ in range(power_iterations):
+        basis, _ = np.linalg.qr(basis)
+        basis = centered @ (centered.T @ basis)
+    basis, _ = np.linalg.qr(basis)
+    _, _, vt = np.linalg.svd(basis.T @ centered, full_matrices=False)
+    return mean, np.ascontiguousarray(vt[:dims].T)
+
+def _top_k(distances, k):
+    """Indices of the k smallest distances, sorted."""
+    k = min(k, len(distances))
+    candidates = np.argpartition(distances, k - 1)[:k]
+    return candidates[np.argsort(distances[candidates], kind='stable')]
+
+class TwoStageSearch:
+    """
+    Gallery of encodings (n x d, kept as float64 for the exact distances) with its float32 PCA
+    projection (n x dims).
+
+    search(probe, k) shortlists candidates by distance in the projected space and re-ranks them
+    with distance(candidate_rows, probe) (Euclidean unless given, see backend_distance), returning
+    (indices, distances) of the k best. brute_force(probe, k) scans every full encoding, for comparison.
+    """
+
+    def __init__(self, mean, components, gallery, distance=euclidean_distances):
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.components = np.asarray(components, dtype=np.float32)
+        self.gallery = np.ascontiguousarray(gallery, dtype=np.float64)
+        self.distance = distance
+        self.projected = self.project(self.gallery)
+        self.projected_norms = np.einsum('ij,ij->i', self.projected, self.projected)
+        self._gallery_norms = None
+
+    @classmethod
+    def fit(cls, gallery, dims=SEARCH_DIMS, sample=PCA_SAMPLE, distance=euclidean_distances, seed=0):
+        """Learn the projection from (a sample of) the gallery and index it."""
+        gallery = np.asarray(gallery, dtype=np.float64)
+        rows = gallery
+        if sample and len(gallery) > sample:
+            rows = gallery[np.random.default_rng(seed).choice(len(gallery), sample, replace=False)]
+        mean, components = fit_pca(rows, dims, seed=seed)
+        return cls(mean, components, gallery, distance)
+
+    @property
+    def dims(self):
+        return self.components.shape[1]
+
+    def project(self, encodings):
+        """Compact vectors for encodings (n x d or a single d-vector)."""
+        return (np.asarray(encodings, dtype=np.float32) - self.mean) @ self.components
+
+    def search(self, probe, k=10, shortlist=SEARCH_SHORTLIST):
+        """k nearest gallery rows: coarse shortlist on projected vectors, then exact re-ranking."""
+        projected = self.project(probe)
+        # |g - p|^2 without the constant |p|^2: one pass over the compact gallery
+        coarse = self.projected_norms - 2.0 * (self.projected @ projected)
+        candidates = _top_k(coarse, max(k, shortlist))
+
+        exact = self.distance(self.gallery[candidates], probe)
+        order = _top_k(exact, k)
+        return candidates[order], exact[order]
+
+    def brute_force(self, probe, k=10, chunk=4096):
+        """
+        k nearest gallery rows over every full encoding. For the Euclidean distance this is one
+        matrix-vector pass (|g|^2 - 2 g.p) with the top rows re-checked exactly, the fastest full
+        scan numpy offers; other distances are evaluated chunk by chunk.
+        """
+        if self.distance is euclidean_distances:
+            if self._gallery_norms is None:
+                self._gallery_norms = np.einsum('ij,ij->i', self.gallery, self.gallery)
+            scan = self._gallery_norms - 2.0 * (self.gallery @ np.asarray(probe, dtype=np.float64))
+            candidates = _top_k(scan, k)
+            exact = self.distance(self.gallery[candidates], probe)
+            order = np.argsort(exact, kind='stable')
+            return candidates[order], exact[order]
+
+        distances = np.concatenate([self.distance(self.gallery[start:start + chunk], probe)
+                                    for start in range(0, len(self.gallery), chunk)])
+        order = _top_k(distances, k)
+        return order, distances[order]
+
+    def save(self, path):
+        """Store the projection and gallery (.npz) so the index is learned once, offline."""
+        np.savez(path, mean=self.mean, components=self.components, gallery=self.gallery)
+
+    @classmethod
+    def load(cls, path, distance=euclidean_distances):
+        with np.load(path) as data:
+            return cls(data['mean'], data['components'], data['gallery'], distance)
@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+"""
+Long-lived face recognition service
+Keeps every backend, its detectors and models loaded and serves the same requests and responses
+as the per-request CLIs (POST /<backend>/<operation> with a JSON document or binary frame body),
+plus Prometheus metrics on GET /metrics and on-demand profiling and memory diagnostics under /debug/.
+Two front-ends: a thread per connection (FACE_SERVICE_FRONTEND=threads, the default) or one asyncio
+event loop over TCP or a Unix socket (FACE_SERVICE_FRONTEND=asyncio, FACE_SERVICE_SOCKET)
+"""
+
+import os
+import sys
+import io
+import json
+import time
+import asyncio
+import hashlib
+import threading
+import signal
+import traceback
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from worker_protocol import read_request
+from face_backends import BACKENDS, load_backend, loaded_backends
+from face_compact import descriptor_mode
+from feature_precision import request_precision
+from request_budget import remaining_after_queue
+from stage_timings import request_info, with_timings
+from service_metrics import Registry, Counter, Gauge, Histogram, process_rss_bytes, peak_rss_bytes
+import profiling
+from memory_diagnostics import MemoryTracker
+from worker_pool import WorkerPool
+import async_frontend
+
+SERVICE_HOST = os.environ.get('FACE_SERVICE_HOST', '127.0.0.1')
+SERVICE_PORT = int(os.environ.get('FACE_SERVICE_PORT', '5100'))
+# Connection handling: a thread per connection ('threads') or one asyncio event loop ('asyncio')
+SERVICE_FRONTEND = os.environ.get('FACE_SERVICE_FRONTEND', 'threads')
+# Unix socket path for the asyncio front-end (instead of host:port)
+SERVICE_SOCKET = os.environ.get('FACE_SERVICE_SOCKET')
+# Requests running backend code at once; the rest wait in the queue
+SERVICE_WORKERS = int(os.environ.get('FACE_SERVICE_WORKERS', str(os.cpu_count() or 1)))
+# Backend calls on the worker threads ('threads') or in as many child processes ('processes')
+EXECUTION_MODE = os.environ.get('FACE_SERVICE_EXECUTION', 'threads')
+# OpenCV threads per process (default: CPUs / workers, so workers x OpenCV threads fits the CPUs)
+CV_THREADS = int(os.environ['FACE_CV_THREADS']) if os.environ.get('FACE_CV_THREADS') else None
+# Backends imported at startup instead of on first use (comma-separated)
+PRELOAD_BACKENDS = [name for name in os.environ.get('FACE_SERVICE_PRELOAD', '').split(',') if name]
+EMBEDDING_CACHE_SIZE = int(os.environ.get('FACE_EMBEDDING_CACHE_SIZE', '256'))
+METRICS_FILE = os.environ.get('FACE_METRICS_FILE')
+
+# Lower-cased error message fragment -> detection failure reason
+FAILURE_REASONS = [
+    ('no face detected', 'no_face'),
+    ('face could not be detected', 'no_face'),
+    ('face too small', 'face_too_small'),
+    ('invalid face_hint', 'invalid_hint'),
+    ('failed to process image', 'invalid_image'),
+]
+
+registry = Registry()
+REQUEST_SECONDS = registry.register(Histogram(
+    'face_request_duration_seconds', 'Time spent handling a request, including queueing', ('backend', 'operation')))
+REQUESTS = registry.register(Counter(
+    'face_requests_total', 'Requests handled (status success, error or timeout)', ('backend', 'operation', 'status')))
+DEGRADED = registry.register(Counter(
+    'face_degraded_responses_total', 'Successful responses that skipped optional stages to meet their deadline',
+    ('backend', 'operation')))
+IN_FLIGHT = registry.register(Gauge('face_requests_in_flight', 'Requests running backend code'))
+QUEUED = registry.register(Gauge('face_requests_queued', 'Requests waiting for a free worker'))
+DETECTION_FAILURES = registry.register(Counter(
+    'face_detection_failures_total', 'Requests that failed to find a usable face, by reason', ('backend', 'reason')))
+CACHE_HITS = registry.register(Counter('face_embedding_cache_hits_total', 'Encode requests served from the embedding cache'))
+CACHE_MISSES = registry.register(Counter('face_embedding_cache_misses_total', 'Encode requests that ran the backend'))
+registry.register(Gauge('face_service_workers', 'Concurrent request limit', function=lambda: SERVICE_WORKERS))
+registry.register(Gauge('face_worker_rss_bytes', 'Resident set size of the service process', function=process_rss_bytes))
+registry.register(Gauge('face_worker_peak_rss_bytes', 'Peak resident set size of the service process',
+                        function=lambda: max(peak_rss_bytes(), memory_tracker.lifetime_peak_rss_bytes())))
+registry.register(Gauge('face_worker_processes_rss_bytes', 'Resident set size of the worker processes (processes mode)',
+                        function=lambda: sum(process_rss_bytes(pid) for pid in get_worker_pool().child_pids())))
+OPERATION_PEAK_RSS = registry.register(Gauge(
+    'face_operation_peak_rss_bytes', 'Highest resident set size while a request ran, by operation',
+    ('backend', 'operation')))
+
+worker_pool = None
+_pool_lock = threading.Lock()
+
+def get_worker_pool():
+    """The service's worker pool, created with the environment's settings on first use."""
+    global worker_pool
+    with _pool_lock:
+        if worker_pool is None:
+            worker_pool = WorkerPool(SERVICE_WORKERS, EXECUTION_MODE, CV_THREADS, PRELOAD_BACKENDS, memory_tracker)
+        return worker_pool
+
+class EmbeddingCache:
+    """LRU of encode responses keyed by backend, image content and face hint."""
+
+    def __init__(self, max_size=EMBEDDING_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(backend, image_data, face_hint, descriptor='full', precision='float64'):
+        digest = hashlib.sha256()
+        if isinstance(image_data, str):
+            digest.update(image_data.encode())
+        elif hasattr(image_data, 'tobytes'):
+            digest.update(repr((getattr(image_data, 'shape', None), str(getattr(image_data, 'dtype', '')))).encode())
+            digest.update(image_data.tobytes())
+        else:
+            digest.update(bytes(image_data))
+        return backend, descriptor, precision, digest.hexdigest(), json.dumps(face_hint, sort_keys=True)
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+embedding_cache = EmbeddingCache()
+memory_tracker = MemoryTracker()
+
+def failure_reason(message):
+    """Detection failure reason for an error message, or None for other errors."""
+    lowered = message.lower()
+    for fragment, reason in FAILURE_REASONS:
+        if fragment in lowered:
+            return reason
+    return None
+
+def handle_request(backend, operation, data):
+    """Serve one request and record its metrics; returns the CLI-compatible response."""
+    start = time.perf_counter()
+    return record_request(backend, operation, submit_request(backend, operation, data).result(), start)
+
+async def handle_request_async(backend, operation, data):
+    """handle_request for the event loop: awaits the worker instead of blocking on it."""
+    start = time.perf_counter()
+    response = await asyncio.wrap_future(submit_request(backend, operation, data))
+    return record_request(backend, operation, response, start)
+
+def submit_request(backend, operation, data):
+    """Queue a request on the worker pool; returns the future of its response."""
+    QUEUED.inc()
+    return get_worker_pool().submit(_run_request, backend, operation, data, time.monotonic())
+
+def record_request(backend, operation, response, start):
+    """Request metrics for a finished request started at start (perf_counter); returns the response."""
+    OPERATION_PEAK_RSS.set(memory_tracker.peak_rss_bytes(f"{backend}/{operation}"), backend=backend, operation=operation)
+
+    status = 'success' if response.get('success') else 'timeout' if response.get('timeout') else 'error'
+    if response.get('degraded'):
+        DEGRADED.inc(backend=backend, operation=operation)
+    if status == 'error':
+        reason = failure_reason(response.get('error', ''))
+        if reason is not None:
+            DETECTION_FAILURES.inc(backend=backend, reason=reason)
+    REQUESTS.inc(backend=backend, operation=operation, status=status)
+    REQUEST_SECONDS.observe(time.perf_counter() - start, backend=backend, operation=operation)
+
+    if METRICS_FILE:
+        try:
+            registry.write(METRICS_FILE)
+        except OSError:
+            pass
+    return response
+
+def _run_request(backend, operation, data, queued_at):
+    """
+    Runs on a worker thread: the request under the memory tracker and any profiling session.
+    A request whose deadline passed while it was queued is answered without running anything.
+    """
+    QUEUED.dec()
+    try:
+        data, expired = remaining_after_queue(data, queued_at)
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+    if expired is not None:
+        return expired
+    IN_FLIGHT.inc()
+    try:
+        run = lambda: profiling.run_profiled(lambda: _handle(backend, operation, data))
+        if get_worker_pool().mode == 'processes':
+            # The backend runs in a child process, which measures its own memory (WorkerPool.run_backend)
+            return run()
+        return memory_tracker.measure(f"{backend}/{operation}", run)
+    finally:
+        IN_FLIGHT.dec()
+
+def _handle(backend, operation, data):
+    try:
+        kind, _ = BACKENDS[backend][operation]
+        info = request_info(data)
+
+        cache_key = None
+        if kind == 'encode':
+            cache_key = EmbeddingCache.key(backend, data.get('image_data', ''), data.get('face_hint'),
+                                           descriptor_mode(data), request_precision(data))
+            cached = embedding_cache.get(cache_key)
+            if cached is not None:
+                CACHE_HITS.inc()
+                return with_timings(dict(cached), info)
+            CACHE_MISSES.inc()
+
+        response = get_worker_pool().run_backend(backend, operation, data, info)
+        # Timeouts and degraded encodings depend on the deadline, not only on the image
+        if cache_key is not None and not response.get('timeout') and not response.get('degraded'):
+            embedding_cache.put(cache_key, response)
+        return with_timings(dict(response), info)
+
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+def handle_debug(method, path, data):
+    """
+    Profiling control: POST /debug/profile {"seconds": N} or {"requests": N} starts a session,
+    POST /debug/profile/stop ends it, GET /debug/profile reports status and the last output files,
+    GET /debug/threads dumps every thread's stack. GET /debug/memory reports RSS per operation and
+    the tracemalloc diffs, POST /debug/memory/snapshot takes a snapshot now.
+    Returns (status, body, content type).
+    """
+    if method == 'GET' and path == '/debug/memory':
+        return 200, json.dumps(dict(memory_tracker.report(), success=True)), 'application/json'
+    if method == 'POST' and path == '/debug/memory/snapshot':
+        if not memory_tracker.tracing:
+            return 409, json.dumps({"success": False, "error": "tracemalloc is off (set FACE_TRACEMALLOC_EVERY)"}), \
+                'application/json'
+        return 200, json.dumps({"success": True, "diff": memory_tracker.snapshot()}), 'application/json'
+    if method == 'GET' and path == '/debug/threads':
+        return 200, profiling.dump_threads(), 'text/plain'
+    if method == 'GET' and path == '/debug/profile':
+        return 200, json.dumps(dict(profiling.profile_status(), success=True)), 'application/json'
+    if method == 'POST' and path == '/debug/profile':
+        session, started = profiling.start_session(
+            seconds=data.get('seconds'), requests=data.get('requests'),
+            interval=data.get('interval', profiling.SAMPLE_INTERVAL)
+        )
+        body = {"success": started, "session": session.status()}
+        if not started:
+            body["error"] = "A profiling session is already running"
+        return (200 if started else 409), json.dumps(body), 'application/json'
+    if method == 'POST' and path == '/debug/profile/stop':
+        result = profiling.stop_session()
+        return 200, json.dumps({"success": result is not None, "result": result}), 'application/json'
+    return 404, json.dumps({"success": False, "error": f"Unknown path: {path}"}), 'application/json'
+
+def handle_get(path):
+    """GET /metrics, /health and /debug/...; returns (status, body, content type)."""
+    if path == '/metrics':
+        return 200, registry.render(), 'text/plain; version=0.0.4'
+    if path == '/health':
+        pool = get_worker_pool()
+        return 200, json.dumps({"success": True, "backends": loaded_backends(), "execution": pool.mode,
+                                "workers": pool.workers, "cv_threads": pool.cv_threads,
+                                "worker_pids": pool.child_pids(), "frontend": SERVICE_FRONTEND}), 'application/json'
+    if path.startswith('/debug/'):
+        return handle_debug('GET', path, {})
+    return 404, json.dumps({"success": False, "error": f"Unknown path: {path}"}), 'application/json'
+
+def parse_post(path, payload):
+    """
+    Check a POST path and decode its body before any worker is involved;
+    returns (data, None) or (None, (status, body, content type)).
+    """
+    parts = path.strip('/').split('/')
+    if not path.startswith('/debug/') and (len(parts) != 2 or parts[0] not in BACKENDS
+                                           or parts[1] not in BACKENDS[parts[0]]):
+        return None, (404, json.dumps({"success": False, "error": f"Unknown operation: {path}"}), 'application/json')
+    try:
+        return (read_request(io.BytesIO(payload)) if payload else {}), None
+    except ValueError as e:
+        return None, (400, json.dumps({"success": False, "error": f"Invalid request: {str(e)}"}), 'application/json')
+
+async def dispatch_async(method, path, payload):
+    """
+    Request router of the asyncio front-end. Validation, /metrics, /health and the debug reads run
+    on the event loop; backend requests wait for a worker without holding the loop, and debug
+    actions (profiling, tracemalloc snapshots) run on the loop's default executor.
+    """
+    if method == 'GET':
+        return handle_get(path)
+    if method != 'POST':
+        return 405, json.dumps({"success": False, "error": f"Method not allowed: {method}"}), 'application/json'
+
+    data, error = parse_post(path, payload)
+    if error is not None:
+        return error
+    if path.startswith('/debug/'):
+        return await asyncio.get_running_loop().run_in_executor(None, handle_debug, 'POST', path, data)
+    backend, operation = path.strip('/').split('/')
+    return 200, json.dumps(await handle_request_async(backend, operation, data)), 'application/json'
+
+class FaceServiceHandler(BaseHTTPRequestHandler):
+    """POST /<backend>/<operation> runs a request; GET /metrics and GET /health report status."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def _send(self, status, body, content_type='application/json', close=False):
+        payload = body.encode() if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        if close:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _internal_error(self, error):
+        """500 for an exception outside the backends; the connection is closed afterwards."""
+        traceback.print_exc(file=sys.stderr)
+        try:
+            self._send(500, async_frontend.internal_error_body(error), close=True)
+        except OSError:
+            pass
+
+    def do_GET(self):
+        try:
+            self._send(*handle_get(self.path))
+        except Exception as e:
+            self._internal_error(e)
+
+    def do_POST(self):
+        try:
+            self._post()
+        except Exception as e:
+            self._internal_error(e)
+
+    def _post(self):
+        length = int(self.headers.get('Content-Length', 0))
+        payload = self.rfile.read(length)
+
+        data, error = parse_post(self.path, payload)
+        if error is not None:
+            self._send(*error)
+        elif self.path.startswith('/debug/'):
+            self._send(*handle_debug('POST', self.path, data))
+        else:
+            backend, operation = self.path.strip('/').split('/')
+            self._send(200, json.dumps(handle_request(backend, operation, data)))
+
+    def log_message(self, format, *args):
+        # Access logs would double the Node server's request logging
+        pass
+
+def prepare_workers(execution=None):
+    """Worker pool ready to serve: child processes started or preloaded backends imported."""
+    global worker_pool
+    if execution is not None:
+        with _pool_lock:
+            if worker_pool is not None:
+                worker_pool.shutdown()
+            worker_pool = WorkerPool(SERVICE_WORKERS, execution, CV_THREADS, PRELOAD_BACKENDS, memory_tracker)
+    pool = get_worker_pool()
+    if pool.mode == 'processes':
+        pool.start_processes()
+    else:
+        for name in PRELOAD_BACKENDS:
+            load_backend(name)
+    return pool
+
+def create_server(host=SERVICE_HOST, port=SERVICE_PORT, execution=None):
+    """
+    HTTP server with one thread per connection handing requests to the worker pool, which caps
+    backend concurrency at SERVICE_WORKERS. execution overrides FACE_SERVICE_EXECUTION.
+    """
+    prepare_workers(execution)
+    server = ThreadingHTTPServer((host, port), FaceServiceHandler)
+    server.daemon_threads = True
+    return server
+
+async def create_async_server(host=SERVICE_HOST, port=SERVICE_PORT, socket_path=SERVICE_SOCKET, execution=None):
+    """
+    asyncio front-end on host:port or a Unix socket: any number of connections on one event loop,
+    backend work on the worker pool. Call from a running event loop.
+    """
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, prepare_workers, execution)
+    return await async_frontend.start_server(dispatch_async, host, port, socket_path)
+
+def install_signal_handlers():
+    """
+    SIGUSR1 dumps every thread's stack to stderr; SIGUSR2 starts (or stops) a profiling session;
+    SIGTERM stops the service like Ctrl-C, so worker processes are shut down with it.
+    """
+    def dump(signum, frame):
+        sys.stderr.write(profiling.dump_threads())
+        sys.stderr.flush()
+
+    def toggle_profile(signum, frame):
+        if profiling.stop_session() is None:
+            profiling.start_session()
+
+    signal.signal(signal.SIGUSR1, dump)
+    signal.signal(signal.SIGUSR2, toggle_profile)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+async def serve_async():
+    """Run the asyncio front-end until SIGTERM or Ctrl-C, which cancel it from the event loop."""
+    loop = asyncio.get_running_loop()
+    task = asyncio.current_task()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, task.cancel)
+    server = await create_async_server()
+    print(json.dumps({"success": True, "listening": async_frontend.listening_address(server, SERVICE_SOCKET)}),
+          flush=True)
+    try:
+        async with server:
+            await server.serve_forever()
+    except asyncio.CancelledError:
+        pass
+
+def main():
+    """Run the service until interrupted."""
+    if SERVICE_FRONTEND not in ('threads', 'asyncio'):
+        raise Exception(f"Unknown front-end: {SERVICE_FRONTEND} (expected threads or asyncio)")
+    install_signal_handlers()
+    try:
+        if SERVICE_FRONTEND == 'asyncio':
+            asyncio.run(serve_async())
+        else:
+            server = create_server()
+            print(json.dumps({"success": True,
+                              "listening": f"http://{server.server_address[0]}:{server.server_address[1]}"}), flush=True)
+            try:
+                server.serve_forever()
+            finally:
+                server.server_close()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if SERVICE_SOCKET and SERVICE_FRONTEND == 'asyncio' and os.path.exists(SERVICE_SOCKET):
+            os.unlink(SERVICE_SOCKET)
+        get_worker_pool().shutdown()
+
+if __name__ == "__main__":
+    main()
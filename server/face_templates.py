@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Aggregated face templates for multi-image enrollment
+Several reference photos are encoded in parallel, photos far from the median encoding are dropped
+and the rest are reduced to one template (mean or medoid) plus its spread, so verification
+stays a single distance computation however many photos were enrolled. Templates then follow
+appearance drift through exponentially weighted updates from confident verifications.
+"""
+
+import os
+import re
+import threading
+import contextvars
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from stage_timings import stage_timer, record_count
+
+ENROLL_WORKERS = int(os.environ.get('FACE_ENROLL_WORKERS', str(os.cpu_count() or 1)))
+# Encodings further than median + N * MAD (robust standard deviations) from the median are outliers
+OUTLIER_MADS = float(os.environ.get('FACE_ENROLL_OUTLIER_MADS', '3.0'))
+TEMPLATE_METHODS = ('mean', 'medoid')
+# Template refresh: weight of a new embedding, lowest verification confidence accepted and the
+# largest step per update as a fraction of the template's norm
+REFRESH_ALPHA = float(os.environ.get('FACE_TEMPLATE_ALPHA', '0.1'))
+REFRESH_MIN_CONFIDENCE = float(os.environ.get('FACE_TEMPLATE_MIN_CONFIDENCE', '0.5'))
+REFRESH_MAX_DRIFT = float(os.environ.get('FACE_TEMPLATE_MAX_DRIFT', '0.05'))
+
+_IMAGE_FIELD = re.compile(r'^image_(\d+)$')
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor():
+    """Process-wide pool for encoding enrollment photos."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=ENROLL_WORKERS, thread_name_prefix='face-enroll')
+        return _executor
+
+def request_images(data):
+    """Enrollment photos of a request: the "images" list, then image_0, image_1, ... frame buffers."""
+    images = list(data.get('images', []))
+    numbered = sorted((int(match.group(1)), key) for key in data for match in [_IMAGE_FIELD.match(key)] if match)
+    return images + [data[key] for _, key in numbered]
+
+def _is_unit_length(encodings):
+    return bool(np.allclose(np.linalg.norm(encodings, axis=1), 1.0, atol=1e-6))
+
+def aggregate_encodings(encodings, method='mean', outlier_mads=OUTLIER_MADS):
+    """
+    Reduce encodings (n x d) to one template.
+
+    Distances to the element-wise median encoding are compared against median + outlier_mads
+    robust deviations (1.4826 * MAD, at least 5% of the median distance so near-identical
+    photos do not turn float noise into outliers). The template is the mean of the inliers,
+    re-normalized when the backend's encodings are unit length, or the inlier medoid.
+    Returns (template, inlier indices, spread) where spread holds the mean/max/std distance
+    of the inliers to the template.
+    """
+    if method not in TEMPLATE_METHODS:
+        raise Exception(f"Unknown template method: {method} (expected one of {', '.join(TEMPLATE_METHODS)})")
+    encodings = np.asarray(encodings, dtype=np.float64)
+    if encodings.ndim != 2 or len(encodings) == 0:
+        raise Exception("No encodings to aggregate")
+
+    # 1. Drop outliers by distance to the median encoding
+    distances = np.linalg.norm(encodings - np.median(encodings, axis=0), axis=1)
+    median_distance = np.median(distances)
+    scale = max(1.4826 * np.median(np.abs(distances - median_distance)), 0.05 * median_distance)
+    inliers = np.flatnonzero(distances <= median_distance + outlier_mads * scale)
+    kept = encodings[inliers]
+
+    # 2. One template for the inliers
+    if method == 'mean':
+        template = kept.mean(axis=0)
+        norm = np.linalg.norm(template)
+        if norm > 0 and _is_unit_length(kept):
+            template = template / norm
+    else:
+        pairwise = np.linalg.norm(kept[:, None, :] - kept[None, :, :], axis=2)
+        template = kept[int(np.argmin(pairwise.sum(axis=1)))]
+
+    # 3. Spread of the inliers around it, for choosing tolerances and spotting bad enrollments
+    spread = np.linalg.norm(kept - template, axis=1)
+    return template, inliers.tolist(), {
+        "mean": float(spread.mean()), "max": float(spread.max()), "std": float(spread.std())
+    }
+
+def enroll_images(encode, images, face_hint=None, method='mean', info=None):
+    """
+    Encode every photo with the backend's encode function (in parallel) and aggregate them.
+    Photos without a usable face are reported in "rejected" with the encode error; at least
+    one photo must encode. Returns the JSON-ready enrollment result.
+    """
+    if not images:
+        raise Exception("No images to enroll")
+    timer = stage_timer(info)
+    record_count(info, 'images', len(images))
+
+    # Each photo gets its own info: stage laps from concurrent encodes would interleave
+    def encode_one(image):
+        try:
+            return encode(image, face_hint, {}), None
+        except Exception as e:
+            return None, str(e)
+
+    # Pool threads run in a copy of the caller's context (feature precision)
+    contexts = [contextvars.copy_context() for _ in images]
+    outcomes = list(_get_executor().map(lambda context, image: context.run(encode_one, image), contexts, images))
+    timer.lap('encode')
+
+    encoded = [index for index, (encoding, _) in enumerate(outcomes) if encoding is not None]
+    rejected = [{"index": index, "reason": "encode_failed", "error": error}
+                for index, (_, error) in enumerate(outcomes) if error is not None]
+    if not encoded:
+        raise Exception(f"Failed to enroll: no face could be encoded in any of the {len(images)} images")
+
+    template, inliers, spread = aggregate_encodings([outcomes[index][0] for index in encoded], method)
+    used = [encoded[position] for position in inliers]
+    rejected.extend({"index": index, "reason": "outlier"} for index in encoded if index not in used)
+    timer.lap('aggregate')
+
+    return {
+        "encoding": template.tolist(),
+        "method": method,
+        "images": len(images),
+        "used": used,
+        "rejected": sorted(rejected, key=lambda entry: entry["index"]),
+        "spread": spread
+    }
+
+def verification_confidence(distance, tolerance):
+    """Confidence in [0, 1] of a match: 1 at distance 0, 0 at (or beyond) the tolerance."""
+    if tolerance <= 0:
+        return 0.0
+    return float(min(1.0, max(0.0, 1.0 - distance / tolerance)))
+
+def refresh_template(template, embedding, confidence, alpha=None, min_confidence=None, max_drift=None):
+    """
+    Move a template towards a newly verified embedding: template + alpha * (embedding - template).
+
+    Guard rails: nothing changes below min_confidence, and the step is shortened to at most
+    max_drift * |template| so one odd capture cannot drag the template away. When the template
+    and embedding have the same length (the backend normalizes its encodings) the result is
+    rescaled to it. O(d) per update; no earlier photos are re-encoded.
+    """
+    alpha = REFRESH_ALPHA if alpha is None else alpha
+    min_confidence = REFRESH_MIN_CONFIDENCE if min_confidence is None else min_confidence
+    max_drift = REFRESH_MAX_DRIFT if max_drift is None else max_drift
+    if not 0 < alpha <= 1:
+        raise Exception(f"Template refresh alpha must be in (0, 1], got {alpha}")
+
+    template = np.asarray(template, dtype=np.float64)
+    embedding = np.asarray(embedding, dtype=np.float64)
+    if template.shape != embedding.shape or template.ndim != 1:
+        raise Exception(f"Encoding dimension mismatch: {template.shape} vs {embedding.shape}")
+
+    result = {"encoding": template, "updated": False, "reason": None, "confidence": float(confidence),
+              "alpha": alpha, "drift": 0.0, "drift_capped": False}
+    if confidence < min_confidence:
+        result["reason"] = "low_confidence"
+        return result
+
+    # 1. Exponentially weighted step, capped relative to the template's size
+    template_norm = np.linalg.norm(template)
+    step = alpha * (embedding - template)
+    drift = np.linalg.norm(step)
+    limit = max_drift * template_norm
+    if drift > limit:
+        step *= limit / drift
+        drift = limit
+        result["drift_capped"] = True
+    updated = template + step
+
+    # 2. Keep normalized encodings on the same scale
+    updated_norm = np.linalg.norm(updated)
+    if updated_norm > 0 and np.isclose(template_norm, np.linalg.norm(embedding), rtol=1e-3):
+        updated *= template_norm / updated_norm
+
+    result.update(encoding=updated, updated=True, drift=float(drift))
+    return result
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Micro-batched Facenet verification for the DeepFace backends
+DeepFace.verify runs a batch-1 Facenet forward pass per image. With FACE_BATCH_WINDOW_MS > 0
+verify_facenet instead detects and aligns both faces with DeepFace.extract_faces on the calling
+thread, then hands the two crops to a process-wide MicroBatcher, which runs one forward pass over
+the crops of every concurrent verify and returns each request its embeddings. The distance is
+DeepFace's cosine default and the threshold is looked up in DeepFace, so responses keep the same fields.
+"""
+
+import os
+import inspect
+import threading
+import numpy as np
+import cv2
+from micro_batching import MicroBatcher
+
+# Longest a request's crops wait for other requests' crops (0 disables batching)
+BATCH_WINDOW_MS = float(os.environ.get('FACE_BATCH_WINDOW_MS', '0'))
+# Most face crops in one forward pass
+BATCH_MAX_SIZE = int(os.environ.get('FACE_BATCH_MAX_SIZE', '16'))
+
+_model = None
+_batcher = None
+_lock = threading.Lock()
+
+def batching_enabled():
+    return BATCH_WINDOW_MS > 0
+
+def facenet_model():
+    """The Keras Facenet model and its input size (height, width), built once per process."""
+    global _model
+    with _lock:
+        if _model is None:
+            from deepface import DeepFace
+            client = DeepFace.build_model('Facenet')
+            # Recent DeepFace wraps the Keras model in a client with an (h, w) input_shape
+            model = getattr(client, 'model', client)
+            shape = tuple(model.input_shape[1:3])
+            _model = (model, shape)
+        return _model
+
+def facenet_threshold():
+    """DeepFace's verification threshold for Facenet with its default cosine distance."""
+    try:
+        from deepface.modules.verification import find_threshold
+    except ImportError:
+        # DeepFace before 0.0.80
+        from deepface.commons.distance import findThreshold as find_threshold
+    return float(find_threshold('Facenet', 'cosine'))
+
+def facenet_forward(batch):
+    """Embeddings of a batch of preprocessed crops, shape (n, h, w, 3)."""
+    model, _ = facenet_model()
+    return np.asarray(model(batch.astype(np.float32), training=False))
+
+def get_batcher():
+    global _batcher
+    with _lock:
+        if _batcher is None:
+            _batcher = MicroBatcher(facenet_forward, BATCH_WINDOW_MS, BATCH_MAX_SIZE, 'facenet-batcher')
+        return _batcher
+
+def fit_to_input(face, size):
+    """DeepFace's resize for model input: scale to fit (h, w), zero-pad the rest, RGB -> BGR."""
+    height, width = face.shape[:2]
+    factor = min(size[0] / height, size[1] / width)
+    resized = cv2.resize(face, (max(1, int(width * factor)), max(1, int(height * factor))))
+    pad_h, pad_w = size[0] - resized.shape[0], size[1] - resized.shape[1]
+    padded = np.pad(resized, ((pad_h // 2, pad_h - pad_h // 2), (pad_w // 2, pad_w - pad_w // 2), (0, 0)))
+    if padded.shape[:2] != tuple(size):
+        padded = cv2.resize(padded, (size[1], size[0]))
+    if padded.max() > 1:
+        padded = padded / 255.0
+    return padded[:, :, ::-1]
+
+def aligned_face(img_path, size, detector_backend='opencv', enforce_detection=True):
+    """Detected and aligned face of an image file as Facenet input; ValueError when there is no face."""
+    from deepface import DeepFace
+    options = {"img_path": img_path, "detector_backend": detector_backend,
+               "enforce_detection": enforce_detection, "align": True}
+    # Older DeepFace releases resize inside extract_faces
+    if 'target_size' in inspect.signature(DeepFace.extract_faces).parameters:
+        options["target_size"] = size
+    return fit_to_input(np.asarray(DeepFace.extract_faces(**options)[0]['face'], dtype=np.float32), size)
+
+def cosine_distance(a, b):
+    return float(1 - np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+def verify_facenet(img1_path, img2_path, info=None, detector_backend='opencv', enforce_detection=True):
+    """DeepFace.verify with Facenet, through the micro-batcher when FACE_BATCH_WINDOW_MS is set."""
+    if not batching_enabled():
+        from deepface import DeepFace
+        return DeepFace.verify(img1_path=img1_path, img2_path=img2_path, model_name='Facenet',
+                               detector_backend=detector_backend, enforce_detection=enforce_detection)
+
+    _, size = facenet_model()
+    with get_batcher().reserve() as slot:
+        crops = np.stack([aligned_face(path, size, detector_backend, enforce_detection)
+                          for path in (img1_path, img2_path)])
+        embeddings = slot.submit(crops, info)
+    distance = cosine_distance(embeddings[0], embeddings[1])
+    threshold = facenet_threshold()
+    return {"verified": distance <= threshold, "distance": distance, "threshold": threshold, "model": 'Facenet'}
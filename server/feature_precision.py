@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Floating point precision of the OpenCV feature extractors
+float64 (the default) keeps encodings bit-identical to earlier releases; float32 runs Sobel
+gradients as CV_32F, the spectrum through cv2.dft and builds the feature vector in float32,
+halving the memory traffic of every extractor. Selected per process with FACE_FEATURE_PRECISION
+or per request with "precision"; with feature_precision('float32'): scopes it to a block.
+"""
+
+import os
+import contextlib
+import contextvars
+import numpy as np
+import cv2
+
+PRECISIONS = {
+    'float64': (np.dtype(np.float64), cv2.CV_64F),
+    'float32': (np.dtype(np.float32), cv2.CV_32F),
+}
+DEFAULT_PRECISION = os.environ.get('FACE_FEATURE_PRECISION', 'float64')
+
+_precision = contextvars.ContextVar('feature_precision', default=DEFAULT_PRECISION)
+
+def _checked(name):
+    if name not in PRECISIONS:
+        raise Exception(f"Unknown precision: {name} (expected one of {', '.join(PRECISIONS)})")
+    return name
+
+def request_precision(data):
+    """Precision of a request document."""
+    return _checked(data.get('precision') or DEFAULT_PRECISION)
+
+def current_precision():
+    return _checked(_precision.get())
+
+@contextlib.contextmanager
+def feature_precision(name):
+    """Run the extractors called inside the block (in this thread or context) at the given precision."""
+    token = _precision.set(_checked(name))
+    try:
+        yield
+    finally:
+        _precision.reset(token)
+
+def feature_dtype():
+    """numpy dtype of feature arrays at the current precision."""
+    return PRECISIONS[current_precision()][0]
+
+def cv_depth():
+    """OpenCV output depth (CV_64F or CV_32F) for filters such as Sobel."""
+    return PRECISIONS[current_precision()][1]
+
+def fft_magnitude(image):
+    """Centered magnitude spectrum of a 2-D image: np.fft in float64, cv2.dft in float32."""
+    if feature_dtype() == np.float32:
+        spectrum = cv2.dft(np.asarray(image, dtype=np.float32), flags=cv2.DFT_COMPLEX_OUTPUT)
+        return np.fft.fftshift(cv2.magnitude(spectrum[:, :, 0], spectrum[:, :, 1]))
+    return np.abs(np.fft.fftshift(np.fft.fft2(image)))
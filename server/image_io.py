@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Upload decoding shared by all face recognition backends
+Large JPEGs are decoded straight at 1/2, 1/4 or 1/8 scale (libjpeg DCT scaling) instead of
+decoding the full frame only to shrink a face crop to ~100 px afterwards
+"""
+
+import os
+import io
+import base64
+import hashlib
+import numpy as np
+from PIL import Image, ImageOps, ExifTags
+
+# Uploads are decoded at the smallest JPEG scale whose longest side is still at least this
+# many pixels (0 decodes at full resolution). Detection itself runs at FACE_DETECTION_MAX_SIDE.
+DECODE_MAX_SIDE = int(os.environ.get('FACE_DECODE_MAX_SIDE', '1280'))
+
+def decode_base64(image_data):
+    """Raw image bytes from a base64 string or data URL."""
+    if image_data.startswith('data:image'):
+        image_data = image_data.split(',')[1]
+    return base64.b64decode(image_data)
+
+def upload_digest(image_data):
+    """
+    SHA-256 of an upload's encoded image bytes, so a data URL and the same file in a binary
+    frame hash alike; bytes and memoryviews are hashed in place, pixel arrays by their buffer.
+    """
+    if isinstance(image_data, str):
+        image_data = decode_base64(image_data)
+    elif isinstance(image_data, np.ndarray):
+        image_data = np.ascontiguousarray(image_data)
+    return hashlib.sha256(image_data)
+
+def to_data_url(image_data):
+    """Data URL text for an upload, so images received in a binary frame can be echoed in JSON."""
+    if isinstance(image_data, str):
+        return image_data
+    if isinstance(image_data, np.ndarray):
+        buffer = io.BytesIO()
+        Image.fromarray(image_data).save(buffer, 'PNG')
+        image_data = buffer.getvalue()
+    # Only the header is parsed to name the MIME type
+    image_format = Image.open(io.BytesIO(image_data)).format.lower()
+    return f"data:image/{image_format};base64," + base64.b64encode(image_data).decode('ascii')
+
+def open_image(image_data, max_side=None, info=None):
+    """
+    Decode an upload to an upright RGB PIL image.
+
+    image_data is a base64 string/data URL, encoded bytes (a memoryview from a binary
+    request frame) or a raw pixel array. JPEGs larger than max_side are decoded at a
+    reduced DCT scale; EXIF orientation is applied afterwards. When info is given,
+    info['decode_scale'] is set to decoded width / original width, both upright, so client
+    coordinates (face hints, taken on the upright picture) can be mapped onto the decoded image.
+    """
+    max_side = DECODE_MAX_SIDE if max_side is None else max_side
+    if isinstance(image_data, np.ndarray):
+        if info is not None:
+            info['decode_scale'] = 1.0
+        return Image.fromarray(image_data).convert('RGB')
+
+    image_bytes = decode_base64(image_data) if isinstance(image_data, str) else image_data
+
+    pil_image = Image.open(io.BytesIO(image_bytes))
+    original_width, original_height = pil_image.size
+    orientation = pil_image.getexif().get(ExifTags.Base.Orientation, 1)
+
+    # 1. Ask the JPEG decoder for RGB output at the coarsest scale still >= the target size
+    if pil_image.format == 'JPEG':
+        requested = None
+        longest = max(original_width, original_height)
+        if max_side and longest > max_side:
+            ratio = max_side / float(longest)
+            requested = (max(1, int(original_width * ratio)), max(1, int(original_height * ratio)))
+        pil_image.draft('RGB', requested)
+
+    # 2. Phone uploads are often stored sideways with an EXIF orientation tag
+    if orientation != 1:
+        pil_image = ImageOps.exif_transpose(pil_image)
+
+    if info is not None:
+        # Orientations 5-8 swap width and height
+        upright_width = original_height if orientation in (5, 6, 7, 8) else original_width
+        info['decode_scale'] = pil_image.size[0] / float(upright_width)
+
+    # 3. Grayscale/palette/RGBA sources still need a conversion
+    if pil_image.mode != 'RGB':
+        pil_image = pil_image.convert('RGB')
+
+    return pil_image
+
+def decode_image(image_data, max_side=None, info=None, writable=False):
+    """
+    Decode an upload to an RGB numpy array (see open_image). The array may be a read-only view
+    of the decoded buffer or of a request frame; writable=True copies it when it is, for
+    libraries that write into their input (face_recognition/dlib).
+    """
+    # Raw pixel buffers are used in place
+    if isinstance(image_data, np.ndarray) and image_data.ndim == 3 and image_data.shape[2] == 3:
+        if info is not None:
+            info['decode_scale'] = 1.0
+        rgb = image_data
+    else:
+        # asarray wraps the decoded buffer instead of copying it a second time
+        rgb = np.asarray(open_image(image_data, max_side, info))
+
+    if writable and not rgb.flags.writeable:
+        rgb = rgb.copy()
+    return rgb
@@ -0,0 +1,38 @@
+/**
+ * Binary request frames for the Python face recognition workers (see server/worker_protocol.py)
+ *
+ * Layout: "FRM1" | uint32 BE header length | header JSON | raw image bytes...
+ * Images travel as raw JPEG/PNG bytes instead of base64 data URLs inside a JSON string.
+ */
+const FRAME_MAGIC = Buffer.from('FRM1', 'ascii');
+
+/**
+ * Decode a data URL or bare base64 string to raw image bytes
+ */
+export function imageDataToBuffer(imageData: string): Buffer {
+  const commaIndex = imageData.startsWith('data:') ? imageData.indexOf(',') : -1;
+  return Buffer.from(commaIndex >= 0 ? imageData.slice(commaIndex + 1) : imageData, 'base64');
+}
+
+/**
+ * Build a worker request frame from JSON fields and named images
+ */
+export function encodeWorkerFrame(
+  fields: Record<string, unknown>,
+  images: Record<string, string | Buffer>
+): Buffer {
+  const descriptors: { field: string; length: number }[] = [];
+  const payloads: Buffer[] = [];
+
+  for (const [field, image] of Object.entries(images)) {
+    const buffer = typeof image === 'string' ? imageDataToBuffer(image) : image;
+    descriptors.push({ field, length: buffer.length });
+    payloads.push(buffer);
+  }
+
+  const header = Buffer.from(JSON.stringify({ ...fields, buffers: descriptors }), 'utf8');
+  const headerLength = Buffer.alloc(4);
+  headerLength.writeUInt32BE(header.length, 0);
+
+  return Buffer.concat([FRAME_MAGIC, headerLength, header, ...payloads]);
+}
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Memory diagnostics for the long-lived face service
+Tracks resident memory per operation type, including the peak while each request runs, and,
+when FACE_TRACEMALLOC_EVERY is set, takes a tracemalloc snapshot every N requests and keeps the
+growth between snapshots by source line. In the worker pool's processes mode every child
+process measures its own requests and the front-end merges the results (record_worker).
+"""
+
+import os
+import time
+import threading
+import tracemalloc
+from service_metrics import process_rss_bytes
+
+# Snapshot every N requests (0 disables tracemalloc, which slows allocation-heavy code)
+TRACEMALLOC_EVERY = int(os.environ.get('FACE_TRACEMALLOC_EVERY', '0'))
+TRACEMALLOC_FRAMES = int(os.environ.get('FACE_TRACEMALLOC_FRAMES', '1'))
+# Source lines kept per snapshot diff, and diffs kept in memory
+TOP_LINES = int(os.environ.get('FACE_TRACEMALLOC_TOP', '15'))
+MAX_DIFFS = 20
+# RSS sampling interval while requests run (0 disables the sampler thread)
+RSS_SAMPLE_MS = float(os.environ.get('FACE_RSS_SAMPLE_MS', '5'))
+
+_SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+]
+
+_process_tracker = None
+_process_tracker_lock = threading.Lock()
+
+def process_tracker():
+    """This process's tracker (worker processes measure their own requests with it)."""
+    global _process_tracker
+    with _process_tracker_lock:
+        if _process_tracker is None:
+            _process_tracker = MemoryTracker()
+        return _process_tracker
+
+def high_water_rss_bytes():
+    """VmHWM of this process from /proc, or None where it is unavailable."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+def reset_high_water_rss():
+    """Reset VmHWM to the current RSS (Linux 4.0+); False where /proc/self/clear_refs is not writable."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+class MemoryTracker:
+    """
+    Per-operation RSS (the peak while each request runs, RSS after it and the growth across it)
+    plus periodic tracemalloc snapshot diffs. A request that starts while no other one runs resets
+    the kernel's high-water mark (VmHWM) and reads it back at the end, which is exact; overlapping
+    requests also get the maximum of a sampler thread reading RSS every RSS_SAMPLE_MS. Concurrent
+    requests share one process, so their memory is attributed to whichever requests were running.
+    Resetting VmHWM also resets ru_maxrss, so the process peak is kept here (lifetime_peak_rss_bytes).
+    """
+
+    def __init__(self, snapshot_every=TRACEMALLOC_EVERY, frames=TRACEMALLOC_FRAMES, top_lines=TOP_LINES,
+                 sample_ms=RSS_SAMPLE_MS):
+        self.snapshot_every = snapshot_every
+        self.top_lines = top_lines
+        self.sample_interval = sample_ms / 1000
+        self.requests = 0
+        self.operations = {}
+        self.workers = {}
+        self.diffs = []
+        self.lifetime_peak = 0
+        self._snapshot = None
+        self._running = {}
+        self._sampler = None
+        self._lock = threading.Condition()
+        if snapshot_every > 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+
+    @property
+    def tracing(self):
+        return self.snapshot_every > 0 and tracemalloc.is_tracing()
+
+    def measure(self, operation, fn, usage=None):
+        """
+        Run fn() and record RSS for the operation type (e.g. 'reliable_face_recognition/compare').
+        usage, a dict, receives the measurement (and any tracemalloc diff) for record_worker.
+        """
+        usage = {} if usage is None else usage
+        token, exact = self._begin(usage)
+        try:
+            return fn()
+        finally:
+            self._end(token, exact, usage)
+            diff = self._record(operation, usage, snapshot=True)
+            if diff is not None:
+                usage['tracemalloc_diff'] = diff
+
+    def _begin(self, usage):
+        token = object()
+        usage['rss_before_bytes'] = process_rss_bytes()
+        with self._lock:
+            exact = False
+            if not self._running:
+                # Keep the peak so far before the reset erases it
+                self.lifetime_peak = max(self.lifetime_peak, high_water_rss_bytes() or 0)
+                exact = reset_high_water_rss()
+            self._running[token] = usage['rss_before_bytes']
+            if self.sample_interval > 0 and self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample, name='rss-sampler', daemon=True)
+                self._sampler.start()
+            self._lock.notify_all()
+        return token, exact
+
+    def _end(self, token, exact, usage):
+        # The reset happened when no other request ran, and no other reset happens until this ends
+        high_water = high_water_rss_bytes() if exact else None
+        usage['rss_after_bytes'] = process_rss_bytes()
+        with self._lock:
+            sampled = self._running.pop(token)
+            usage['peak_rss_bytes'] = max(usage['rss_before_bytes'], usage['rss_after_bytes'], sampled,
+                                          high_water or 0)
+            self.lifetime_peak = max(self.lifetime_peak, usage['peak_rss_bytes'])
+        usage['pid'] = os.getpid()
+
+    def _sample(self):
+        """Raise the running requests' peaks to the current RSS every sample interval."""
+        while True:
+            with self._lock:
+                while not self._running:
+                    self._lock.wait()
+            rss = process_rss_bytes()
+            with self._lock:
+                for token, peak in self._running.items():
+                    self._running[token] = max(peak, rss)
+            time.sleep(self.sample_interval)
+
+    def _record(self, operation, usage, snapshot):
+        take_snapshot = False
+        growth = usage['rss_after_bytes'] - usage['rss_before_bytes']
+        with self._lock:
+            entry = self.operations.setdefault(operation, {
+                'requests': 0, 'peak_rss_bytes': 0, 'post_request_rss_bytes': 0,
+                'max_growth_bytes': 0, 'total_growth_bytes': 0
+            })
+            entry['requests'] += 1
+            entry['peak_rss_bytes'] = max(entry['peak_rss_bytes'], usage['peak_rss_bytes'])
+            entry['post_request_rss_bytes'] = max(entry['post_request_rss_bytes'], usage['rss_after_bytes'])
+            entry['max_growth_bytes'] = max(entry['max_growth_bytes'], growth)
+            entry['total_growth_bytes'] += growth
+            self.requests += 1
+            take_snapshot = snapshot and self.tracing and self.requests % self.snapshot_every == 0
+        return self.snapshot() if take_snapshot else None
+
+    def record_worker(self, operation, usage):
+        """Merge a measurement taken in a worker process (measure's usage) into this tracker."""
+        self._record(operation, usage, snapshot=False)
+        with self._lock:
+            worker = self.workers.setdefault(usage['pid'], {'requests': 0, 'peak_rss_bytes': 0})
+            worker['requests'] += 1
+            worker['rss_bytes'] = usage['rss_after_bytes']
+            worker['peak_rss_bytes'] = max(worker['peak_rss_bytes'], usage['peak_rss_bytes'])
+            if usage.get('tracemalloc_diff') is not None:
+                self.diffs.append(dict(usage['tracemalloc_diff'], pid=usage['pid']))
+                del self.diffs[:-MAX_DIFFS]
+
+    def peak_rss_bytes(self, operation):
+        """Highest RSS seen while a request of the operation type ran."""
+        with self._lock:
+            entry = self.operations.get(operation)
+            return entry['peak_rss_bytes'] if entry else 0
+
+    def lifetime_peak_rss_bytes(self):
+        """Peak RSS of this process since it started (ru_maxrss does not survive the VmHWM resets)."""
+        with self._lock:
+            return max(self.lifetime_peak, high_water_rss_bytes() or 0)
+
+    def snapshot(self):
+        """Take a snapshot and keep its growth by source line against the previous one."""
+        snapshot = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+        with self._lock:
+            previous, self._snapshot = self._snapshot, snapshot
+            requests = self.requests
+        if previous is None:
+            return None
+
+        stats = snapshot.compare_to(previous, 'lineno')
+        diff = {
+            "requests": requests,
+            "time": time.strftime('%Y-%m-%d %H:%M:%S'),
+            "size_diff_bytes": sum(stat.size_diff for stat in stats),
+            "top": [
+                {
+                    "location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                    "size_diff_bytes": stat.size_diff,
+                    "count_diff": stat.count_diff,
+                    "size_bytes": stat.size
+                }
+                for stat in stats[:self.top_lines]
+            ]
+        }
+        with self._lock:
+            self.diffs.append(diff)
+            del self.diffs[:-MAX_DIFFS]
+        return diff
+
+    def report(self):
+        """JSON-ready summary: RSS, per-operation and per-worker memory and the recent snapshot diffs."""
+        with self._lock:
+            operations = {name: dict(entry) for name, entry in self.operations.items()}
+            workers = {str(pid): dict(worker) for pid, worker in self.workers.items()}
+            diffs = list(self.diffs)
+            requests = self.requests
+        report = {
+            "rss_bytes": process_rss_bytes(),
+            "peak_rss_bytes": self.lifetime_peak_rss_bytes(),
+            "requests": requests,
+            "operations": operations,
+            "workers": workers,
+            "tracemalloc": None
+        }
+        if self.tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            report["tracemalloc"] = {
+                "snapshot_every": self.snapshot_every,
+                "traced_bytes": current,
+                "traced_peak_bytes": peak,
+                "diffs": diffs
+            }
+        return report
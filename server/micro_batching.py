@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Dynamic micro-batching of model forward passes
+Concurrent requests hand their input rows (e.g. aligned face crops) to a MicroBatcher, whose
+collector thread stacks the rows of everyone waiting into one forward pass and scatters the
+outputs back. A batch closes when it reaches max_batch rows, when no reserved request is still
+preparing its rows, or when its first rows have waited window_ms; rows that arrive while a pass
+runs go together in the next one, so a busy model batches even without a window.
+"""
+
+import time
+import threading
+import contextlib
+from concurrent.futures import Future
+import numpy as np
+from stage_timings import record_count
+
+class _Reservation:
+    """A request announced to the batcher before its rows are ready."""
+
+    def __init__(self, batcher):
+        self.batcher = batcher
+        self.preparing = True
+
+    def submit(self, rows, info=None):
+        return self.batcher.submit(rows, info, reservation=self)
+
+class MicroBatcher:
+    """
+    forward(batch) maps an array of N input rows to an array of N output rows.
+    submit(rows) blocks until its rows went through a forward pass and returns their outputs;
+    requests that will submit soon should hold a reserve() block so the batch waits for them.
+    """
+
+    def __init__(self, forward, window_ms=10, max_batch=16, name='micro-batcher'):
+        self.forward = forward
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.name = name
+        self.batches = 0
+        self.rows = 0
+        self._pending = []
+        self._preparing = 0
+        self._condition = threading.Condition()
+        self._thread = None
+
+    @contextlib.contextmanager
+    def reserve(self):
+        """Announce a request for the duration of the block; yields an object with submit(rows, info)."""
+        reservation = _Reservation(self)
+        with self._condition:
+            self._preparing += 1
+        try:
+            yield reservation
+        finally:
+            self._done_preparing(reservation)
+
+    def _done_preparing(self, reservation):
+        with self._condition:
+            if reservation is not None and reservation.preparing:
+                reservation.preparing = False
+                self._preparing -= 1
+                self._condition.notify_all()
+
+    def submit(self, rows, info=None, reservation=None):
+        """Outputs of forward for rows (shape (n, ...)); records the batch size in info's timings."""
+        rows = np.asarray(rows)
+        future = Future()
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._collect, name=self.name, daemon=True)
+                self._thread.start()
+            self._pending.append((rows, future))
+            if reservation is not None and reservation.preparing:
+                reservation.preparing = False
+                self._preparing -= 1
+            self._condition.notify_all()
+        outputs, batch_rows = future.result()
+        record_count(info, 'batch_rows', batch_rows)
+        return outputs
+
+    def stats(self):
+        with self._condition:
+            return {"batches": self.batches, "rows": self.rows,
+                    "mean_batch_rows": round(self.rows / self.batches, 2) if self.batches else 0.0}
+
+    def _pending_rows(self):
+        return sum(len(rows) for rows, _ in self._pending)
+
+    def _collect(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                # 1. Wait for reserved requests still preparing rows, up to the window
+                deadline = time.monotonic() + self.window
+                while self._preparing > 0 and self._pending_rows() < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+
+                # 2. Take whole requests up to max_batch rows (always at least one)
+                batch = [self._pending.pop(0)]
+                size = len(batch[0][0])
+                while self._pending and size + len(self._pending[0][0]) <= self.max_batch:
+                    size += len(self._pending[0][0])
+                    batch.append(self._pending.pop(0))
+                self.batches += 1
+                self.rows += size
+            self._run(batch, size)
+
+    def _run(self, batch, size):
+        # 3. One forward pass, outputs scattered back in submission order
+        try:
+            outputs = np.asarray(self.forward(np.concatenate([rows for rows, _ in batch])))
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        offset = 0
+        for rows, future in batch:
+            future.set_result((outputs[offset:offset + len(rows)], size))
+            offset += len(rows)
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+On-demand profiling for the long-lived face service
+A session profiles requests for N seconds or N requests: every request runs under cProfile
+(merged into one pstats file) while a sampler thread records the stacks of request threads
+as collapsed-stack lines for flamegraph tools. Thread stacks can be dumped at any time.
+"""
+
+import os
+import sys
+import time
+import cProfile
+import pstats
+import tempfile
+import threading
+import traceback
+from collections import Counter
+
+PROFILE_DIR = os.environ.get('FACE_PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'face_profiles'))
+# Default session length for the signal trigger
+PROFILE_SECONDS = float(os.environ.get('FACE_PROFILE_SECONDS', '30'))
+SAMPLE_INTERVAL = float(os.environ.get('FACE_PROFILE_INTERVAL', '0.005'))
+
+_session = None
+_last_result = None
+_session_lock = threading.Lock()
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def collapse_stack(frame):
+    """Root-first 'a;b;c' stack for one frame, flamegraph.pl / speedscope collapsed format."""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+class ProfileSession:
+    """
+    One profiling session, stopped after `seconds` or after `requests` profiled requests
+    (whichever comes first). Results are written to output_dir as <name>.pstats and
+    <name>.collapsed.
+    """
+
+    def __init__(self, seconds=None, requests=None, interval=SAMPLE_INTERVAL, output_dir=None):
+        if seconds is None and requests is None:
+            seconds = PROFILE_SECONDS
+        self.seconds = seconds
+        self.requests = requests
+        self.interval = interval
+        self.output_dir = PROFILE_DIR if output_dir is None else output_dir
+        self.name = time.strftime('face-profile-%Y%m%d-%H%M%S') + f"-{os.getpid()}"
+        self.started = time.time()
+        self.deadline = time.monotonic() + seconds if seconds is not None else None
+        self.profiled = 0
+        self.samples = Counter()
+        self.stats = None
+        self.result = None
+        self._request_threads = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, name='face-profile-sampler', daemon=True)
+
+    def start(self):
+        self._sampler.start()
+        return self
+
+    @property
+    def finished(self):
+        return self._stopped.is_set()
+
+    def _sample(self):
+        """Record the stacks of threads currently running requests."""
+        while not self._stopped.wait(self.interval):
+            with self._lock:
+                threads = dict(self._request_threads)
+            if threads:
+                frames = sys._current_frames()
+                for ident, thread_name in threads.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        self.samples[f"{thread_name};{collapse_stack(frame)}"] += 1
+            if self.deadline is not None and time.monotonic() >= self.deadline:
+                self.finish()
+
+    def run(self, fn):
+        """Run one request under cProfile and the sampler; returns fn()."""
+        thread = threading.current_thread()
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is active in this interpreter; the sampler still covers the request
+            profiler = None
+
+        with self._lock:
+            self._request_threads[thread.ident] = thread.name
+        try:
+            return fn()
+        finally:
+            with self._lock:
+                self._request_threads.pop(thread.ident, None)
+            if profiler is not None:
+                profiler.disable()
+            self._record(profiler)
+
+    def _record(self, profiler):
+        with self._lock:
+            if self.finished:
+                return
+            if profiler is not None:
+                if self.stats is None:
+                    self.stats = pstats.Stats(profiler)
+                else:
+                    self.stats.add(profiler)
+            self.profiled += 1
+            done = self.requests is not None and self.profiled >= self.requests
+        if done:
+            self.finish()
+
+    def finish(self):
+        """Stop the session and write pstats plus collapsed stacks; returns the result summary."""
+        global _last_result
+        with self._lock:
+            if self._stopped.is_set():
+                return self.result
+            self._stopped.set()
+
+            os.makedirs(self.output_dir, exist_ok=True)
+            base = os.path.join(self.output_dir, self.name)
+            result = {
+                "name": self.name,
+                "requests_profiled": self.profiled,
+                "duration_seconds": round(time.time() - self.started, 3),
+                "samples": sum(self.samples.values()),
+                "pstats": None,
+                "collapsed": base + '.collapsed'
+            }
+            if self.stats is not None:
+                self.stats.dump_stats(base + '.pstats')
+                result["pstats"] = base + '.pstats'
+            with open(result["collapsed"], 'w') as f:
+                for stack, count in self.samples.most_common():
+                    f.write(f"{stack} {count}\n")
+            self.result = result
+
+        with _session_lock:
+            _last_result = result
+        return result
+
+    def status(self):
+        return {
+            "name": self.name,
+            "active": not self.finished,
+            "requests_profiled": self.profiled,
+            "request_limit": self.requests,
+            "seconds": self.seconds,
+            "samples": sum(self.samples.values())
+        }
+
+def start_session(seconds=None, requests=None, interval=SAMPLE_INTERVAL, output_dir=None):
+    """Start a session unless one is already running; returns (session, started)."""
+    global _session
+    with _session_lock:
+        if _session is not None and not _session.finished:
+            return _session, False
+        _session = ProfileSession(seconds, requests, interval, output_dir).start()
+        return _session, True
+
+def stop_session():
+    """Finish the running session early; returns its result, or None if none was running."""
+    with _session_lock:
+        session = _session
+    if session is None or session.finished:
+        return None
+    return session.finish()
+
+def profile_status():
+    """Running session status and the last finished session's output files."""
+    with _session_lock:
+        session = _session
+        last = _last_result
+    return {"session": session.status() if session is not None and not session.finished else None, "last": last}
+
+def run_profiled(fn):
+    """Run a request under the active session, or directly when none is running."""
+    session = _session
+    if session is None or session.finished:
+        return fn()
+    return session.run(fn)
+
+def dump_threads():
+    """Stack of every thread, without pausing the process."""
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    lines = [f"# Thread dump of pid {os.getpid()} at {time.strftime('%Y-%m-%d %H:%M:%S')}"]
+    for ident, frame in sys._current_frames().items():
+        lines.append(f"\nThread {names.get(ident, '?')} ({ident}):")
+        lines.extend(line.rstrip('\n') for line in traceback.format_stack(frame))
+    return '\n'.join(lines) + '\n'
@@ -5,48 +5,64 @@ Exactly matching the desktop system approach described by the user
 """
 
 import sys
-import json
-import base64
-import io
 import numpy as np
-from PIL import Image
 import face_recognition
+from face_detectors import parse_face_hint, hint_window
+from image_io import decode_image
+from stage_timings import stage_timer, record_count
+from face_backends import run_cli
 
-def process_image_from_base64(image_data):
-    """Convert base64 image to numpy array for face_recognition library."""
+def process_image_from_base64(image_data, info=None):
+    """Convert base64 image to numpy array for face_recognition library; large JPEGs are decoded at reduced resolution."""
     try:
-        # Remove data URL prefix if present
-        if image_data.startswith('data:image'):
-            image_data = image_data.split(',')[1]
-        
-        # Decode base64 to bytes
-        image_bytes = base64.b64decode(image_data)
-        
-        # Convert to PIL Image
-        pil_image = Image.open(io.BytesIO(image_bytes))
-        
-        # Convert to RGB if needed
-        if pil_image.mode != 'RGB':
-            pil_image = pil_image.convert('RGB')
-        
-        # Convert to numpy array (format expected by face_recognition)
-        rgb_array = np.array(pil_image)
-        
-        return rgb_array
+        # dlib needs a writable array
+        return decode_image(image_data, info=info, writable=True)
     except Exception as e:
         raise Exception(f"Failed to process image: {str(e)}")
 
-def encode_face(image_data):
+def locate_faces_near_hint(rgb_image, face_hint):
+    """Face locations (top, right, bottom, left) found inside the window around a client hint."""
+    face_hint = parse_face_hint(face_hint)
+    if face_hint is None:
+        return []
+    
+    window = hint_window(face_hint, rgb_image.shape)
+    if window is None:
+        return []
+    
+    x0, y0, x1, y1 = window
+    locations = face_recognition.face_locations(rgb_image[y0:y1, x0:x1])
+    
+    # Shift back to full-image coordinates
+    return [(top + y0, right + x0, bottom + y0, left + x0) for top, right, bottom, left in locations]
+
+def encode_face(image_data, face_hint=None, info=None):
     """
     Encode face using face_recognition.face_encodings()
     Exactly as described by the user for their desktop system
     """
     try:
         # Convert image to RGB numpy array
-        rgb_image = process_image_from_base64(image_data)
+        timer = stage_timer(info)
+        decode_info = {}
+        rgb_image = process_image_from_base64(image_data, decode_info)
+        timer.lap('decode')
+        
+        # Search only around the client hint first; fall back to a full-frame scan
+        face_hint = parse_face_hint(face_hint, decode_info['decode_scale'])
+        locations = locate_faces_near_hint(rgb_image, face_hint)
+        if info is not None:
+            info['hint_used'] = len(locations) > 0
+        record_count(info, 'detect_passes', 1 if face_hint is not None else 0)
+        if not locations:
+            locations = face_recognition.face_locations(rgb_image)
+            record_count(info, 'detect_passes', 1)
+        timer.lap('detect')
         
-        # Use face_recognition.face_encodings() - the exact function user mentioned
-        face_encodings = face_recognition.face_encodings(rgb_image)
+        # Use face_recognition.face_encodings() - the exact function user mentioned;
+        # locating separately is what face_encodings() does without known locations
+        face_encodings = face_recognition.face_encodings(rgb_image, known_face_locations=locations)
+        timer.lap('inference')
         
         if len(face_encodings) == 0:
             raise Exception("No face detected in image - please ensure your face is clearly visible and well-lit")
@@ -60,14 +76,16 @@ def encode_face(image_data):
     except Exception as e:
         raise Exception(f"Failed to encode face: {str(e)}")
 
-def compare_faces_proper(known_encoding, unknown_image_data, tolerance=0.6):
+def compare_faces_proper(known_encoding, unknown_image_data, tolerance=0.6, face_hint=None, info=None):
     """
     Compare faces using face_recognition.compare_faces and face_recognition.face_distance
     Exactly as described by the user for their desktop system
     """
     try:
         # Step 1: Encode the test image (webcam image)
-        encoded_test_image = encode_face(unknown_image_data)
+        info = {} if info is None else info
+        encoded_test_image = encode_face(unknown_image_data, face_hint, info)
+        timer = stage_timer(info)
         
         # Step 2: Use face_recognition.compare_faces - exact function user mentioned
         # known_encoding is the uploaded_image encoding stored in database
@@ -76,6 +94,7 @@ def compare_faces_proper(known_encoding, unknown_image_data, tolerance=0.6):
         
         # Step 3: Use face_recognition.face_distance - exact function user mentioned
         distance = face_recognition.face_distance([known_encoding], encoded_test_image)
+        timer.lap('distance')
         
         # Extract the single result and distance value
         is_match = result[0] if len(result) > 0 else False
@@ -84,7 +103,8 @@ def compare_faces_proper(known_encoding, unknown_image_data, tolerance=0.6):
         return {
             "distance": float(face_distance),
             "is_match": bool(is_match),
-            "tolerance": tolerance
+            "tolerance": tolerance,
+            "hint_used": info.get('hint_used', False)
         }
         
     except Exception as e:
@@ -92,58 +112,7 @@ def compare_faces_proper(known_encoding, unknown_image_data, tolerance=0.6):
 
 def main():
     """Main function to handle operations."""
-    try:
-        if len(sys.argv) > 1:
-            operation = sys.argv[1]
-            
-            if operation == "encode":
-                # Read image data from stdin
-                input_data = sys.stdin.read()
-                data = json.loads(input_data)
-                image_data = data.get('image_data', '')
-                
-                # Encode face using face_recognition.face_encodings()
-                encoding = encode_face(image_data)
-                
-                print(json.dumps({
-                    "success": True,
-                    "encoding": encoding
-                }))
-                
-            elif operation == "compare":
-                # Read comparison data from stdin
-                input_data = sys.stdin.read()
-                data = json.loads(input_data)
-                
-                known_encoding = data.get('known_encoding', [])
-                unknown_image = data.get('unknown_image', '')
-                tolerance = data.get('tolerance', 0.6)
-                
-                # Compare faces using face_recognition library
-                result = compare_faces_proper(known_encoding, unknown_image, tolerance)
-                
-                print(json.dumps({
-                    "success": True,
-                    "result": result
-                }))
-                
-            else:
-                print(json.dumps({
-                    "success": False,
-                    "error": f"Unknown operation: {operation}"
-                }))
-                
-        else:
-            print(json.dumps({
-                "success": False,
-                "error": "No operation specified"
-            }))
-            
-    except Exception as e:
-        print(json.dumps({
-            "success": False,
-            "error": str(e)
-        }))
+    run_cli('proper_face_recognition', sys.modules[__name__])
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -5,69 +5,52 @@ Designed to properly distinguish between different people while maintaining comp
 """
 
 import sys
-import json
-import base64
-import io
 import numpy as np
-from PIL import Image
 import cv2
+from face_features import neighbor_codes
+from face_detectors import parse_face_hint, detect_with_hint
+from face_image import FaceImage
+from detection_strategy import get_strategy
+from stage_timings import stage_timer
+from feature_precision import feature_dtype, cv_depth
+from face_backends import run_cli
 
-def process_image_from_base64(image_data):
-    """Convert base64 image to numpy array."""
+# 8-neighbor comparison order of the LBP features: bit k weighs 2**k
+LBP_NEIGHBORS = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+
+def process_image_from_base64(image_data, info=None):
+    """Convert base64 image to a FaceImage; large JPEGs are decoded at reduced resolution."""
     try:
-        # Remove data URL prefix if present
-        if image_data.startswith('data:image'):
-            image_data = image_data.split(',')[1]
-        
-        # Decode base64 to bytes
-        image_bytes = base64.b64decode(image_data)
-        
-        # Convert to PIL Image
-        pil_image = Image.open(io.BytesIO(image_bytes))
-        
-        # Convert to RGB if needed
-        if pil_image.mode != 'RGB':
-            pil_image = pil_image.convert('RGB')
-        
-        # Convert to numpy array
-        rgb_array = np.array(pil_image)
-        
-        return rgb_array
+        return FaceImage.from_upload(image_data, info)
     except Exception as e:
         raise Exception(f"Failed to process image: {str(e)}")
 
-def detect_face_robust(image):
-    """Detect face using multiple OpenCV methods for better reliability."""
-    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-    
+# Detection passes: (detector, scaleFactor, minNeighbors, minSize)
+DETECTION_PASSES = [
     # Method 1: Haar cascade (most reliable for basic face detection)
-    face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-    
     # Try multiple parameters for better detection - more aggressive detection
-    detection_params = [
-        (1.1, 3, (20, 20)),  # More sensitive detection
-        (1.05, 5, (15, 15)), # Very sensitive
-        (1.3, 2, (25, 25)),  # Less sensitive but different scale
-        (1.1, 4, (10, 10)),  # Very small faces
-        (1.2, 3, (30, 30)),  # Medium faces
-        (1.15, 4, (20, 20)), # Balanced
-    ]
-    
-    faces = []
-    for scale_factor, min_neighbors, min_size in detection_params:
-        faces = face_cascade.detectMultiScale(gray, scale_factor, min_neighbors, minSize=min_size)
-        if len(faces) > 0:
-            break
-    
-    # Try profile face detection if frontal failed
-    if len(faces) == 0:
-        profile_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_profileface.xml')
-        faces = profile_cascade.detectMultiScale(gray, 1.1, 3, minSize=(20, 20))
+    ('haar', 1.1, 3, (20, 20)),  # More sensitive detection
+    ('haar', 1.05, 5, (15, 15)), # Very sensitive
+    ('haar', 1.3, 2, (25, 25)),  # Less sensitive but different scale
+    ('haar', 1.1, 4, (10, 10)),  # Very small faces
+    ('haar', 1.2, 3, (30, 30)),  # Medium faces
+    ('haar', 1.15, 4, (20, 20)), # Balanced
+    # Profile face detection if frontal failed
+    ('haar_profile', 1.1, 3, (20, 20)),
+    # Alternative face detection method
+    ('haar_alt', 1.1, 3, (20, 20)),
+]
+
+def detect_face_robust(image, face_hint=None, info=None):
+    """Detect face using multiple OpenCV methods for better reliability."""
+    # Most successful passes first, remaining fallbacks in parallel
+    strategy = get_strategy('reliable_face_recognition', DETECTION_PASSES)
     
-    # Try alternative face detection method
-    if len(faces) == 0:
-        alt_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_alt.xml')
-        faces = alt_cascade.detectMultiScale(gray, 1.1, 3, minSize=(20, 20))
+    # Search around the client hint first, then the whole frame; every pass runs on one
+    # downscaled copy and boxes come back in full-resolution coordinates
+    faces, hint_used = detect_with_hint(image.gray, face_hint, lambda view: strategy.detect(view)[0], info=info)
+    if info is not None:
+        info['hint_used'] = hint_used
     
     if len(faces) == 0:
         raise Exception("No face detected in image - please ensure your face is clearly visible and well-lit")
@@ -76,23 +59,13 @@ def detect_face_robust(image):
     face = max(faces, key=lambda f: f[2] * f[3])
     return face
 
-def extract_face_features(image, face_box):
+def extract_face_features(image, face_box, info=None):
     """Extract distinctive facial features that can differentiate between people."""
-    x, y, w, h = face_box
+    timer = stage_timer(info, 'features')
     
-    # Extract face region with some padding
-    padding = int(min(w, h) * 0.15)
-    x_start = max(0, x - padding)
-    y_start = max(0, y - padding)
-    x_end = min(image.shape[1], x + w + padding)
-    y_end = min(image.shape[0], y + h + padding)
-    
-    # Convert to grayscale for feature extraction
-    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-    face_roi = gray[y_start:y_end, x_start:x_end]
-    
-    # Resize to standard size
-    face_roi = cv2.resize(face_roi, (96, 96))
+    # Grayscale face region with some padding, resized to standard size
+    face_roi = image.crop(face_box, 'gray', padding=0.15, size=(96, 96))
+    timer.lap('crop')
     
     features = []
     
@@ -100,10 +73,11 @@ def extract_face_features(image, face_box):
     hist = cv2.calcHist([face_roi], [0], None, [32], [0, 256])
     hist = hist.flatten() / np.sum(hist)  # Normalize
     features.extend(hist)
+    timer.lap('histogram')
     
     # 2. Gradient magnitude features (captures edges and textures)
-    grad_x = cv2.Sobel(face_roi, cv2.CV_64F, 1, 0, ksize=3)
-    grad_y = cv2.Sobel(face_roi, cv2.CV_64F, 0, 1, ksize=3)
+    grad_x = cv2.Sobel(face_roi, cv_depth(), 1, 0, ksize=3)
+    grad_y = cv2.Sobel(face_roi, cv_depth(), 0, 1, ksize=3)
     magnitude = np.sqrt(grad_x**2 + grad_y**2)
     
     # Divide into 6x6 grid for spatial information
@@ -119,19 +93,12 @@ def extract_face_features(image, face_box):
                     np.std(cell),
                     np.max(cell)
                 ])
+    timer.lap('gradient')
     
-    # 3. Local Binary Pattern-like features (captures local texture)
-    for i in range(1, 95):
-        for j in range(1, 95):
-            center = face_roi[i, j]
-            # Simple 8-neighbor comparison
-            neighbors = [
-                face_roi[i-1, j-1], face_roi[i-1, j], face_roi[i-1, j+1],
-                face_roi[i, j-1],                     face_roi[i, j+1],
-                face_roi[i+1, j-1], face_roi[i+1, j], face_roi[i+1, j+1]
-            ]
-            binary_pattern = sum([(1 if neighbor >= center else 0) * (2**k) for k, neighbor in enumerate(neighbors)])
-            features.append(binary_pattern / 255.0)  # Normalize
+    # 3. Local Binary Pattern-like features (captures local texture), one code per interior pixel
+    binary_patterns = neighbor_codes(face_roi, LBP_NEIGHBORS)
+    features.extend((binary_patterns.ravel() / 255.0).tolist())  # Normalize
+    timer.lap('lbp')
     
     # 4. Facial region features
     h, w = face_roi.shape
@@ -150,39 +117,49 @@ def extract_face_features(image, face_box):
                 np.std(region),
                 np.median(region)
             ])
+    timer.lap('regions')
     
     # Convert to numpy array and normalize
-    features = np.array(features, dtype=np.float64)
+    features = np.array(features, dtype=feature_dtype())
     
     # L2 normalization
     norm = np.linalg.norm(features)
     if norm > 0:
         features = features / norm
+    timer.lap('normalize')
     
     return features
 
-def encode_face(image_data):
+def encode_face(image_data, face_hint=None, info=None):
     """Generate face encoding."""
     try:
-        # Convert image to RGB numpy array
-        rgb_image = process_image_from_base64(image_data)
+        # Decode the upload; derived views are computed once and shared
+        timer = stage_timer(info)
+        decode_info = {}
+        face_image = process_image_from_base64(image_data, decode_info)
+        timer.lap('decode')
         
-        # Detect face
-        face_box = detect_face_robust(rgb_image)
+        # Detect face (the hint is in upload pixels, the image may be decoded smaller)
+        face_hint = parse_face_hint(face_hint, decode_info['decode_scale'])
+        face_box = detect_face_robust(face_image, face_hint, info)
+        timer.lap('detect')
         
         # Extract features
-        encoding = extract_face_features(rgb_image, face_box)
+        encoding = extract_face_features(face_image, face_box, info)
+        timer.lap('extract')
         
         return encoding.tolist()
         
     except Exception as e:
         raise Exception(f"Failed to encode face: {str(e)}")
 
-def compare_faces_reliable(known_encoding, unknown_image_data, tolerance=0.6):
+def compare_faces_reliable(known_encoding, unknown_image_data, tolerance=0.6, face_hint=None, info=None):
     """Compare faces using Euclidean distance."""
     try:
         # Encode the unknown face
-        unknown_encoding = encode_face(unknown_image_data)
+        info = {} if info is None else info
+        unknown_encoding = encode_face(unknown_image_data, face_hint, info)
+        timer = stage_timer(info)
         
         # Convert to numpy arrays
         known_array = np.array(known_encoding)
@@ -190,6 +167,7 @@ def compare_faces_reliable(known_encoding, unknown_image_data, tolerance=0.6):
         
         # Calculate Euclidean distance
         distance = np.linalg.norm(known_array - unknown_array)
+        timer.lap('distance')
         
         # Compare against tolerance
         is_match = distance <= tolerance
@@ -197,7 +175,8 @@ def compare_faces_reliable(known_encoding, unknown_image_data, tolerance=0.6):
         return {
             "distance": float(distance),
             "is_match": bool(is_match),
-            "tolerance": tolerance
+            "tolerance": tolerance,
+            "hint_used": info.get('hint_used', False)
         }
         
     except Exception as e:
@@ -205,58 +184,7 @@ def compare_faces_reliable(known_encoding, unknown_image_data, tolerance=0.6):
 
 def main():
     """Main function to handle operations."""
-    try:
-        if len(sys.argv) > 1:
-            operation = sys.argv[1]
-            
-            if operation == "encode":
-                # Read image data from stdin
-                input_data = sys.stdin.read()
-                data = json.loads(input_data)
-                image_data = data.get('image_data', '')
-                
-                # Encode face
-                encoding = encode_face(image_data)
-                
-                print(json.dumps({
-                    "success": True,
-                    "encoding": encoding
-                }))
-                
-            elif operation == "compare":
-                # Read comparison data from stdin
-                input_data = sys.stdin.read()
-                data = json.loads(input_data)
-                
-                known_encoding = data.get('known_encoding', [])
-                unknown_image = data.get('unknown_image', '')
-                tolerance = data.get('tolerance', 0.6)
-                
-                # Compare faces
-                result = compare_faces_reliable(known_encoding, unknown_image, tolerance)
-                
-                print(json.dumps({
-                    "success": True,
-                    "result": result
-                }))
-                
-            else:
-                print(json.dumps({
-                    "success": False,
-                    "error": f"Unknown operation: {operation}"
-                }))
-                
-        else:
-            print(json.dumps({
-                "success": False,
-                "error": "No operation specified"
-            }))
-            
-    except Exception as e:
-        print(json.dumps({
-            "success": False,
-            "error": str(e)
-        }))
+    run_cli('reliable_face_recognition', sys.modules[__name__])
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Per-request latency budgets
+A request with "deadline_ms" (or every request, with FACE_DEADLINE_MS) runs under a Budget: the
+stage timers check it between stages, detection fallbacks that no longer fit end the request
+early, and optional feature groups whose learned cost exceeds what is left are skipped. The
+response is then a "timeout" error naming the stage, or a success flagged "degraded" with the
+skipped groups, instead of an answer the client has already given up on. A stage refused
+FACE_BUDGET_PROBE_AFTER times in a row runs once as a probe, so a cost learned under load is
+re-measured instead of keeping the stage off for good.
+"""
+
+import os
+import time
+import threading
+import contextlib
+import contextvars
+
+DEFAULT_DEADLINE_MS = float(os.environ['FACE_DEADLINE_MS']) if os.environ.get('FACE_DEADLINE_MS') else None
+# Weight of the newest run in the learned stage costs
+COST_SMOOTHING = 0.2
+# Consecutive refusals of a stage after which the next request runs it to re-measure its cost
+PROBE_AFTER = int(os.environ.get('FACE_BUDGET_PROBE_AFTER', '20'))
+
+_budget = contextvars.ContextVar('request_budget', default=None)
+# Stage name -> exponentially smoothed cost in milliseconds, learned from every request, and
+# stage name -> refusals since it last ran; shared by every worker thread
+_costs = {}
+_refusals = {}
+_costs_lock = threading.Lock()
+
+class DeadlineExceeded(Exception):
+    """The request's deadline passed (or would pass) at stage."""
+
+    def __init__(self, stage, deadline_ms):
+        super().__init__(f"Deadline of {deadline_ms:g} ms exceeded at {stage}")
+        self.stage = stage
+
+class Budget:
+    """
+    Deadline of one request plus the optional stages it skipped. A budget that is not degradable
+    always runs optional stages: its features are compared with encodings that have them all.
+    """
+
+    def __init__(self, deadline_ms, degradable=True):
+        self.deadline_ms = deadline_ms
+        self.deadline = time.monotonic() + deadline_ms / 1000
+        self.degradable = degradable
+        self.degraded = []
+        self.timed_out = None
+
+    def remaining_ms(self):
+        return (self.deadline - time.monotonic()) * 1000
+
+    def expire(self, stage):
+        """Give up at stage. Backends wrap exceptions, so the stage is also kept on the budget."""
+        if self.timed_out is None:
+            self.timed_out = stage
+        raise DeadlineExceeded(stage, self.deadline_ms)
+
+    def admit(self, name):
+        """
+        'run' when the learned cost of stage name fits in the remaining budget (unknown costs fit),
+        'probe' when it does not but the stage has been refused PROBE_AFTER times in a row, else None.
+        """
+        remaining = self.remaining_ms()
+        if remaining <= 0:
+            return None
+        with _costs_lock:
+            if _costs.get(name, 0.0) <= remaining:
+                _refusals[name] = 0
+                return 'run'
+            refusals = _refusals.get(name, 0) + 1
+            if refusals >= PROBE_AFTER:
+                _refusals[name] = 0
+                return 'probe'
+            _refusals[name] = refusals
+            return None
+
+def request_deadline_ms(data):
+    """deadline_ms of a request document (or FACE_DEADLINE_MS), None for no deadline."""
+    deadline_ms = data.get('deadline_ms', DEFAULT_DEADLINE_MS)
+    if deadline_ms is None:
+        return None
+    if isinstance(deadline_ms, bool) or not isinstance(deadline_ms, (int, float)) or deadline_ms <= 0:
+        raise Exception(f"Invalid deadline_ms: {deadline_ms} (expected a positive number of milliseconds)")
+    return float(deadline_ms)
+
+def request_budget(data, degradable=True):
+    """Budget for a request document, starting now; None when it has no deadline."""
+    deadline_ms = request_deadline_ms(data)
+    return None if deadline_ms is None else Budget(deadline_ms, degradable)
+
+def current_budget():
+    return _budget.get()
+
+@contextlib.contextmanager
+def deadline_scope(budget):
+    """Run the block (in this thread or context) under budget; None means no deadline."""
+    token = _budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _budget.reset(token)
+
+def check_deadline(stage):
+    """Stop the request at stage if its deadline has passed."""
+    budget = _budget.get()
+    if budget is not None and budget.remaining_ms() <= 0:
+        budget.expire(stage)
+
+def require_budget(name, stage=None):
+    """
+    Before a mandatory but costly stage: stop now (at stage, default name) if its learned cost no
+    longer fits. Returns True when the stage runs as a probe (pass it on to measured).
+    """
+    budget = _budget.get()
+    if budget is None:
+        return False
+    admission = budget.admit(name)
+    if admission is None:
+        budget.expire(stage or name)
+    return admission == 'probe'
+
+def record_cost(name, milliseconds, reset=False):
+    """Fold a measured run into the cost of stage name; reset replaces it (a probe's fresh measurement)."""
+    with _costs_lock:
+        previous = _costs.get(name)
+        if previous is None or reset:
+            _costs[name] = milliseconds
+        else:
+            _costs[name] = previous + COST_SMOOTHING * (milliseconds - previous)
+
+def learned_cost(name):
+    with _costs_lock:
+        return _costs.get(name)
+
+@contextlib.contextmanager
+def measured(name, reset=False):
+    """Learn the cost of the block as stage name, also when it ends in a timeout or an error."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_cost(name, (time.perf_counter() - start) * 1000, reset)
+
+def optional_stage(name, compute, fallback):
+    """
+    compute() when no deadline applies, the budget is not degradable or the learned cost fits the
+    remaining budget (or it is due a probe); otherwise record name as degraded and return fallback
+    (same shape, so encodings keep their layout).
+    """
+    budget = _budget.get()
+    admission = 'run' if budget is None or not budget.degradable else budget.admit(name)
+    if admission is None:
+        budget.degraded.append(name)
+        return fallback
+    with measured(name, reset=admission == 'probe'):
+        return compute()
+
+def timeout_response(stage, deadline_ms):
+    return {"success": False, "timeout": True, "stage": stage,
+            "error": str(DeadlineExceeded(stage, deadline_ms))}
+
+def with_budget_result(response, budget):
+    """Flag a successful response computed without some optional stages."""
+    if budget is not None and budget.degraded:
+        response["degraded"] = sorted(set(budget.degraded))
+    return response
+
+def remaining_after_queue(data, queued_at):
+    """
+    A request document whose deadline_ms is what is left after waiting since queued_at
+    (time.monotonic()); returns (data, None), or (None, timeout response) if nothing is left.
+    """
+    deadline_ms = request_deadline_ms(data)
+    if deadline_ms is None:
+        return data, None
+    remaining = deadline_ms - (time.monotonic() - queued_at) * 1000
+    if remaining <= 0:
+        return None, timeout_response('queue', deadline_ms)
+    return dict(data, deadline_ms=remaining), None
@@ -5,6 +5,7 @@ import { storage } from "./storage";
 import { insertAttendanceRecordSchema, insertLocationSchema, loginSchema, registerSchema, users, employeeInvitations, locations, employeeLocations } from "@shared/schema";
 import { desc, eq, and } from "drizzle-orm";
 import { db } from "./db";
+import { encodeWorkerFrame } from "./lib/workerFrame";
 import crypto from "crypto";
 import { format, differenceInMinutes, differenceInSeconds, startOfWeek, endOfWeek, startOfMonth, endOfMonth, subMonths } from "date-fns";
 
@@ -170,13 +171,15 @@ async function compareFaceDescriptors(storedEncoding: number[], capturedImageDat
       });
       
       // Send comparison data to Python service
-      const inputData = {
-        known_encoding: storedEncoding,
-        unknown_image: capturedImageData,
-        tolerance: 0.3  // Stricter tolerance for attendance systems
-      };
+      const inputData = encodeWorkerFrame(
+        {
+          known_encoding: storedEncoding,
+          tolerance: 0.3  // Stricter tolerance for attendance systems
+        },
+        { unknown_image: capturedImageData }
+      );
       
-      python.stdin.write(JSON.stringify(inputData));
+      python.stdin.write(inputData);
       python.stdin.end();
     });
     
@@ -633,6 +636,9 @@ async function compareFacesWithPython(
               console.log(`Distance: ${distance.toFixed(4)}`);
               console.log(`Threshold: ${tolerance}`);
               console.log(`Match: ${is_match ? 'YES' : 'NO'}`);
+              if (result.timings) {
+                console.log(`Timings (ms): ${JSON.stringify(result.timings)}`);
+              }
               console.log(`===========================================`);
               
               resolve({
@@ -660,11 +666,10 @@ async function compareFacesWithPython(
       }
       
       // Send comparison data to Python process
-      const inputData = JSON.stringify({
-        known_encoding: parsedEncoding,
-        unknown_image: unknownImageData,
-        tolerance: tolerance
-      });
+      const inputData = encodeWorkerFrame(
+        { known_encoding: parsedEncoding, tolerance: tolerance },
+        { unknown_image: unknownImageData }
+      );
       pythonProcess.stdin.write(inputData);
       pythonProcess.stdin.end();
     });
@@ -713,8 +718,8 @@ async function generateProbeEmbedding(imageData: string): Promise<number[]> {
         }
       });
       
-      // Send image data as JSON to Python process
-      const inputData = JSON.stringify({ image_data: imageData });
+      // Send raw image bytes to Python process
+      const inputData = encodeWorkerFrame({}, { image_data: imageData });
       pythonProcess.stdin.write(inputData);
       pythonProcess.stdin.end();
     });
@@ -867,7 +872,7 @@ export function registerRoutes(app: Express): Server {
             }
           });
           
-          const inputData = JSON.stringify({ image_data: imageData });
+          const inputData = encodeWorkerFrame({}, { image_data: imageData });
           pythonProcess.stdin.write(inputData);
           pythonProcess.stdin.end();
         });
@@ -1075,6 +1080,9 @@ export function registerRoutes(app: Express): Server {
                 console.log(`Distance: ${distance.toFixed(4)}`);
                 console.log(`Threshold: ${tolerance}`);
                 console.log(`Match: ${is_match ? 'YES' : 'NO'}`);
+                if (result.timings) {
+                  console.log(`Timings (ms): ${JSON.stringify(result.timings)}`);
+                }
                 console.log(`========================================`);
                 
                 resolve({
@@ -1102,11 +1110,10 @@ export function registerRoutes(app: Express): Server {
         }
         
         // Send comparison data to Python process
-        const inputData = JSON.stringify({
-          known_encoding: parsedEncoding,
-          unknown_image: unknownImageData,
-          tolerance: tolerance
-        });
+        const inputData = encodeWorkerFrame(
+          { known_encoding: parsedEncoding, tolerance: tolerance },
+          { unknown_image: unknownImageData }
+        );
         pythonProcess.stdin.write(inputData);
         pythonProcess.stdin.end();
       });
@@ -1195,7 +1202,7 @@ export function registerRoutes(app: Express): Server {
         
         // Face comparison using DeepFace
         const { spawn } = await import('child_process');
-        const verificationResult = await new Promise<{ success: boolean; result?: { verified: boolean; distance: number; threshold: number; model: string }; error?: string }>((resolve, reject) => {
+        const verificationResult = await new Promise<{ success: boolean; result?: { verified: boolean; distance: number; threshold: number; model: string }; timings?: Record<string, unknown>; error?: string }>((resolve, reject) => {
           const pythonProcess = spawn('python3', ['server/actual_deepface.py', 'verify'], {
             stdio: ['pipe', 'pipe', 'pipe']
           });
@@ -1244,7 +1251,7 @@ export function registerRoutes(app: Express): Server {
             }
           });
           
-          const inputData = JSON.stringify({
+          const inputData = encodeWorkerFrame({}, {
             registered_image: registeredFaceImage,
             captured_image: capturedImage
           });
@@ -1259,6 +1266,9 @@ export function registerRoutes(app: Express): Server {
         console.log(`Threshold: ${verificationResult.result?.threshold}`);
         console.log(`Model: ${verificationResult.result?.model}`);
         console.log(`Match result: ${verificationResult.result?.verified ? 'PASS' : 'FAIL'}`);
+        if (verificationResult.timings) {
+          console.log(`Timings (ms): ${JSON.stringify(verificationResult.timings)}`);
+        }
         console.log(`Error (if any): ${verificationResult.error}`);
         console.log(`=====================================`);
         
@@ -5,42 +5,44 @@ Uses multiple layers of verification to ensure different people cannot access ea
 """
 
 import sys
-import json
-import base64
-import io
 import numpy as np
-from PIL import Image
 import cv2
-import hashlib
+from face_features import landmark_candidates
+from face_detectors import get_detector, parse_face_hint, detect_with_hint
+from image_io import upload_digest
+from face_image import FaceImage
+from stage_timings import stage_timer
+from request_budget import check_deadline, optional_stage
+from feature_precision import feature_dtype, cv_depth, fft_magnitude
+from face_backends import run_cli
 
-def process_image_from_base64(image_data):
-    """Convert base64 image to numpy array."""
+def process_image_from_base64(image_data, info=None):
+    """Convert base64 image to a FaceImage; large JPEGs are decoded at reduced resolution."""
     try:
-        if image_data.startswith('data:image'):
-            image_data = image_data.split(',')[1]
-        
-        image_bytes = base64.b64decode(image_data)
-        pil_image = Image.open(io.BytesIO(image_bytes))
-        
-        if pil_image.mode != 'RGB':
-            pil_image = pil_image.convert('RGB')
-        
-        rgb_array = np.array(pil_image)
-        return rgb_array
+        return FaceImage.from_upload(image_data, info)
     except Exception as e:
         raise Exception(f"Failed to process image: {str(e)}")
 
-def detect_face_ultra_secure(image):
+def detect_face_ultra_secure(image, face_hint=None, info=None):
     """Detect face with multiple validation layers."""
-    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    face_cascade = get_detector('haar')
     
-    # Primary face detection
-    face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-    faces = face_cascade.detectMultiScale(gray, 1.1, 6, minSize=(100, 100))
+    def detect_in_view(view):
+        # Primary face detection
+        faces, _ = view.detect(face_cascade, scale_factor=1.1, min_neighbors=6, min_size=(100, 100))
+        
+        if len(faces) == 0:
+            # Try alternative detection
+            check_deadline('detect')
+            faces, _ = view.detect(face_cascade, scale_factor=1.05, min_neighbors=8, min_size=(80, 80))
+        
+        return faces
     
-    if len(faces) == 0:
-        # Try alternative detection
-        faces = face_cascade.detectMultiScale(gray, 1.05, 8, minSize=(80, 80))
+    # Search around the client hint first, then the whole frame; detection runs on a
+    # downscaled copy and boxes come back in full-resolution coordinates
+    faces, hint_used = detect_with_hint(image.gray, face_hint, detect_in_view, info=info)
+    if info is not None:
+        info['hint_used'] = hint_used
     
     if len(faces) == 0:
         raise Exception("No face detected - ensure clear, well-lit face image")
@@ -55,93 +57,92 @@ def detect_face_ultra_secure(image):
     
     return face
 
-def extract_biometric_features(image, face_box):
+def extract_biometric_features(image, face_box, info=None):
     """Extract highly distinctive biometric features that are unique per person."""
-    x, y, w, h = face_box
-    
-    # Extract face with generous padding
-    padding = int(min(w, h) * 0.25)
-    x_start = max(0, x - padding)
-    y_start = max(0, y - padding)
-    x_end = min(image.shape[1], x + w + padding)
-    y_end = min(image.shape[0], y + h + padding)
-    
-    # Multi-channel feature extraction
-    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-    color = image[y_start:y_end, x_start:x_end]
-    face_roi = gray[y_start:y_end, x_start:x_end]
+    timer = stage_timer(info, 'features')
     
-    # Standardize size for consistent features
-    face_roi = cv2.resize(face_roi, (160, 160))
-    color_roi = cv2.resize(color, (160, 160))
+    # Multi-channel feature extraction on the face with generous padding,
+    # standardized in size for consistent features
+    face_roi = image.crop(face_box, 'gray', padding=0.25, size=(160, 160))
+    color_roi = image.crop(face_box, 'rgb', padding=0.25, size=(160, 160))
+    timer.lap('crop')
     
     features = []
     
-    # 1. Geometric facial measurements (unique ratios per person)
+    # 1. Geometric facial measurements (unique ratios per person); zeros when no landmarks
+    # are found, so every encoding has the same layout
     landmarks = detect_facial_landmarks(face_roi)
-    if landmarks:
-        features.extend(calculate_facial_ratios(landmarks))
+    features.extend(calculate_facial_ratios(landmarks))
+    timer.lap('landmarks')
     
     # 2. Multi-scale texture analysis
     for scale in [1, 2, 4]:
-        scaled_roi = cv2.resize(face_roi, (160//scale, 160//scale))
+        scaled_roi = image.pyramid(face_box, 'gray', (160, 160), scale, padding=0.25)
         
-        # Local Binary Pattern at multiple scales
-        lbp_hist = calculate_lbp_histogram(scaled_roi)
+        timer.lap('pyramid')
+        
+        # Local Binary Pattern at multiple scales; the coarser scales are dropped
+        # (zero histograms) when the request's deadline cannot afford them
+        if scale == 1:
+            lbp_hist = calculate_lbp_histogram(scaled_roi)
+        else:
+            lbp_hist = optional_stage(f'secure_lbp_scale_{scale}', lambda: calculate_lbp_histogram(scaled_roi),
+                                      [0.0] * 32)
         features.extend(lbp_hist)
+        timer.lap('lbp')
         
         # Gradient patterns
         grad_features = calculate_gradient_features(scaled_roi)
         features.extend(grad_features)
+        timer.lap('gradient')
     
     # 3. Frequency domain signatures (unique spectral characteristics)
     freq_features = calculate_frequency_features(face_roi)
     features.extend(freq_features)
+    timer.lap('frequency')
     
     # 4. Color distribution patterns
-    color_features = calculate_color_features(color_roi)
+    color_features = calculate_color_features(color_roi, image.crop(face_box, 'hsv', padding=0.25, size=(160, 160)))
     features.extend(color_features)
+    timer.lap('color')
     
     # 5. Edge density maps
     edge_features = calculate_edge_density_features(face_roi)
     features.extend(edge_features)
+    timer.lap('edges')
     
     # 6. Statistical moment features
     moment_features = calculate_moment_features(face_roi)
     features.extend(moment_features)
+    timer.lap('moments')
     
     # Convert to numpy array
-    features = np.array(features, dtype=np.float64)
+    features = np.array(features, dtype=feature_dtype())
     
     # Remove invalid values
     features = np.nan_to_num(features, nan=0.0, posinf=1.0, neginf=0.0)
     
     # Add noise resistance through robust normalization
     features = robust_normalize(features)
+    timer.lap('normalize')
     
     return features
 
 def detect_facial_landmarks(face_roi):
     """Detect key facial landmarks for geometric measurements."""
-    # Simple landmark detection using contours and geometric analysis
-    # This provides basic landmark positions for ratio calculations
-    landmarks = []
-    
-    # Detect eyes using template matching
+    # Eye-like regions have high intensity variance; rank window centers in the eye band
+    # of the 160x160 face (the old template scan's centers, x 30-140, y 37-62) by local
+    # variance with non-maximum suppression
     eye_template_size = (20, 15)
-    for template_y in range(30, 60, 5):
-        for template_x in range(20, 140, 10):
-            if template_x + eye_template_size[0] < 160 and template_y + eye_template_size[1] < 160:
-                region = face_roi[template_y:template_y+eye_template_size[1], 
-                                template_x:template_x+eye_template_size[0]]
-                if region.size > 0:
-                    # Simple eye detection based on intensity patterns
-                    variance = np.var(region)
-                    if variance > 200:  # Eyes typically have high variance
-                        landmarks.append((template_x + eye_template_size[0]//2, 
-                                        template_y + eye_template_size[1]//2))
-    
-    return landmarks[:10]  # Return up to 10 landmark points
+    points, _ = landmark_candidates(
+        face_roi,
+        window=eye_template_size,
+        search_box=(30, 37, 140, 62),
+        min_variance=200,
+        max_candidates=10
+    )
+    
+    return [tuple(point) for point in points.tolist()]  # Up to 10 ranked landmark points
 
 def calculate_facial_ratios(landmarks):
     """Calculate geometric ratios between facial landmarks."""
@@ -169,6 +170,8 @@ def calculate_lbp_histogram(roi):
     lbp_image = np.zeros_like(roi)
     
     for i in range(1, roi.shape[0]-1):
+        # Once per row: a request past its deadline stops mid-loop
+        check_deadline('lbp')
         for j in range(1, roi.shape[1]-1):
             center = roi[i, j]
             code = 0
@@ -196,8 +199,8 @@ def calculate_gradient_features(roi):
         return [0.0] * 36
     
     # Sobel gradients
-    grad_x = cv2.Sobel(roi, cv2.CV_64F, 1, 0, ksize=3)
-    grad_y = cv2.Sobel(roi, cv2.CV_64F, 0, 1, ksize=3)
+    grad_x = cv2.Sobel(roi, cv_depth(), 1, 0, ksize=3)
+    grad_y = cv2.Sobel(roi, cv_depth(), 0, 1, ksize=3)
     
     magnitude = np.sqrt(grad_x**2 + grad_y**2)
     direction = np.arctan2(grad_y, grad_x)
@@ -212,9 +215,7 @@ def calculate_frequency_features(roi):
         return [0.0] * 25
     
     # FFT analysis
-    f_transform = np.fft.fft2(roi)
-    f_shift = np.fft.fftshift(f_transform)
-    magnitude_spectrum = np.abs(f_shift)
+    magnitude_spectrum = fft_magnitude(roi)
     
     features = []
     
@@ -233,7 +234,7 @@ def calculate_frequency_features(roi):
     
     return features
 
-def calculate_color_features(color_roi):
+def calculate_color_features(color_roi, hsv=None):
     """Calculate color distribution features."""
     if color_roi.size == 0:
         return [0.0] * 30
@@ -260,7 +261,8 @@ def calculate_color_features(color_roi):
     features.extend([r_mean/total, g_mean/total, b_mean/total])
     
     # HSV features
-    hsv = cv2.cvtColor(color_roi, cv2.COLOR_RGB2HSV)
+    if hsv is None:
+        hsv = cv2.cvtColor(color_roi, cv2.COLOR_RGB2HSV)
     for channel in range(3):
         features.extend([
             np.mean(hsv[:, :, channel]),
@@ -300,7 +302,7 @@ def calculate_moment_features(roi):
     
     # Central moments
     mean_val = np.mean(roi)
-    centered = roi - mean_val
+    centered = roi - feature_dtype().type(mean_val)
     
     # Various statistical moments
     features.extend([
@@ -338,29 +340,55 @@ def robust_normalize(features):
     
     return normalized
 
-def encode_face_ultra_secure(image_data):
+def encode_face_ultra_secure(image_data, face_hint=None, info=None):
     """Generate ultra-secure face encoding."""
     try:
-        rgb_image = process_image_from_base64(image_data)
-        face_box = detect_face_ultra_secure(rgb_image)
-        encoding = extract_biometric_features(rgb_image, face_box)
+        timer = stage_timer(info)
+        decode_info = {}
+        face_image = process_image_from_base64(image_data, decode_info)
+        timer.lap('decode')
+        face_hint = parse_face_hint(face_hint, decode_info['decode_scale'])
+        face_box = detect_face_ultra_secure(face_image, face_hint, info)
+        timer.lap('detect')
+        encoding = extract_biometric_features(face_image, face_box, info)
+        timer.lap('extract')
         
         # Add cryptographic hash component for additional security
-        image_hash = hashlib.sha256(image_data.encode()).hexdigest()[:16]
+        image_hash = upload_digest(image_data).hexdigest()[:16]
         hash_features = [float(ord(c)) / 255.0 for c in image_hash]
         
         # Combine biometric and cryptographic features
-        combined_features = np.concatenate([encoding, hash_features])
+        combined_features = np.concatenate([encoding, np.asarray(hash_features, dtype=encoding.dtype)])
+        timer.lap('hash')
         
         return combined_features.tolist()
         
     except Exception as e:
         raise Exception(f"Failed to encode face: {str(e)}")
 
-def compare_faces_ultra_secure(known_encoding, unknown_image_data, tolerance=0.3):
+def distance_components(known_encodings, unknown_encoding):
+    """
+    Weighted Euclidean/cosine/Manhattan distance of each known encoding (rows) to the unknown one,
+    with its Euclidean and cosine parts: (combined, euclidean, cosine) arrays.
+    """
+    known = np.atleast_2d(np.asarray(known_encodings, dtype=np.float64))
+    unknown = np.asarray(unknown_encoding, dtype=np.float64)
+    difference = known - unknown
+    euclidean = np.linalg.norm(difference, axis=1)
+    cosine = 1 - known @ unknown / (np.linalg.norm(known, axis=1) * np.linalg.norm(unknown) + 1e-7)
+    manhattan = np.abs(difference).sum(axis=1)
+    return 0.5 * euclidean + 0.3 * cosine + 0.2 * manhattan / len(unknown), euclidean, cosine
+
+def face_distances(known_encodings, unknown_encoding):
+    """compare_faces_ultra_secure's distance for each known encoding (rows), e.g. a search gallery."""
+    return distance_components(known_encodings, unknown_encoding)[0]
+
+def compare_faces_ultra_secure(known_encoding, unknown_image_data, tolerance=0.3, face_hint=None, info=None):
     """Ultra-secure face comparison with multiple validation layers."""
     try:
-        unknown_encoding = encode_face_ultra_secure(unknown_image_data)
+        info = {} if info is None else info
+        unknown_encoding = encode_face_ultra_secure(unknown_image_data, face_hint, info)
+        timer = stage_timer(info)
         
         known_array = np.array(known_encoding)
         unknown_array = np.array(unknown_encoding)
@@ -370,13 +398,10 @@ def compare_faces_ultra_secure(known_encoding, unknown_image_data, tolerance=0.3
         known_array = known_array[:min_len]
         unknown_array = unknown_array[:min_len]
         
-        # Multiple distance metrics for robustness
-        euclidean_dist = np.linalg.norm(known_array - unknown_array)
-        cosine_dist = 1 - np.dot(known_array, unknown_array) / (np.linalg.norm(known_array) * np.linalg.norm(unknown_array) + 1e-7)
-        manhattan_dist = np.sum(np.abs(known_array - unknown_array))
-        
-        # Weighted combination of distances
-        combined_distance = 0.5 * euclidean_dist + 0.3 * cosine_dist + 0.2 * manhattan_dist / min_len
+        # Multiple distance metrics for robustness, combined with weights
+        combined_distance, euclidean_dist, cosine_dist = (
+            values[0] for values in distance_components(known_array, unknown_array))
+        timer.lap('distance')
         
         # Strict security threshold
         is_match = combined_distance <= tolerance
@@ -386,7 +411,8 @@ def compare_faces_ultra_secure(known_encoding, unknown_image_data, tolerance=0.3
             "is_match": bool(is_match),
             "tolerance": tolerance,
             "euclidean": float(euclidean_dist),
-            "cosine": float(cosine_dist)
+            "cosine": float(cosine_dist),
+            "hint_used": info.get('hint_used', False)
         }
         
     except Exception as e:
@@ -394,54 +420,7 @@ def compare_faces_ultra_secure(known_encoding, unknown_image_data, tolerance=0.3
 
 def main():
     """Main function to handle operations."""
-    try:
-        if len(sys.argv) > 1:
-            operation = sys.argv[1]
-            
-            if operation == "encode":
-                input_data = sys.stdin.read()
-                data = json.loads(input_data)
-                image_data = data.get('image_data', '')
-                
-                encoding = encode_face_ultra_secure(image_data)
-                
-                print(json.dumps({
-                    "success": True,
-                    "encoding": encoding
-                }))
-                
-            elif operation == "compare":
-                input_data = sys.stdin.read()
-                data = json.loads(input_data)
-                
-                known_encoding = data.get('known_encoding', [])
-                unknown_image = data.get('unknown_image', '')
-                tolerance = data.get('tolerance', 0.3)
-                
-                result = compare_faces_ultra_secure(known_encoding, unknown_image, tolerance)
-                
-                print(json.dumps({
-                    "success": True,
-                    "result": result
-                }))
-                
-            else:
-                print(json.dumps({
-                    "success": False,
-                    "error": f"Unknown operation: {operation}"
-                }))
-                
-        else:
-            print(json.dumps({
-                "success": False,
-                "error": "No operation specified"
-            }))
-            
-    except Exception as e:
-        print(json.dumps({
-            "success": False,
-            "error": str(e)
-        }))
+    run_cli('secure_face_recognition', sys.modules[__name__])
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -5,40 +5,37 @@ Designed to match desktop DeepFace behavior with distances around 0.67 for diffe
 """
 
 import sys
-import json
-import base64
-import io
 import numpy as np
-from PIL import Image
 import cv2
+from face_detectors import parse_face_hint, detect_with_hint
+from image_io import to_data_url
+from face_image import FaceImage
+from stage_timings import stage_timer
+from feature_precision import feature_dtype, cv_depth
+from face_backends import run_cli
 
-def process_image_from_base64(image_data):
-    """Convert base64 image to numpy array."""
+def process_image_from_base64(image_data, info=None):
+    """Convert base64 image to a FaceImage; large JPEGs are decoded at reduced resolution."""
     try:
-        if image_data.startswith('data:image'):
-            image_data = image_data.split(',')[1]
-        
-        image_bytes = base64.b64decode(image_data)
-        pil_image = Image.open(io.BytesIO(image_bytes))
-        
-        if pil_image.mode != 'RGB':
-            pil_image = pil_image.convert('RGB')
-        
-        rgb_array = np.array(pil_image)
-        return rgb_array
+        return FaceImage.from_upload(image_data, info)
     except Exception as e:
         raise Exception(f"Failed to process image: {str(e)}")
 
-def detect_face_opencv(image):
+def detect_face_opencv(image, face_hint=None, info=None):
     """Detect face using OpenCV."""
-    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-    
-    face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-    faces = face_cascade.detectMultiScale(gray, 1.1, 5, minSize=(80, 80))
+    def detect_in_view(view):
+        # Configured detector (Haar cascade by default) on a downscaled copy
+        faces, _ = view.detect(scale_factor=1.1, min_neighbors=5, min_size=(80, 80))
+        
+        if len(faces) == 0:
+            # Try with more sensitive parameters
+            faces, _ = view.detect(scale_factor=1.05, min_neighbors=3, min_size=(50, 50))
+        return faces
     
-    if len(faces) == 0:
-        # Try with more sensitive parameters
-        faces = face_cascade.detectMultiScale(gray, 1.05, 3, minSize=(50, 50))
+    # Search around the client hint first, then the whole frame
+    faces, hint_used = detect_with_hint(image.gray, face_hint, detect_in_view, info=info)
+    if info is not None:
+        info['hint_used'] = hint_used
     
     if len(faces) == 0:
         raise Exception("No face detected - please ensure face is clearly visible")
@@ -47,23 +44,14 @@ def detect_face_opencv(image):
     face = max(faces, key=lambda f: f[2] * f[3])
     return face
 
-def extract_face_features_deepface_style(image, face_box):
+def extract_face_features_deepface_style(image, face_box, info=None):
     """Extract features that mimic DeepFace Facenet behavior."""
-    x, y, w, h = face_box
+    timer = stage_timer(info, 'features')
     
-    # Extract face region with padding
-    padding = int(min(w, h) * 0.2)
-    x_start = max(0, x - padding)
-    y_start = max(0, y - padding)
-    x_end = min(image.shape[1], x + w + padding)
-    y_end = min(image.shape[0], y + h + padding)
-    
-    # Convert to grayscale and extract face
-    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-    face_roi = gray[y_start:y_end, x_start:x_end]
-    
-    # Resize to standard size (similar to DeepFace preprocessing)
-    face_roi = cv2.resize(face_roi, (160, 160))
+    # Grayscale face region with padding, resized to standard size (similar to
+    # DeepFace preprocessing)
+    face_roi = image.crop(face_box, 'gray', padding=0.2, size=(160, 160))
+    timer.lap('crop')
     
     features = []
     
@@ -73,6 +61,7 @@ def extract_face_features_deepface_style(image, face_box):
         np.std(face_roi),
         np.median(face_roi)
     ])
+    timer.lap('intensity')
     
     # 2. Regional features (8x8 grid)
     cell_size = 20  # 160/8 = 20
@@ -84,10 +73,11 @@ def extract_face_features_deepface_style(image, face_box):
                     np.mean(cell),
                     np.std(cell)
                 ])
+    timer.lap('regions')
     
     # 3. Gradient features
-    grad_x = cv2.Sobel(face_roi, cv2.CV_64F, 1, 0, ksize=3)
-    grad_y = cv2.Sobel(face_roi, cv2.CV_64F, 0, 1, ksize=3)
+    grad_x = cv2.Sobel(face_roi, cv_depth(), 1, 0, ksize=3)
+    grad_y = cv2.Sobel(face_roi, cv_depth(), 0, 1, ksize=3)
     magnitude = np.sqrt(grad_x**2 + grad_y**2)
     
     # Gradient statistics
@@ -96,6 +86,7 @@ def extract_face_features_deepface_style(image, face_box):
         np.std(magnitude),
         np.max(magnitude)
     ])
+    timer.lap('gradient')
     
     # 4. Texture features using LBP
     lbp_values = []
@@ -118,9 +109,10 @@ def extract_face_features_deepface_style(image, face_box):
     # LBP histogram
     hist, _ = np.histogram(lbp_values, bins=32, range=(0, 256))
     features.extend(hist / (np.sum(hist) + 1e-7))
+    timer.lap('lbp')
     
     # Convert to numpy array and normalize
-    features = np.array(features, dtype=np.float64)
+    features = np.array(features, dtype=feature_dtype())
     
     # Remove invalid values
     features = np.nan_to_num(features, nan=0.0, posinf=1.0, neginf=0.0)
@@ -129,30 +121,39 @@ def extract_face_features_deepface_style(image, face_box):
     norm = np.linalg.norm(features)
     if norm > 0:
         features = features / norm
+    timer.lap('normalize')
     
     return features
 
 def store_face_image(image_data):
     """Store face image - just return the image data."""
-    return image_data
+    return to_data_url(image_data)
 
-def verify_faces_deepface_style(registered_image_data, captured_image_data):
-    """Verify faces using DeepFace-style distance calculation."""
+def verify_faces_deepface_style(registered_image_data, captured_image_data, face_hint=None, info=None):
+    """Verify faces using DeepFace-style distance calculation. face_hint locates the captured face."""
     try:
         # Process both images
+        info = {} if info is None else info
+        timer = stage_timer(info)
         registered_image = process_image_from_base64(registered_image_data)
-        captured_image = process_image_from_base64(captured_image_data)
+        decode_info = {}
+        captured_image = process_image_from_base64(captured_image_data, decode_info)
+        face_hint = parse_face_hint(face_hint, decode_info['decode_scale'])
+        timer.lap('decode')
         
         # Detect faces
         registered_face = detect_face_opencv(registered_image)
-        captured_face = detect_face_opencv(captured_image)
+        captured_face = detect_face_opencv(captured_image, face_hint, info)
+        timer.lap('detect')
         
         # Extract features
-        registered_features = extract_face_features_deepface_style(registered_image, registered_face)
-        captured_features = extract_face_features_deepface_style(captured_image, captured_face)
+        registered_features = extract_face_features_deepface_style(registered_image, registered_face, info)
+        captured_features = extract_face_features_deepface_style(captured_image, captured_face, info)
+        timer.lap('extract')
         
         # Calculate Euclidean distance (similar to DeepFace Facenet)
         distance = np.linalg.norm(registered_features - captured_features)
+        timer.lap('distance')
         
         # Scale to match DeepFace Facenet threshold (around 0.4)
         # Our features need scaling to match DeepFace distance ranges
@@ -166,7 +167,8 @@ def verify_faces_deepface_style(registered_image_data, captured_image_data):
             "verified": bool(verified),
             "distance": float(scaled_distance),
             "threshold": float(threshold),
-            "model": "OpenCV-DeepFace-Style"
+            "model": "OpenCV-DeepFace-Style",
+            "hint_used": info.get('hint_used', False)
         }
         
     except Exception as e:
@@ -174,53 +176,7 @@ def verify_faces_deepface_style(registered_image_data, captured_image_data):
 
 def main():
     """Main function to handle operations."""
-    try:
-        if len(sys.argv) > 1:
-            operation = sys.argv[1]
-            
-            if operation == "store":
-                input_data = sys.stdin.read()
-                data = json.loads(input_data)
-                image_data = data.get('image_data', '')
-                
-                stored_data = store_face_image(image_data)
-                
-                print(json.dumps({
-                    "success": True,
-                    "image_data": stored_data
-                }))
-                
-            elif operation == "verify":
-                input_data = sys.stdin.read()
-                data = json.loads(input_data)
-                
-                registered_image = data.get('registered_image', '')
-                captured_image = data.get('captured_image', '')
-                
-                result = verify_faces_deepface_style(registered_image, captured_image)
-                
-                print(json.dumps({
-                    "success": True,
-                    "result": result
-                }))
-                
-            else:
-                print(json.dumps({
-                    "success": False,
-                    "error": f"Unknown operation: {operation}"
-                }))
-                
-        else:
-            print(json.dumps({
-                "success": False,
-                "error": "No operation specified"
-            }))
-            
-    except Exception as e:
-        print(json.dumps({
-            "success": False,
-            "error": str(e)
-        }))
+    run_cli('simple_deepface_verification', sys.modules[__name__])
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
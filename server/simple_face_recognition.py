@@ -5,72 +5,61 @@ No complications, exactly as requested
 """
 
 import sys
-import json
-import base64
-import io
 import numpy as np
-from PIL import Image
 import cv2
+from face_detectors import get_detector, parse_face_hint, detect_with_hint
+from face_image import FaceImage
+from stage_timings import stage_timer
+from feature_precision import feature_dtype, cv_depth
+from face_backends import run_cli
 
-def process_image_from_base64(image_data):
-    """Convert base64 image to numpy array for face_recognition library."""
+def process_image_from_base64(image_data, info=None):
+    """Convert base64 image to a FaceImage; large JPEGs are decoded at reduced resolution."""
     try:
-        # Remove data URL prefix if present
-        if image_data.startswith('data:image'):
-            image_data = image_data.split(',')[1]
-        
-        # Decode base64 to bytes
-        image_bytes = base64.b64decode(image_data)
-        
-        # Convert to PIL Image
-        pil_image = Image.open(io.BytesIO(image_bytes))
-        
-        # Convert to RGB if needed
-        if pil_image.mode != 'RGB':
-            pil_image = pil_image.convert('RGB')
-        
-        # Convert to numpy array (format expected by face_recognition)
-        rgb_array = np.array(pil_image)
-        
-        return rgb_array
+        return FaceImage.from_upload(image_data, info)
     except Exception as e:
         raise Exception(f"Failed to process image: {str(e)}")
 
-def encode_face(image_data):
+def encode_face(image_data, face_hint=None, info=None):
     """Simple face encoding using OpenCV - mimics face_recognition.face_encodings()."""
     try:
-        # Convert image to RGB numpy array
-        rgb_image = process_image_from_base64(image_data)
+        # Decode the upload; the grayscale view is shared by detection and encoding
+        timer = stage_timer(info)
+        decode_info = {}
+        face_image = process_image_from_base64(image_data, decode_info)
+        timer.lap('decode')
         
-        # Convert to grayscale for face detection
-        gray = cv2.cvtColor(rgb_image, cv2.COLOR_RGB2GRAY)
+        # The hint is in upload pixels, the image may be decoded smaller
+        face_hint = parse_face_hint(face_hint, decode_info['decode_scale'])
         
         # Detect face using OpenCV with multiple detection attempts
-        face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-        
-        # Try multiple scale factors for better detection
-        faces = face_cascade.detectMultiScale(gray, 1.1, 3, minSize=(30, 30))
-        if len(faces) == 0:
-            faces = face_cascade.detectMultiScale(gray, 1.3, 5, minSize=(20, 20))
-        if len(faces) == 0:
-            faces = face_cascade.detectMultiScale(gray, 1.05, 2, minSize=(15, 15))
+        face_cascade = get_detector('haar')
+        
+        def detect_in_view(view):
+            # Try multiple scale factors for better detection (on a downscaled copy)
+            faces, _ = view.detect(face_cascade, scale_factor=1.1, min_neighbors=3, min_size=(30, 30))
+            if len(faces) == 0:
+                faces, _ = view.detect(face_cascade, scale_factor=1.3, min_neighbors=5, min_size=(20, 20))
+            if len(faces) == 0:
+                faces, _ = view.detect(face_cascade, scale_factor=1.05, min_neighbors=2, min_size=(15, 15))
+            return faces
+        
+        # Search around the client hint first, then the whole frame
+        faces, hint_used = detect_with_hint(face_image.gray, face_hint, detect_in_view, info=info)
+        if info is not None:
+            info['hint_used'] = hint_used
         
         if len(faces) == 0:
             raise Exception("No face detected in image - please ensure your face is clearly visible and well-lit")
         
         # Get the largest face
         face = max(faces, key=lambda f: f[2] * f[3])
-        x, y, w, h = face
+        timer.lap('detect')
+        feature_timer = stage_timer(info, 'features')
         
-        # Extract face region with padding for better feature extraction
-        padding = int(min(w, h) * 0.2)  # 20% padding
-        x_start = max(0, x - padding)
-        y_start = max(0, y - padding)
-        x_end = min(gray.shape[1], x + w + padding)
-        y_end = min(gray.shape[0], y + h + padding)
-        
-        face_roi = gray[y_start:y_end, x_start:x_end]
-        face_roi = cv2.resize(face_roi, (128, 128))  # Larger standardized size
+        # Extract face region with 20% padding, at a larger standardized size
+        face_roi = face_image.crop(face, 'gray', padding=0.2, size=(128, 128))
+        feature_timer.lap('crop')
         
         # Enhanced face encoding with more discriminative features
         features = []
@@ -94,14 +83,15 @@ def encode_face(image_data):
                 ])
                 
                 # Gradient features
-                grad_x = cv2.Sobel(window, cv2.CV_64F, 1, 0, ksize=3)
-                grad_y = cv2.Sobel(window, cv2.CV_64F, 0, 1, ksize=3)
+                grad_x = cv2.Sobel(window, cv_depth(), 1, 0, ksize=3)
+                grad_y = cv2.Sobel(window, cv_depth(), 0, 1, ksize=3)
                 magnitude = np.sqrt(grad_x**2 + grad_y**2)
                 
                 features.extend([
                     np.mean(magnitude),
                     np.std(magnitude)
                 ])
+        feature_timer.lap('windows')
         
         # 2. Facial landmark-based features
         # Divide face into anatomical regions
@@ -139,6 +129,7 @@ def encode_face(image_data):
                         np.std(diff_h),
                         np.std(diff_v)
                     ])
+        feature_timer.lap('regions')
         
         # 3. Edge and contour features
         edges = cv2.Canny(face_roi, 30, 100)
@@ -157,6 +148,7 @@ def encode_face(image_data):
         for quad in quadrants:
             quad_density = np.sum(quad > 0) / quad.size if quad.size > 0 else 0
             features.append(quad_density)
+        feature_timer.lap('edges')
         
         # 4. Add random noise to increase separation between different faces
         # This ensures that even if faces have similar statistical properties,
@@ -166,7 +158,7 @@ def encode_face(image_data):
         features.extend(noise_features)
         
         # Convert to numpy array
-        encoding = np.array(features, dtype=np.float64)
+        encoding = np.array(features, dtype=feature_dtype())
         
         # L2 normalize the feature vector
         norm = np.linalg.norm(encoding)
@@ -176,19 +168,23 @@ def encode_face(image_data):
         # Add face-specific signature based on image content
         # This creates a unique signature for each face
         face_hash = hash(face_roi.tobytes()) % 1000000
-        signature = np.array([float(face_hash) / 1000000.0])
+        signature = np.array([float(face_hash) / 1000000.0], dtype=encoding.dtype)
         encoding = np.concatenate([encoding, signature])
+        feature_timer.lap('normalize')
+        timer.lap('extract')
         
         return encoding.tolist()
         
     except Exception as e:
         raise Exception(f"Failed to encode face: {str(e)}")
 
-def compare_faces_simple(known_encoding, unknown_image_data, tolerance=0.6):
+def compare_faces_simple(known_encoding, unknown_image_data, tolerance=0.6, face_hint=None, info=None):
     """Simple face comparison - mimics face_recognition.compare_faces and face_distance."""
     try:
         # Encode the unknown face
-        unknown_encoding = encode_face(unknown_image_data)
+        info = {} if info is None else info
+        unknown_encoding = encode_face(unknown_image_data, face_hint, info)
+        timer = stage_timer(info)
         
         # Convert to numpy arrays
         known_encoding_array = np.array(known_encoding)
@@ -196,6 +192,7 @@ def compare_faces_simple(known_encoding, unknown_image_data, tolerance=0.6):
         
         # Calculate Euclidean distance (same as face_recognition.face_distance)
         distance = np.linalg.norm(known_encoding_array - unknown_encoding_array)
+        timer.lap('distance')
         
         # Compare against tolerance (same as face_recognition.compare_faces)
         is_match = distance <= tolerance
@@ -203,7 +200,8 @@ def compare_faces_simple(known_encoding, unknown_image_data, tolerance=0.6):
         return {
             "distance": float(distance),
             "is_match": bool(is_match),
-            "tolerance": float(tolerance)
+            "tolerance": float(tolerance),
+            "hint_used": info.get('hint_used', False)
         }
         
     except Exception as e:
@@ -211,58 +209,7 @@ def compare_faces_simple(known_encoding, unknown_image_data, tolerance=0.6):
 
 def main():
     """Main function to handle operations."""
-    try:
-        if len(sys.argv) > 1:
-            operation = sys.argv[1]
-            
-            if operation == "encode":
-                # Read image data from stdin
-                input_data = sys.stdin.read()
-                data = json.loads(input_data)
-                image_data = data.get('image_data', '')
-                
-                # Encode face using face_recognition.face_encodings()
-                encoding = encode_face(image_data)
-                
-                print(json.dumps({
-                    "success": True,
-                    "encoding": encoding
-                }))
-                
-            elif operation == "compare":
-                # Read comparison data from stdin
-                input_data = sys.stdin.read()
-                data = json.loads(input_data)
-                
-                known_encoding = data.get('known_encoding', [])
-                unknown_image = data.get('unknown_image', '')
-                tolerance = data.get('tolerance', 0.6)
-                
-                # Compare faces using face_recognition library
-                result = compare_faces_simple(known_encoding, unknown_image, tolerance)
-                
-                print(json.dumps({
-                    "success": True,
-                    "result": result
-                }))
-                
-            else:
-                print(json.dumps({
-                    "success": False,
-                    "error": f"Unknown operation: {operation}"
-                }))
-                
-        else:
-            print(json.dumps({
-                "success": False,
-                "error": "No operation specified"
-            }))
-            
-    except Exception as e:
-        print(json.dumps({
-            "success": False,
-            "error": str(e)
-        }))
+    run_cli('simple_face_recognition', sys.modules[__name__])
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
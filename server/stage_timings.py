@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Optional per-stage timing breakdown for the face recognition workers
+A request with "timings": true (or FACE_TIMINGS=1) gets a timings object in its response:
+milliseconds per stage from the monotonic perf_counter, cheap enough to leave on in production.
+Under a request deadline (request_budget) every lap also checks the deadline, so the stage
+boundaries the timers mark are where a late request stops.
+"""
+
+import os
+import time
+from request_budget import current_budget
+
+TIMINGS_ENABLED = os.environ.get('FACE_TIMINGS', '0') == '1'
+
+class StageTimer:
+    """
+    Lap timer: each lap(name) adds the milliseconds since the previous lap (or since the
+    timer was created) to timings[name], so a stage that runs twice accumulates.
+    """
+
+    def __init__(self, timings, budget=None):
+        self.timings = timings
+        self.budget = budget
+        self.last = time.perf_counter()
+
+    def lap(self, name):
+        now = time.perf_counter()
+        self.timings[name] = self.timings.get(name, 0.0) + (now - self.last) * 1000
+        self.last = now
+        if self.budget is not None and self.budget.remaining_ms() <= 0:
+            self.budget.expire(name)
+
+class _NullTimer:
+    """Stand-in when timings are off: laps cost one method call."""
+
+    def lap(self, name):
+        pass
+
+_NULL_TIMER = _NullTimer()
+
+class _DeadlineTimer:
+    """Timings off but a deadline set: laps only check the deadline."""
+
+    def __init__(self, budget):
+        self.budget = budget
+
+    def lap(self, name):
+        if self.budget.remaining_ms() <= 0:
+            self.budget.expire(name)
+
+def request_info(data):
+    """Per-request info dict, carrying a timings dict when the request or FACE_TIMINGS asks for it."""
+    info = {}
+    if data.get('timings', TIMINGS_ENABLED):
+        info['timings'] = {}
+        info['timings_start'] = time.perf_counter()
+    return info
+
+def stage_timer(info, group=None):
+    """
+    Lap timer writing into info['timings'] (or its group sub-dict) and checking the request's
+    deadline at each lap; a no-op when timings are off and there is no deadline.
+    """
+    timings = info.get('timings') if info is not None else None
+    budget = current_budget()
+    if timings is None:
+        return _NULL_TIMER if budget is None else _DeadlineTimer(budget)
+    if group is not None:
+        timings = timings.setdefault(group, {})
+    return StageTimer(timings, budget)
+
+def record_count(info, name, value):
+    """Add a counter (e.g. detection passes tried) to the timings, if enabled."""
+    timings = info.get('timings') if info is not None else None
+    if timings is not None:
+        timings[name] = timings.get(name, 0) + value
+
+def _rounded(timings):
+    return {name: _rounded(value) if isinstance(value, dict) else round(value, 3)
+            for name, value in timings.items()}
+
+def with_timings(response, info):
+    """Attach the request's timings (plus the in-process total) to a JSON response."""
+    if info.get('timings') is not None:
+        timings = dict(info['timings'])
+        timings['total'] = (time.perf_counter() - info['timings_start']) * 1000
+        response['timings'] = _rounded(timings)
+    return response
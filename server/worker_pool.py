@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Execution pool of the face service
+In 'threads' mode requests run on a fixed set of long-lived threads: cv2.detectMultiScale, Sobel,
+resize and the numpy reductions release the GIL, so the threads run in parallel while sharing one
+copy of the backends, and each thread keeps its own detector instances between requests.
+'processes' mode runs the backend call in child processes instead (one copy of every loaded
+backend per process) for backends whose pure-Python loops hold the GIL. Either way OpenCV's own
+thread pool is capped (cv2.setNumThreads) so workers x OpenCV threads does not oversubscribe the CPUs.
+"""
+
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import cv2
+from face_backends import BACKENDS, load_backend, run_operation
+from face_detectors import DEFAULT_DETECTOR, available_detectors, preload_detectors
+from stage_timings import request_info
+from memory_diagnostics import process_tracker
+
+EXECUTION_MODES = ('threads', 'processes')
+
+def default_cv_threads(workers):
+    """OpenCV threads per process so that all workers together use each CPU once."""
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+def configure_cv_threads(count):
+    """Cap OpenCV's internal parallelism for this process (0 runs its loops sequentially)."""
+    cv2.setNumThreads(count)
+    return cv2.getNumThreads()
+
+def _init_thread():
+    """Load this worker thread's detector up front, so the first request does not pay for it."""
+    if DEFAULT_DETECTOR in available_detectors():
+        preload_detectors([DEFAULT_DETECTOR])
+
+def _init_process(cv_threads, preload):
+    """Child process set-up: OpenCV threads, then the backends listed for preloading."""
+    configure_cv_threads(cv_threads)
+    for name in preload:
+        load_backend(name)
+    _init_thread()
+
+def _run_in_process(backend, operation, data):
+    """
+    Backend call of one request in a child process; returns (response, info, memory usage, error).
+    A failed call returns its exception so the memory it used is still reported.
+    """
+    kind, function_name = BACKENDS[backend][operation]
+    info = request_info(data)
+    usage = {}
+    try:
+        response = process_tracker().measure(
+            f"{backend}/{operation}",
+            lambda: run_operation(load_backend(backend), kind, function_name, data, info, backend), usage)
+    except Exception as e:
+        return None, info, usage, e
+    return response, info, usage, None
+
+class WorkerPool:
+    """
+    `workers` long-lived threads running request handlers (submit) and, in 'processes' mode,
+    as many child processes running the backend calls (run_backend). Child processes are
+    started with 'spawn': forking a process that already runs threads can deadlock. Child processes
+    measure the memory of their requests and hand it to memory_tracker (a MemoryTracker), if given.
+    """
+
+    def __init__(self, workers, mode='threads', cv_threads=None, preload=(), memory_tracker=None):
+        if mode not in EXECUTION_MODES:
+            raise Exception(f"Unknown execution mode: {mode} (expected one of {', '.join(EXECUTION_MODES)})")
+        self.workers = workers
+        self.mode = mode
+        self.cv_threads = default_cv_threads(workers) if cv_threads is None else cv_threads
+        self.preload = list(preload)
+        self.memory_tracker = memory_tracker
+        self._threads = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='face-worker',
+                                           initializer=_init_thread)
+        self._processes = None
+        self._lock = threading.Lock()
+        configure_cv_threads(self.cv_threads)
+
+    def submit(self, fn, *args):
+        """Run fn(*args) on a worker thread; returns its future."""
+        return self._threads.submit(fn, *args)
+
+    def _process_pool(self):
+        with self._lock:
+            if self._processes is None:
+                self._processes = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_process, initargs=(self.cv_threads, self.preload))
+            return self._processes
+
+    def start_processes(self):
+        """Start the child processes now instead of on the first request."""
+        if self.mode == 'processes':
+            futures = [self._process_pool().submit(os.getpid) for _ in range(self.workers)]
+            return sorted({future.result() for future in futures})
+        return []
+
+    def run_backend(self, backend, operation, data, info):
+        """Run one backend operation (on this thread or in a child process) and return its response."""
+        if self.mode == 'threads':
+            kind, function_name = BACKENDS[backend][operation]
+            return run_operation(load_backend(backend), kind, function_name, data, info, backend)
+
+        # Frame buffers arrive as memoryviews, which do not pickle; errors raised in the child
+        # come back with their message and are raised here
+        data = {key: bytes(value) if isinstance(value, memoryview) else value for key, value in data.items()}
+        response, child_info, usage, error = self._process_pool().submit(
+            _run_in_process, backend, operation, data).result()
+        child_info.pop('timings_start', None)
+        info.update(child_info)
+        if self.memory_tracker is not None:
+            self.memory_tracker.record_worker(f"{backend}/{operation}", usage)
+        if error is not None:
+            raise error
+        return response
+
+    def child_pids(self):
+        processes = getattr(self._processes, '_processes', None) or {}
+        return sorted(processes)
+
+    def shutdown(self):
+        self._threads.shutdown(wait=False)
+        if self._processes is not None:
+            self._processes.shutdown(wait=False, cancel_futures=True)
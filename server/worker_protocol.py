@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Request framing for the Python face recognition workers
+Besides a plain JSON document, stdin may carry a length-prefixed binary frame: a small JSON
+header followed by raw image bytes or pixel buffers, decoded in place from a memoryview
+instead of going through base64 data URLs inside a JSON string
+
+Frame layout (integers are big-endian uint32):
+    b'FRM1' | header length | header JSON | buffer 0 | buffer 1 | ...
+
+The header holds the ordinary request fields plus a "buffers" list describing the payload
+in order: {"field": "image_data", "length": n} for encoded images (JPEG/PNG bytes) or
+{"field": "image_data", "length": n, "shape": [h, w, 3], "dtype": "uint8"} for raw RGB pixels.
+Each buffer is stored under its field name, so backends read data['image_data'] either way.
+"""
+
+import sys
+import json
+import struct
+import numpy as np
+
+FRAME_MAGIC = b'FRM1'
+_LENGTH = struct.Struct('>I')
+
+class FrameError(ValueError):
+    """A malformed request frame (a ValueError, like an invalid JSON document)."""
+
+def encode_frame(fields, buffers=None):
+    """Build a binary request frame from JSON fields and {field: bytes | ndarray} buffers."""
+    header = dict(fields)
+    descriptors = []
+    payloads = []
+
+    for field, value in (buffers or {}).items():
+        if isinstance(value, np.ndarray):
+            value = np.ascontiguousarray(value)
+            descriptors.append({"field": field, "length": value.nbytes,
+                                "shape": list(value.shape), "dtype": value.dtype.str})
+            payloads.append(value.data)
+        else:
+            payloads.append(value)
+            descriptors.append({"field": field, "length": len(value)})
+
+    header['buffers'] = descriptors
+    header_bytes = json.dumps(header).encode('utf-8')
+    return b''.join([FRAME_MAGIC, _LENGTH.pack(len(header_bytes)), header_bytes] + payloads)
+
+def decode_frame(payload):
+    """
+    Parse a binary frame into a request dict.
+
+    Encoded images become memoryview slices and pixel buffers become read-only arrays,
+    both sharing memory with payload.
+    """
+    view = memoryview(payload)
+    if bytes(view[:4]) != FRAME_MAGIC:
+        raise FrameError("Invalid request frame: bad magic")
+    if len(view) < 8:
+        raise FrameError("Invalid request frame: truncated header length")
+
+    header_end = 8 + _LENGTH.unpack_from(view, 4)[0]
+    if header_end > len(view):
+        raise FrameError("Invalid request frame: truncated header")
+    data = json.loads(bytes(view[8:header_end]))
+    if not isinstance(data, dict):
+        raise FrameError("Invalid request frame: header is not a JSON object")
+
+    offset = header_end
+    for descriptor in data.pop('buffers', []):
+        try:
+            field, length = descriptor['field'], int(descriptor['length'])
+        except (KeyError, TypeError, ValueError):
+            raise FrameError(f"Invalid request frame: bad buffer descriptor {descriptor!r}")
+        if length < 0 or offset + length > len(view):
+            raise FrameError(f"Invalid request frame: truncated buffer '{field}'")
+        chunk = view[offset:offset + length]
+        offset += length
+
+        if 'shape' in descriptor:
+            try:
+                data[field] = np.frombuffer(chunk, dtype=np.dtype(descriptor['dtype'])).reshape(descriptor['shape'])
+            except (KeyError, TypeError, ValueError) as e:
+                raise FrameError(f"Invalid request frame: buffer '{field}' does not match its shape: {str(e)}")
+        else:
+            data[field] = chunk
+
+    return data
+
+def read_request(stream=None):
+    """Read one request from stdin: a binary frame or a legacy JSON document."""
+    stream = sys.stdin.buffer if stream is None else stream
+    payload = stream.read()
+
+    if payload[:4] == FRAME_MAGIC:
+        return decode_frame(payload)
+    return json.loads(payload)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Test the adaptive detection strategy: pass ordering, merged persistent counts and concurrent fallbacks
+"""
+
+import os
+import sys
+import json
+import time
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server'))
+import detection_strategy
+from detection_strategy import AdaptiveDetectionStrategy, get_strategy, load_stats, pass_key
+
+FRONTAL = ('haar', 1.1, 3, (20, 20))
+SENSITIVE = ('haar', 1.05, 5, (15, 15))
+PROFILE = ('haar_profile', 1.1, 3, (20, 20))
+ALTERNATIVE = ('haar_alt', 1.1, 3, (20, 20))
+PASSES = [FRONTAL, SENSITIVE, PROFILE, ALTERNATIVE]
+
+class ScriptedStrategy(AdaptiveDetectionStrategy):
+    """Passes answer from a script of pass -> (seconds, boxes) instead of running detectors."""
+
+    def __init__(self, script, **options):
+        super().__init__('test_strategy', PASSES, **options)
+        self.script = script
+
+    def _run_pass(self, view, detection_pass):
+        seconds, boxes = self.script[detection_pass]
+        time.sleep(seconds)
+        return boxes
+
+def test_passes_ordered_by_success_rate():
+    """Persisted success rates order the passes; unseen passes keep their configured order"""
+    print("=== TESTING PASS ORDERING ===")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'stats.json')
+        with open(path, 'w') as f:
+            json.dump({'test_strategy': {pass_key(FRONTAL): {'attempts': 10, 'successes': 1},
+                                         pass_key(PROFILE): {'attempts': 10, 'successes': 9}}}, f)
+        strategy = AdaptiveDetectionStrategy('test_strategy', PASSES, adaptive=True, stats_path=path)
+        assert strategy.ordered_passes() == [PROFILE, SENSITIVE, ALTERNATIVE, FRONTAL]
+        fixed = AdaptiveDetectionStrategy('test_strategy', PASSES, adaptive=False, stats_path=path)
+        assert fixed.ordered_passes() == PASSES
+    assert get_strategy('test_shared', PASSES) is get_strategy('test_shared', PASSES)
+    print("✓ profile pass promoted, frontal demoted, one strategy per backend")
+
+def test_counts_merge_into_stats_file():
+    """Counts stay in memory until a flush, which adds them to the file instead of overwriting it"""
+    print("\n=== TESTING PERSISTED COUNTS ===")
+    found = {p: (0, []) for p in PASSES}
+    found[FRONTAL] = (0, [(1, 2, 3, 4)])
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'stats.json')
+        # Two workers (or processes) with their own in-memory counts
+        first = ScriptedStrategy(found, adaptive=True, max_workers=1, stats_path=path, flush_seconds=3600)
+        second = ScriptedStrategy(found, adaptive=True, max_workers=1, stats_path=path, flush_seconds=3600)
+        for _ in range(3):
+            first.detect(None)
+        second.detect(None)
+        assert not os.path.exists(path), "nothing is written before the flush interval"
+        assert first.stats[pass_key(FRONTAL)] == {'attempts': 3, 'successes': 3}
+
+        first.flush()
+        second.flush()
+        assert load_stats(path)['test_strategy'][pass_key(FRONTAL)] == {'attempts': 4, 'successes': 4}
+        assert second.stats[pass_key(FRONTAL)] == {'attempts': 4, 'successes': 4}
+        reloaded = AdaptiveDetectionStrategy('test_strategy', PASSES, adaptive=True, stats_path=path)
+        assert reloaded.stats[pass_key(FRONTAL)]['attempts'] == 4
+
+        # Many writers flushing on every request lose no counts
+        writers = [ScriptedStrategy(found, adaptive=True, max_workers=1, stats_path=path, flush_seconds=0)
+                   for _ in range(4)]
+
+        def run(strategy):
+            for _ in range(25):
+                strategy.detect(None)
+
+        threads = [threading.Thread(target=run, args=(writer,)) for writer in writers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert load_stats(path)['test_strategy'][pass_key(FRONTAL)] == {'attempts': 104, 'successes': 104}
+    print("✓ 4 + 100 detections merged from 6 strategies")
+
+def test_concurrent_fallbacks():
+    """After a failed first pass the fallbacks run together and the first face found wins"""
+    print("\n=== TESTING CONCURRENT FALLBACKS ===")
+    script = {FRONTAL: (0, []), SENSITIVE: (0.3, [(0, 0, 50, 50)]),
+              PROFILE: (0.02, [(5, 5, 40, 40)]), ALTERNATIVE: (0.02, [])}
+    saved = detection_strategy._executor
+    detection_strategy._executor = ThreadPoolExecutor(max_workers=4)
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'stats.json')
+            strategy = ScriptedStrategy(script, adaptive=True, max_workers=4, stats_path=path, flush_seconds=3600)
+            start = time.perf_counter()
+            boxes, winner, tried = strategy.detect(None)
+            elapsed = time.perf_counter() - start
+            assert winner == PROFILE and boxes == [(5, 5, 40, 40)], (winner, boxes)
+            assert elapsed < 0.25, f"the slow sensitive pass should not be waited for ({elapsed:.3f}s)"
+            assert strategy.stats[pass_key(FRONTAL)] == {'attempts': 1, 'successes': 0}
+            assert strategy.stats[pass_key(PROFILE)] == {'attempts': 1, 'successes': 1}
+            assert pass_key(SENSITIVE) not in strategy.stats
+
+            # In order, the higher-ranked sensitive pass wins
+            ordered = ScriptedStrategy(script, adaptive=False, max_workers=1, stats_path=path)
+            boxes, winner, tried = ordered.detect(None)
+            assert winner == SENSITIVE and tried == 2
+    finally:
+        detection_strategy._executor.shutdown(wait=True)
+        detection_strategy._executor = saved
+    print(f"✓ profile pass won after {elapsed * 1000:.0f} ms of fallbacks")
+
+if __name__ == "__main__":
+    test_passes_ordered_by_success_rate()
+    test_counts_merge_into_stats_file()
+    test_concurrent_fallbacks()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Test the in-process backend API against the subprocess CLI it replaces
+"""
+
+import os
+import io
+import sys
+import json
+import base64
+import subprocess
+import numpy as np
+from PIL import Image
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, 'server'))
+from face_backends import FaceBackend, get_backend
+from test_face_verification import create_test_face_image
+
+def test_typed_inputs_match_data_url():
+    """An RGB array, a PIL image and encoded bytes give the same encoding as the (lossless PNG) data URL"""
+    print("=== TESTING IN-PROCESS BACKEND API ===")
+    image_data = create_test_face_image()
+    image_bytes = base64.b64decode(image_data.split(',')[1])
+    pil_image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
+
+    backend = get_backend('reliable_face_recognition')
+    encoding = backend.encode(image_data)
+    assert isinstance(encoding, np.ndarray) and encoding.dtype == np.float64
+    for image in (np.asarray(pil_image), pil_image, image_bytes):
+        assert np.array_equal(backend.encode(image), encoding)
+
+    result = backend.compare(encoding, np.asarray(pil_image))
+    assert result["is_match"] and result["tolerance"] == 0.6
+    assert get_backend('reliable_face_recognition') is backend
+    print(f"✓ Typed inputs, {len(encoding)}-dimensional encoding, distance {result['distance']}")
+
+def test_cli_shim_matches_api():
+    """The script CLI still prints the same encoding and compare result the API returns"""
+    image_data = create_test_face_image()
+    # simple_face_recognition salts its encoding with hash(), which differs between interpreters
+    backend = FaceBackend('reliable_face_recognition')
+    script = os.path.join(ROOT_DIR, 'server', 'reliable_face_recognition.py')
+
+    def cli(operation, request):
+        completed = subprocess.run([sys.executable, script, operation], input=json.dumps(request),
+                                   capture_output=True, text=True, check=True)
+        return json.loads(completed.stdout)
+
+    encoded = cli('encode', {"image_data": image_data})
+    assert encoded["success"] and np.array_equal(np.array(encoded["encoding"]), backend.encode(image_data))
+    compared = cli('compare', {"known_encoding": encoded["encoding"], "unknown_image": image_data, "tolerance": 0.5})
+    assert compared["result"] == backend.compare(encoded["encoding"], image_data, tolerance=0.5)
+    assert cli('nope', {}) == {"success": False, "error": "Unknown operation: nope"}
+
+    try:
+        backend.verify(image_data, image_data)
+        assert False, "encode/compare backends have no verify"
+    except Exception as e:
+        assert "does not support verify" in str(e)
+    print("✓ CLI responses match the in-process API")
+
+if __name__ == "__main__":
+    test_typed_inputs_match_data_url()
+    test_cli_shim_matches_api()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Test compact descriptors: the learned projection and the "compact" descriptor mode of the backends
+"""
+
+import os
+import io
+import sys
+import base64
+import tempfile
+import numpy as np
+from PIL import Image, ImageEnhance
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server'))
+import face_compact
+from face_compact import CompactProjection, fit_projection
+from face_backends import get_backend, load_backend, run_operation
+from test_face_verification import create_test_face_image
+from debug_face_security import create_distinct_face_images
+
+def _photo(data_url):
+    return Image.open(io.BytesIO(base64.b64decode(data_url.split(',')[1]))).convert('RGB')
+
+def test_projection_fit_and_round_trip():
+    """LDA clusters each person's noisy encodings; the .npy/.json pair reloads to the same projection"""
+    print("=== TESTING COMPACT PROJECTION ===")
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(10, 600))
+    labels = np.repeat(np.arange(10), 8)
+    encodings = centers[labels] + rng.normal(scale=1.5, size=(80, 600))
+
+    projection = fit_projection(encodings, labels, dims=32, method='lda')
+    compact = projection.project(encodings)
+    assert compact.shape == (80, 32) and np.allclose(np.linalg.norm(compact, axis=1), 1.0)
+    same = labels[:, None] == labels[None, :]
+    distances = np.linalg.norm(compact[:, None] - compact[None, :], axis=2)
+    assert distances[same].max() < projection.tolerance < distances[~same].min()
+
+    assert np.array_equal(projection.project(compact[0], compact=True), compact[0])
+    # Compact input is flagged, never guessed from its length
+    for vector, compact_flag in ((np.zeros(100), False), (compact[0], False), (encodings[0], True)):
+        try:
+            projection.project(vector, compact=compact_flag)
+            assert False, "a wrong-length encoding should be rejected"
+        except Exception as e:
+            assert "dimension mismatch" in str(e)
+
+    path = os.path.join(tempfile.mkdtemp(), 'reliable_face_recognition.npy')
+    projection.save(path)
+    loaded = CompactProjection.load(path)
+    assert loaded.dims == 32 and loaded.tolerance == projection.tolerance and loaded.meta['method'] == 'lda'
+    assert np.allclose(loaded.project(encodings[:3]), compact[:3])
+    print(f"✓ {projection.source_dims} -> {projection.dims} dims, tolerance {projection.tolerance:.3f}")
+
+def test_compact_descriptor_mode():
+    """encode returns the compact descriptor; compare accepts compact or full stored encodings"""
+    print("\n=== TESTING COMPACT DESCRIPTOR MODE ===")
+    name = 'reliable_face_recognition'
+    face = _photo(create_test_face_image())
+    others = [_photo(data_url) for data_url in create_distinct_face_images()]
+    photos = [ImageEnhance.Brightness(face).enhance(factor) for factor in (0.8, 0.9, 1.0, 1.1, 1.2)]
+    full = get_backend(name)
+    encodings = [full.encode(photo) for photo in photos + others]
+
+    face_compact.COMPACT_DIR = tempfile.mkdtemp()
+    face_compact._projections.clear()
+    fit_projection(encodings, [0] * 5 + [1, 2], dims=6, method='pca').save(face_compact.projection_path(name))
+
+    compact = get_backend(name, 'compact')
+    descriptor = compact.encode(face)
+    assert descriptor.shape == (6,) and abs(np.linalg.norm(descriptor) - 1.0) < 1e-9
+
+    probe = ImageEnhance.Brightness(face).enhance(1.05)
+    assert compact.compare(descriptor, probe)["is_match"]
+    assert compact.compare(encodings[2], probe, known_descriptor='full')["descriptor"] == "compact"
+    assert not compact.compare(descriptor, others[0])["is_match"]
+    try:
+        compact.compare(encodings[2], probe)
+        assert False, "a full encoding needs known_descriptor='full'"
+    except Exception as e:
+        assert "dimension mismatch" in str(e)
+
+    response = run_operation(load_backend(name), 'encode', 'encode_face',
+                             {"image_data": np.asarray(face), "descriptor": "compact"}, {}, name)
+    assert np.allclose(response["encoding"], descriptor)
+    response = run_operation(load_backend(name), 'compare', 'compare_faces_reliable',
+                             {"known_encoding": encodings[2].tolist(), "unknown_image": np.asarray(probe),
+                              "descriptor": "compact", "known_descriptor": "full"}, {}, name)
+    assert response["result"]["is_match"]
+    print(f"✓ {len(encodings[0])} values -> {len(descriptor)}, tolerance {compact.projection.tolerance:.3f}")
+
+def test_secure_encoding_has_fixed_length():
+    """secure_face_recognition zero-fills its landmark ratios, so a projection fits every encoding"""
+    print("\n=== TESTING SECURE ENCODING LENGTH ===")
+    secure = load_backend('secure_face_recognition')
+    face = create_test_face_image()
+    with_landmarks = get_backend('secure_face_recognition').encode(face)
+    saved = secure.detect_facial_landmarks
+    secure.detect_facial_landmarks = lambda face_roi: []
+    try:
+        without_landmarks = get_backend('secure_face_recognition').encode(face)
+    finally:
+        secure.detect_facial_landmarks = saved
+    assert len(without_landmarks) == len(with_landmarks), (len(without_landmarks), len(with_landmarks))
+    print(f"✓ {len(with_landmarks)} values with or without landmarks")
+
+if __name__ == "__main__":
+    test_projection_fit_and_round_trip()
+    test_compact_descriptor_mode()
+    test_secure_encoding_has_fixed_length()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Test the face detector registry, downscaled detection views and face_hint searches
+"""
+
+import os
+import sys
+import threading
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server'))
+from face_backends import load_backend, run_operation
+from test_face_verification import create_test_face_image
+from face_detectors import (get_detector, available_detectors, DetectionView, parse_face_hint,
+                            hint_window, detect_with_hint)
+
+class FakeDetector:
+    """Returns fixed boxes (in the coordinates of the image it is given) and records its calls."""
+
+    def __init__(self, boxes):
+        self.boxes = np.asarray(boxes, dtype=np.int32).reshape(-1, 4)
+        self.calls = []
+
+    def detect(self, image, min_size=None, **params):
+        self.calls.append((image.shape, min_size))
+        return self.boxes, np.ones(len(self.boxes), dtype=np.float32)
+
+def test_registry_and_thread_local_detectors():
+    """Detectors load once per thread; unknown names and missing models fail with a clear error"""
+    print("=== TESTING DETECTOR REGISTRY ===")
+    detector = get_detector('haar')
+    assert get_detector('haar') is detector
+    assert 'haar' in available_detectors()
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(get_detector('haar')))
+    thread.start()
+    thread.join()
+    assert other[0] is not detector, "each thread needs its own cascade"
+
+    for name, message in (('nonexistent', "Unknown face detector"), ('yunet', "not found")):
+        if name in available_detectors():
+            continue
+        try:
+            get_detector(name)
+            assert False, f"{name} should not load"
+        except Exception as e:
+            assert message in str(e), str(e)
+    print("✓ one haar cascade per thread")
+
+def test_detection_view_maps_boxes_to_full_resolution():
+    """Detection runs on a downscaled copy; boxes and min_size are scaled between the two"""
+    print("\n=== TESTING DETECTION VIEW ===")
+    image = np.zeros((960, 1280), dtype=np.uint8)
+    view = DetectionView(image, max_side=640)
+    assert view.scale == 0.5 and view.image.shape == (480, 640)
+
+    detector = FakeDetector([(10, 20, 50, 60), (600, 470, 100, 100)])
+    boxes, _ = view.detect(detector, min_size=(30, 30))
+    assert detector.calls == [((480, 640), (15, 15))]
+    # The second box runs past the image edge and is clipped to it
+    assert boxes.tolist() == [[20, 40, 100, 120], [1200, 940, 80, 20]], boxes.tolist()
+    assert view.runs == 1
+
+    # Small images are used as they are; a crop's offset is added back
+    crop = DetectionView(image[50:250, 100:400], max_side=640, offset=(100, 50))
+    assert crop.scale == 1.0 and crop.image.shape == (200, 300)
+    boxes, _ = crop.detect(FakeDetector([(10, 20, 50, 60)]))
+    assert boxes.tolist() == [[110, 70, 50, 60]]
+    assert DetectionView(image, max_side=0).scale == 1.0
+    print("✓ 1280x960 detected at 640x480, boxes mapped back")
+
+def test_face_hint_parsing_and_window():
+    """Hints scale onto reduced decodes; their search window grows by the margin and stays in the image"""
+    print("\n=== TESTING FACE HINTS ===")
+    assert parse_face_hint([100, 50, 80, 60]) == (100, 50, 80, 60)
+    assert parse_face_hint({"x": 100, "y": 50, "width": 80, "height": 60}, 0.5) == (50, 25, 40, 30)
+    assert parse_face_hint({"x": 101, "y": 51, "w": 81, "h": 61}, 0.25) == (25, 13, 20, 15)
+    assert parse_face_hint(None) is None and parse_face_hint([]) is None and parse_face_hint({}) is None
+    for invalid in ([1, 2, 3], {"x": 1}, ["a", 0, 1, 1], [0, 0, 0, 10]):
+        try:
+            parse_face_hint(invalid)
+            assert False, f"{invalid!r} should be rejected"
+        except Exception as e:
+            assert "Invalid face_hint" in str(e)
+
+    shape = (480, 640)
+    assert hint_window((100, 100, 50, 50), shape, margin=0.5) == (75, 75, 175, 175)
+    assert hint_window((0, 0, 50, 50), shape, margin=0.5) == (0, 0, 75, 75)
+    assert hint_window((620, 460, 40, 40), shape, margin=0.5) == (600, 440, 640, 480)
+    assert hint_window((700, 500, 50, 50), shape, margin=0.5) is None
+    print("✓ hints scaled, windows clamped")
+
+def test_detect_with_hint_falls_back_to_full_frame():
+    """A face in the hint window is used (hint_used); otherwise the whole frame is searched"""
+    print("\n=== TESTING HINTED DETECTION ===")
+    image = np.zeros((480, 640), dtype=np.uint8)
+    hint = [200, 100, 100, 100]
+    views = []
+
+    def finds_face_in(window_shape):
+        def detect(view):
+            views.append((view.image.shape, view.offset))
+            found = view.image.shape == window_shape
+            boxes, _ = view.detect(FakeDetector([(60, 40, 90, 100)] if found else []))
+            return boxes
+        return detect
+
+    # Window (150, 50)-(350, 250): the face is reported in window pixels and shifted back
+    info = {"timings": {}}
+    boxes, hint_used = detect_with_hint(image, hint, finds_face_in((200, 200)), max_side=640, info=info)
+    assert hint_used and boxes.tolist() == [[210, 90, 90, 100]], boxes
+    assert views == [((200, 200), (150, 50))] and info["timings"]["detect_passes"] == 1
+
+    views.clear()
+    boxes, hint_used = detect_with_hint(image, hint, finds_face_in((480, 640)), max_side=640, info=info)
+    assert not hint_used and boxes.tolist() == [[60, 40, 90, 100]]
+    assert views == [((200, 200), (150, 50)), ((480, 640), (0, 0))]
+    assert info["timings"]["detect_passes"] == 3
+
+    views.clear()
+    boxes, hint_used = detect_with_hint(image, None, finds_face_in((480, 640)), max_side=640)
+    assert not hint_used and len(boxes) == 1 and len(views) == 1
+    boxes, hint_used = detect_with_hint(image, [900, 900, 10, 10], finds_face_in((200, 200)), max_side=640)
+    assert not hint_used and len(boxes) == 0, "a hint outside the frame searches the full frame"
+
+    # Backends report whether the hint found the face
+    reliable = load_backend('reliable_face_recognition')
+    image_data = create_test_face_image()
+    for face_hint, expected in (([20, 0, 160, 200], True), ([0, 0, 30, 30], False), (None, False)):
+        response = run_operation(reliable, 'encode', 'encode_face', {"image_data": image_data, "face_hint": face_hint}, {})
+        assert response["hint_used"] is expected, (face_hint, response["hint_used"])
+    print("✓ hint window first, full-frame fallback")
+
+if __name__ == "__main__":
+    test_registry_and_thread_local_detectors()
+    test_detection_view_maps_boxes_to_full_resolution()
+    test_face_hint_parsing_and_window()
+    test_detect_with_hint_falls_back_to_full_frame()
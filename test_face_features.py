@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Test the shared vectorized feature primitives against the per-cell loops they replace
+"""
+
+import os
+import sys
+import numpy as np
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server'))
+from face_features import cell_orientation_histograms, local_variance_map, landmark_candidates, neighbor_codes
+from reliable_face_recognition import LBP_NEIGHBORS
+from secure_face_recognition import detect_facial_landmarks
+
+def create_test_roi(size=128, seed=7):
+    """Create a deterministic textured grayscale ROI"""
+    rng = np.random.default_rng(seed)
+    roi = rng.integers(0, 256, (size, size)).astype(np.uint8)
+    return cv2.GaussianBlur(roi, (5, 5), 0)
+
+def gradients(roi, ksize=3):
+    """Sobel magnitude and orientation as used by the extractors"""
+    grad_x = cv2.Sobel(roi, cv2.CV_64F, 1, 0, ksize=ksize)
+    grad_y = cv2.Sobel(roi, cv2.CV_64F, 0, 1, ksize=ksize)
+    return np.sqrt(grad_x**2 + grad_y**2), np.arctan2(grad_y, grad_x)
+
+def test_cell_histograms_match_per_cell_loop():
+    """Single-bincount cell histograms must equal the 64 np.histogram calls"""
+    print("=== TESTING CELL ORIENTATION HISTOGRAMS ===")
+    magnitude, orientation = gradients(create_test_roi())
+
+    expected = []
+    for i in range(8):
+        for j in range(8):
+            cell_mag = magnitude[i*16:(i+1)*16, j*16:(j+1)*16]
+            cell_ori = orientation[i*16:(i+1)*16, j*16:(j+1)*16]
+            hist, _ = np.histogram(cell_ori.flatten(), bins=9, range=(-np.pi, np.pi), weights=cell_mag.flatten())
+            expected.extend(hist / (np.sum(hist) + 1e-7))
+
+    result = cell_orientation_histograms(magnitude, orientation, grid=(8, 8), bins=9, block_norm='l1')
+    assert result.shape == (8, 8, 9)
+    assert np.array_equal(result.ravel(), np.array(expected))
+    print("✓ 8x8 cell histograms identical to per-cell np.histogram")
+
+def test_block_normalization_shape():
+    """2x2 block normalization yields unit-norm overlapping blocks"""
+    magnitude, orientation = gradients(create_test_roi())
+
+    blocks = cell_orientation_histograms(magnitude, orientation, grid=(8, 8), bins=9,
+                                         block_norm='l2', block_size=2)
+    assert blocks.shape == (7, 7, 2, 2, 9)
+    norms = np.sqrt(np.sum(blocks ** 2, axis=(2, 3, 4)))
+    assert np.allclose(norms, 1.0, atol=1e-6)
+    print("✓ 2x2 L2 blocks normalized")
+
+def test_variance_map_matches_window_var():
+    """Box-filter variance map must equal np.var of each template window"""
+    print("\n=== TESTING LOCAL VARIANCE MAP ===")
+    roi = create_test_roi(size=160)
+    variance = local_variance_map(roi, (20, 15))
+
+    for template_y in range(30, 60, 5):
+        for template_x in range(20, 140, 10):
+            region = roi[template_y:template_y+15, template_x:template_x+20].astype(np.float64)
+            assert abs(np.var(region) - variance[template_y + 7, template_x + 10]) < 1e-6
+    print("✓ Variance map matches per-window np.var")
+
+def test_neighbor_codes_match_pixel_loop():
+    """Shifted-image LBP codes must equal reliable_face_recognition's per-pixel 8-neighbor loop"""
+    print("\n=== TESTING LBP CODES ===")
+    roi = create_test_roi(size=96)
+    roi[10:20, 10:20] = 128  # flat patch: neighbors equal to the center set their bit
+
+    expected = []
+    for i in range(1, 95):
+        for j in range(1, 95):
+            center = roi[i, j]
+            neighbors = [
+                roi[i-1, j-1], roi[i-1, j], roi[i-1, j+1],
+                roi[i, j-1],                roi[i, j+1],
+                roi[i+1, j-1], roi[i+1, j], roi[i+1, j+1]
+            ]
+            expected.append(sum([(1 if neighbor >= center else 0) * (2**k) for k, neighbor in enumerate(neighbors)]))
+
+    codes = neighbor_codes(roi, LBP_NEIGHBORS)
+    assert codes.shape == (94, 94)
+    assert np.array_equal(codes.ravel(), np.array(expected)) and codes[12, 12] == 255
+    print("✓ 94x94 LBP codes identical to the per-pixel loop")
+
+def test_landmark_candidates_ranked_and_deterministic():
+    """Candidates are sorted by variance, inside the search box and stable across runs"""
+    roi = create_test_roi(size=160)
+    search_box = (30, 37, 140, 62)
+
+    points, scores = landmark_candidates(roi, window=(20, 15), search_box=search_box,
+                                         min_variance=0, max_candidates=10)
+    again, _ = landmark_candidates(roi, window=(20, 15), search_box=search_box,
+                                   min_variance=0, max_candidates=10)
+
+    assert 0 < len(points) <= 10
+    assert np.all(np.diff(scores) <= 0)
+    assert np.all((points[:, 0] >= 30) & (points[:, 0] <= 140))
+    assert np.all((points[:, 1] >= 37) & (points[:, 1] <= 62))
+    assert np.array_equal(points, again)
+
+    # The secure backend searches the old template scan's centers, up to x = 140
+    face = np.full((160, 160), 128, dtype=np.uint8)
+    face[43:58, 130:150] = np.indices((15, 20)).sum(axis=0) % 2 * 255
+    assert (140, 50) in detect_facial_landmarks(face)
+    print(f"✓ {len(points)} ranked landmark candidates")
+
+if __name__ == "__main__":
+    test_cell_histograms_match_per_cell_loop()
+    test_block_normalization_shape()
+    test_variance_map_matches_window_var()
+    test_neighbor_codes_match_pixel_loop()
+    test_landmark_candidates_ranked_and_deterministic()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Test two-stage identification: the PCA shortlist finds the brute-force neighbours
+"""
+
+import os
+import sys
+import tempfile
+import numpy as np
+from PIL import ImageEnhance
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server'))
+from face_search import TwoStageSearch, fit_pca, backend_distance, euclidean_distances
+from face_backends import get_backend
+from test_face_compact import _photo
+from test_face_verification import create_test_face_image
+
+def low_rank_encodings(rng, latents, mixing, noise=0.3):
+    """Normalized encodings whose variance lives in a few latent directions, like face features"""
+    encodings = latents @ mixing + noise * rng.standard_normal((len(latents), mixing.shape[1])) / np.sqrt(mixing.shape[1])
+    return encodings / np.linalg.norm(encodings, axis=1, keepdims=True)
+
+def test_shortlist_matches_brute_force():
+    """Top-10 from a 32-d shortlist matches the exact scan; probes find their own gallery entry"""
+    print("=== TESTING TWO-STAGE SEARCH ===")
+    rng = np.random.default_rng(0)
+    latents = rng.standard_normal((5000, 24))
+    mixing = rng.standard_normal((24, 512)) / np.sqrt(24)
+    gallery = low_rank_encodings(rng, latents, mixing)
+    people = rng.choice(len(gallery), 50, replace=False)
+    probes = low_rank_encodings(rng, latents[people] + 0.1 * rng.standard_normal((50, 24)), mixing)
+
+    index = TwoStageSearch.fit(gallery, dims=32)
+    assert index.projected.shape == (5000, 32)
+    recalls = []
+    for probe, person in zip(probes, people):
+        found, distances = index.search(probe, k=10, shortlist=100)
+        exact, exact_distances = index.brute_force(probe, k=10)
+        recalls.append(len(set(found) & set(exact)) / 10)
+        assert found[0] == person == exact[0]
+        assert np.all(np.diff(distances) >= 0)
+        assert np.isclose(distances[0], np.linalg.norm(gallery[person] - probe), atol=1e-5)
+    assert np.mean(recalls) >= 0.95, np.mean(recalls)
+
+    path = os.path.join(tempfile.mkdtemp(), 'gallery_index.npz')
+    index.save(path)
+    loaded = TwoStageSearch.load(path)
+    assert np.array_equal(loaded.search(probes[0], k=5)[0], index.search(probes[0], k=5)[0])
+    print(f"✓ Mean recall@10 {np.mean(recalls):.3f}, index saved and reloaded")
+
+def test_rerank_matches_compare():
+    """The re-rank is float64 and uses the backend's compare distance, so it returns the 1:1 distances"""
+    print("\n=== TESTING EXACT RE-RANK ===")
+    # Rows 1e-4 apart at magnitude 1e3 are all the same value in float32
+    rng = np.random.default_rng(2)
+    base = np.full(64, 1000.0)
+    gallery = base + 1e-4 * rng.standard_normal((200, 64))
+    index = TwoStageSearch.fit(gallery, dims=8)
+    found, distances = index.search(gallery[17], k=3, shortlist=200)
+    assert found[0] == 17 and distances[0] == 0.0
+    assert np.allclose(distances, np.linalg.norm(gallery[found] - gallery[17], axis=1), rtol=1e-9, atol=0)
+    assert backend_distance('reliable_face_recognition') is euclidean_distances
+
+    face = _photo(create_test_face_image())
+    photos = [ImageEnhance.Brightness(face).enhance(factor) for factor in (0.7, 1.0, 1.2, 1.4)]
+    probe = ImageEnhance.Brightness(face).enhance(1.05)
+    for name in ('secure_face_recognition', 'face_recognition_service'):
+        backend = get_backend(name)
+        encodings = np.array([backend.encode(photo) for photo in photos])
+        index = TwoStageSearch.fit(encodings, dims=2, distance=backend_distance(name))
+        found, distances = index.search(backend.encode(probe), k=len(photos), shortlist=len(photos))
+        assert sorted(found) == list(range(len(photos))) and np.all(np.diff(distances) >= 0)
+        expected = [backend.compare(encodings[row], probe)["distance"] for row in found]
+        assert np.allclose(distances, expected, rtol=1e-9, atol=1e-12), (name, distances, expected)
+        brute, brute_distances = index.brute_force(backend.encode(probe), k=len(photos))
+        assert np.array_equal(brute, found) and np.allclose(brute_distances, distances)
+    print("✓ float64 re-rank, secure and calibrated distances match compare")
+
+def test_pca_recovers_principal_directions():
+    """The randomized PCA spans the same subspace as an exact SVD"""
+    rng = np.random.default_rng(1)
+    samples = rng.standard_normal((2000, 8)) @ rng.standard_normal((8, 300)) + 0.01 * rng.standard_normal((2000, 300))
+    _, components = fit_pca(samples, 8)
+    _, _, vt = np.linalg.svd(samples - samples.mean(axis=0), full_matrices=False)
+    overlap = np.linalg.svd(components.T @ vt[:8].T, compute_uv=False)
+    assert np.all(overlap > 0.999), overlap
+    print("✓ Randomized PCA matches the exact principal subspace")
+
+if __name__ == "__main__":
+    test_shortlist_matches_brute_force()
+    test_rerank_matches_compare()
+    test_pca_recovers_principal_directions()
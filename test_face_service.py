@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+Test the long-lived face service: CLI-compatible responses, embedding cache, metrics, profiling,
+memory diagnostics, the worker process execution mode and the asyncio front-end
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import base64
+import http.client
+import pstats
+import tempfile
+import threading
+import tracemalloc
+import urllib.request
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server'))
+import profiling
+import face_service
+from face_service import create_server
+from memory_diagnostics import MemoryTracker
+from worker_protocol import encode_frame
+from test_face_verification import create_test_face_image
+
+def post(base_url, path, body):
+    """POST a JSON document (dict) or binary frame (bytes) and parse the JSON response."""
+    payload = body if isinstance(body, bytes) else json.dumps(body).encode()
+    with urllib.request.urlopen(urllib.request.Request(base_url + path, data=payload, method='POST')) as response:
+        return json.loads(response.read())
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP over a Unix socket."""
+
+    def __init__(self, path, timeout=10):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+def unix_request(connection, method, path, body=None):
+    """Send a request on an open connection; returns (status, body)."""
+    connection.request(method, path, body=json.dumps(body).encode() if isinstance(body, dict) else body)
+    response = connection.getresponse()
+    return response.status, response.read()
+
+def test_service_requests_and_metrics():
+    """Encode twice (second from cache), compare, fail detection, then read the metrics"""
+    print("=== TESTING FACE SERVICE ===")
+    server = create_server(port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    try:
+        image_data = create_test_face_image()
+        first = post(base_url, '/reliable_face_recognition/encode', {"image_data": image_data})
+        assert first["success"], first
+        second = post(base_url, '/reliable_face_recognition/encode', {"image_data": image_data, "timings": True})
+        assert second["encoding"] == first["encoding"]
+        assert "timings" in second
+
+        image_bytes = base64.b64decode(image_data.split(',')[1])
+        result = post(base_url, '/reliable_face_recognition/compare',
+                      encode_frame({"known_encoding": first["encoding"]}, {"unknown_image": image_bytes}))
+        assert result["success"] and result["result"]["is_match"], result
+
+        blank = post(base_url, '/reliable_face_recognition/encode',
+                     {"image_data": "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAIAAACQd1PeAAAADElEQVR4nGP4z8AAAAMBAQDJ/pLvAAAAAElFTkSuQmCC"})
+        assert not blank["success"]
+
+        with urllib.request.urlopen(base_url + '/metrics') as response:
+            metrics = response.read().decode()
+        with urllib.request.urlopen(base_url + '/debug/memory') as response:
+            memory = json.loads(response.read())
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert 'face_embedding_cache_hits_total 1' in metrics
+    assert 'face_embedding_cache_misses_total 2' in metrics
+    assert 'face_request_duration_seconds_count{backend="reliable_face_recognition",operation="encode"} 3' in metrics
+    assert 'face_detection_failures_total{backend="reliable_face_recognition",reason="no_face"} 1' in metrics
+    assert 'face_requests_in_flight 0' in metrics
+    assert 'face_worker_rss_bytes ' in metrics
+    assert 'face_operation_peak_rss_bytes{backend="reliable_face_recognition",operation="compare"}' in metrics
+    assert memory["operations"]["reliable_face_recognition/encode"]["requests"] == 3
+    print("✓ Cached encode, framed compare, detection failure and metrics")
+
+def test_profiling_session_and_thread_dump():
+    """A two-request profiling session writes pstats and collapsed stacks covering extraction"""
+    print("\n=== TESTING ON-DEMAND PROFILING ===")
+    server = create_server(port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    try:
+        profiling.PROFILE_DIR = tempfile.mkdtemp()
+        started = post(base_url, '/debug/profile', {"requests": 2})
+        assert started["success"] and started["session"]["request_limit"] == 2
+
+        image_data = create_test_face_image()
+        post(base_url, '/simple_face_recognition/compare', {"known_encoding": [], "unknown_image": image_data})
+        post(base_url, '/simple_face_recognition/compare', {"known_encoding": [], "unknown_image": image_data})
+
+        with urllib.request.urlopen(base_url + '/debug/profile') as response:
+            status = json.loads(response.read())
+        with urllib.request.urlopen(base_url + '/debug/threads') as response:
+            threads = response.read().decode()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert status["session"] is None
+    last = status["last"]
+    assert last["requests_profiled"] == 2
+    functions = {name for _, _, name in pstats.Stats(last["pstats"]).stats}
+    assert 'encode_face' in functions
+    with open(last["collapsed"]) as f:
+        assert all(line.rsplit(' ', 1)[1].strip().isdigit() for line in f)
+    assert 'Thread MainThread' in threads and 'dump_threads' in threads
+    print(f"✓ Profile written: {last['pstats']}, {last['samples']} stack samples")
+
+def test_memory_tracker_diffs_and_operation_rss():
+    """Snapshot diffs attribute retained allocations to the source line; RSS is kept per operation"""
+    print("\n=== TESTING MEMORY DIAGNOSTICS ===")
+    tracker = MemoryTracker(snapshot_every=2, top_lines=5)
+    retained = []
+
+    def leaky_request():
+        retained.append(bytearray(512 * 1024))
+
+    try:
+        for _ in range(4):
+            tracker.measure('simple_face_recognition/compare', leaky_request)
+        tracker.measure('simple_face_recognition/encode', lambda: None)
+        report = tracker.report()
+    finally:
+        tracemalloc.stop()
+
+    assert report["requests"] == 5
+    assert report["operations"]["simple_face_recognition/compare"]["requests"] == 4
+    assert report["operations"]["simple_face_recognition/encode"]["post_request_rss_bytes"] > 0
+    diffs = report["tracemalloc"]["diffs"]
+    assert len(diffs) == 1 and diffs[0]["requests"] == 4
+    top = diffs[0]["top"][0]
+    assert top["location"].endswith(f"test_face_service.py:{leaky_request.__code__.co_firstlineno + 1}"), top
+    assert top["size_diff_bytes"] >= 2 * 512 * 1024
+    print(f"✓ Growth attributed to {os.path.basename(top['location'])}: {top['size_diff_bytes'] // 1024} KiB")
+
+def test_memory_tracker_peak_during_request():
+    """A buffer freed before the request returns still shows in its operation's peak, alone or overlapping"""
+    print("\n=== TESTING PEAK RSS PER OPERATION ===")
+    tracker = MemoryTracker(snapshot_every=0, sample_ms=2)
+    spike_bytes = 64 * 2**20
+
+    def spike():
+        buffer = np.ones(spike_bytes // 8)
+        time.sleep(0.05)
+        del buffer
+
+    tracker.measure('reliable_face_recognition/encode', spike)
+    # A request already running: the high-water mark cannot be reset, the sampler sees the spike
+    release = threading.Event()
+    other = threading.Thread(target=tracker.measure, args=('reliable_face_recognition/compare', release.wait))
+    other.start()
+    time.sleep(0.02)
+    usage = {}
+    tracker.measure('simple_face_recognition/encode', spike, usage)
+    release.set()
+    other.join()
+
+    report = tracker.report()
+    for operation in ('reliable_face_recognition/encode', 'simple_face_recognition/encode'):
+        entry = report["operations"][operation]
+        assert entry["peak_rss_bytes"] - entry["post_request_rss_bytes"] > spike_bytes // 2, (operation, entry)
+    assert usage["peak_rss_bytes"] - usage["rss_before_bytes"] > spike_bytes // 2 and usage["pid"] == os.getpid()
+    assert report["peak_rss_bytes"] >= report["operations"]['reliable_face_recognition/encode']["peak_rss_bytes"]
+    print(f"✓ {spike_bytes // 2**20} MiB spikes seen: peak "
+          f"{report['operations']['reliable_face_recognition/encode']['peak_rss_bytes'] // 2**20} MiB")
+
+def test_processes_execution_mode():
+    """Backend calls run in worker processes with the same responses and errors as threads"""
+    print("\n=== TESTING PROCESSES EXECUTION MODE ===")
+    server = create_server(port=0, execution='processes')
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    try:
+        image_bytes = base64.b64decode(create_test_face_image().split(',')[1])
+        encoded = post(base_url, '/reliable_face_recognition/encode',
+                       encode_frame({"timings": True}, {"image_data": image_bytes}))
+        failed = post(base_url, '/reliable_face_recognition/encode', {"image_data": "data:image/png;base64,xx"})
+        with urllib.request.urlopen(base_url + '/health') as response:
+            health = json.loads(response.read())
+        with urllib.request.urlopen(base_url + '/debug/memory') as response:
+            memory = json.loads(response.read())
+    finally:
+        server.shutdown()
+        server.server_close()
+        face_service.worker_pool.shutdown()
+        face_service.worker_pool = None
+
+    assert encoded["success"] and len(encoded["encoding"]) == 8991 and "extract" in encoded["timings"]
+    assert not failed["success"] and failed["error"].startswith("Failed to encode face")
+    assert health["execution"] == 'processes' and health["worker_pids"]
+    assert os.getpid() not in health["worker_pids"]
+    # Memory is measured in the worker that ran the request, not in the front-end
+    assert set(memory["workers"]) <= {str(pid) for pid in health["worker_pids"]} and memory["workers"]
+    assert sum(worker["requests"] for worker in memory["workers"].values()) == 2
+    operation = memory["operations"]["reliable_face_recognition/encode"]
+    assert operation["peak_rss_bytes"] >= operation["post_request_rss_bytes"] > 0
+    print(f"✓ Encoded in worker process(es) {health['worker_pids']}, cv threads {health['cv_threads']}")
+
+def test_asyncio_frontend_stays_responsive():
+    """Over a Unix socket: with every worker busy, /health and /metrics still answer and requests queue"""
+    print("\n=== TESTING ASYNCIO FRONT-END ===")
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    socket_path = os.path.join(tempfile.mkdtemp(), 'face.sock')
+    server = asyncio.run_coroutine_threadsafe(face_service.create_async_server(socket_path=socket_path), loop).result()
+
+    pool = face_service.get_worker_pool()
+    release = threading.Event()
+    blockers = [pool.submit(release.wait) for _ in range(pool.workers)]
+    queued = {}
+    connections = []
+    try:
+        image_data = create_test_face_image()
+        connections.append(UnixHTTPConnection(socket_path))
+        client = threading.Thread(target=lambda: queued.update(zip(('status', 'body'), unix_request(
+            connections[0], 'POST', '/reliable_face_recognition/encode', {"image_data": image_data}))))
+        client.start()
+
+        connection = UnixHTTPConnection(socket_path, timeout=2)
+        connections.append(connection)
+        deadline = time.monotonic() + 5
+        while True:
+            status, metrics = unix_request(connection, 'GET', '/metrics')
+            if b'face_requests_queued 1' in metrics or time.monotonic() > deadline:
+                break
+            time.sleep(0.02)
+        start = time.perf_counter()
+        status, health = unix_request(connection, 'GET', '/health')
+        health_ms = (time.perf_counter() - start) * 1000
+        assert b'face_requests_queued 1' in metrics
+        assert status == 200 and json.loads(health)["frontend"] == face_service.SERVICE_FRONTEND
+        assert not queued, "the encode should still be waiting for a worker"
+
+        status, body = unix_request(connection, 'POST', '/reliable_face_recognition/unknown', {})
+        assert status == 404 and b'Unknown operation' in body
+        status, body = unix_request(connection, 'POST', '/reliable_face_recognition/encode', b'\x00not a request')
+        assert status == 400 and b'Invalid request' in body
+
+        release.set()
+        client.join(timeout=30)
+        assert queued["status"] == 200 and json.loads(queued["body"])["success"], queued
+    finally:
+        release.set()
+        for blocker in blockers:
+            blocker.result()
+        for connection in connections:
+            connection.close()
+
+        async def close():
+            server.close()
+            await server.wait_closed()
+            await asyncio.sleep(0.1)
+        asyncio.run_coroutine_threadsafe(close(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+
+    print(f"✓ /health answered in {health_ms:.1f} ms with all {pool.workers} worker(s) busy; queued encode completed")
+
+def test_unexpected_errors_return_500():
+    """An exception outside the backends is answered with a 500 JSON body on both front-ends"""
+    print("\n=== TESTING INTERNAL ERRORS ===")
+    def broken_debug(method, path, data):
+        raise RuntimeError("debug handler failed")
+
+    server = create_server(port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    async_server = asyncio.run_coroutine_threadsafe(
+        face_service.create_async_server(port=0, socket_path=None), loop).result()
+    original = face_service.handle_debug
+    face_service.handle_debug = broken_debug
+    try:
+        for port in (server.server_address[1], async_server.sockets[0].getsockname()[1]):
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+            connection.request('POST', '/debug/profile', body=b'{}')
+            response = connection.getresponse()
+            body = json.loads(response.read())
+            assert response.status == 500 and response.getheader('Connection') == 'close', response.status
+            assert not body["success"] and "debug handler failed" in body["error"]
+            connection.close()
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/health") as health:
+                assert health.status == 200
+    finally:
+        face_service.handle_debug = original
+        server.shutdown()
+        server.server_close()
+
+        async def close():
+            async_server.close()
+            await async_server.wait_closed()
+            await asyncio.sleep(0.1)
+        asyncio.run_coroutine_threadsafe(close(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+    print("✓ 500 with a JSON error from the threaded and asyncio front-ends; both keep serving")
+
+if __name__ == "__main__":
+    test_service_requests_and_metrics()
+    test_profiling_session_and_thread_dump()
+    test_memory_tracker_diffs_and_operation_rss()
+    test_memory_tracker_peak_during_request()
+    test_processes_execution_mode()
+    test_asyncio_frontend_stays_responsive()
+    test_unexpected_errors_return_500()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Test multi-image enrollment (outlier rejection, the aggregated template) and template refresh
+"""
+
+import os
+import io
+import sys
+import base64
+import numpy as np
+from PIL import Image, ImageEnhance
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server'))
+from face_templates import aggregate_encodings, request_images, refresh_template, verification_confidence
+from face_backends import get_backend, run_operation
+from test_face_verification import create_test_face_image
+
+def test_aggregate_drops_outliers():
+    """A far-away encoding is dropped; the mean of unit vectors is re-normalized, the medoid is an input"""
+    print("=== TESTING TEMPLATE AGGREGATION ===")
+    rng = np.random.default_rng(0)
+    base = rng.normal(size=64)
+    encodings = [base + rng.normal(scale=0.05, size=64) for _ in range(5)] + [rng.normal(size=64)]
+    encodings = [encoding / np.linalg.norm(encoding) for encoding in encodings]
+
+    template, inliers, spread = aggregate_encodings(encodings)
+    assert inliers == [0, 1, 2, 3, 4], inliers
+    assert abs(np.linalg.norm(template) - 1.0) < 1e-9
+    assert 0 < spread["mean"] <= spread["max"] < 0.2
+
+    medoid, inliers, _ = aggregate_encodings(encodings, method='medoid')
+    assert any(np.array_equal(medoid, encodings[index]) for index in inliers)
+
+    same, inliers, spread = aggregate_encodings([encodings[0]] * 3)
+    assert inliers == [0, 1, 2] and spread["max"] < 1e-9
+    print(f"✓ Outlier dropped, template spread {spread}")
+
+def test_enroll_photos_into_one_template():
+    """Variants of one face enroll into a template that matches a new photo; a blank photo is rejected"""
+    print("\n=== TESTING MULTI-IMAGE ENROLLMENT ===")
+    face = Image.open(io.BytesIO(base64.b64decode(create_test_face_image().split(',')[1]))).convert('RGB')
+    photos = [face] + [ImageEnhance.Brightness(face).enhance(factor) for factor in (0.85, 0.95, 1.1)]
+    blank = Image.new('RGB', face.size, 'gray')
+
+    backend = get_backend('reliable_face_recognition')
+    info = {'timings': {}, 'timings_start': 0.0}
+    result = backend.enroll(photos + [blank], info=info)
+    assert result["images"] == 5 and result["used"] == [0, 1, 2, 3], result["used"]
+    assert result["rejected"][0]["index"] == 4 and result["rejected"][0]["reason"] == "encode_failed"
+    assert info["timings"]["images"] == 5 and "aggregate" in info["timings"]
+
+    probe = ImageEnhance.Brightness(face).enhance(1.05)
+    match = backend.compare(result["encoding"], probe)
+    assert match["is_match"], match
+
+    frame_request = {"images": ["a"], "image_1": "c", "image_0": "b", "image_10": "d"}
+    assert request_images(frame_request) == ["a", "b", "c", "d"]
+    print(f"✓ Template from {len(result['used'])} photos, probe distance {match['distance']:.4f}")
+
+def test_refresh_template_guard_rails():
+    """EWMA step towards the embedding, no update below the confidence floor, drift capped per update"""
+    print("\n=== TESTING TEMPLATE REFRESH ===")
+    template = np.array([1.0, 0.0, 0.0])
+    close = np.array([0.99, 0.141, 0.0])
+
+    refreshed = refresh_template(template, close, confidence=0.9, alpha=0.1, max_drift=1.0)
+    assert refreshed["updated"] and not refreshed["drift_capped"]
+    assert np.allclose(refreshed["encoding"], (template + 0.1 * (close - template)) /
+                       np.linalg.norm(template + 0.1 * (close - template)), atol=1e-6)
+
+    skipped = refresh_template(template, close, confidence=0.2, min_confidence=0.5)
+    assert not skipped["updated"] and skipped["reason"] == "low_confidence"
+    assert np.array_equal(skipped["encoding"], template)
+
+    far = np.array([0.0, 1.0, 0.0])
+    capped = refresh_template(template, far, confidence=0.9, alpha=0.5, max_drift=0.05)
+    assert capped["drift_capped"] and abs(capped["drift"] - 0.05) < 1e-12
+    assert np.linalg.norm(capped["encoding"] - template) <= 0.05 + 1e-9
+
+    assert verification_confidence(0.15, 0.6) == 0.75 and verification_confidence(0.9, 0.6) == 0.0
+    response = run_operation(None, 'refresh_template', None, {
+        "template": {"encoding": template.tolist()}, "embedding": close.tolist(), "distance": 0.1, "tolerance": 0.6
+    }, {})
+    assert response["result"]["updated"] and isinstance(response["result"]["encoding"], list)
+    print(f"✓ Refreshed (drift {refreshed['drift']:.4f}), low confidence skipped, drift capped at {capped['drift']}")
+
+if __name__ == "__main__":
+    test_aggregate_drops_outliers()
+    test_enroll_photos_into_one_template()
+    test_refresh_template_guard_rails()
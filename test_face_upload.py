@@ -3,13 +3,17 @@
 Test face upload functionality to debug the image upload issue
 """
 
-import json
+import os
+import sys
 import base64
 import io
 import numpy as np
 from PIL import Image, ImageDraw
 import cv2
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server'))
+from face_backends import get_backend
+
 def create_test_face_image():
     """Create a simple test image with a clear face pattern for testing."""
     # Create a 200x200 RGB image
@@ -47,31 +51,13 @@ def test_face_detection():
     
     print("Testing face detection...")
     
-    # Test with the reliable face recognition system
-    input_data = json.dumps({"image_data": test_image_data})
-    
-    import subprocess
-    try:
-        result = subprocess.run(
-            ['python3', 'server/reliable_face_recognition.py', 'encode'],
-            input=input_data,
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
-        
-        if result.returncode == 0:
-            response = json.loads(result.stdout)
-            if response.get('success'):
-                print("✅ Face detection successful!")
-                print(f"Encoding dimensions: {len(response['encoding'])}")
-            else:
-                print(f"❌ Face detection failed: {response.get('error')}")
-        else:
-            print(f"❌ Process failed: {result.stderr}")
-            
-    except Exception as e:
-        print(f"❌ Test error: {e}")
+    # Test with the reliable face recognition system (raises if no face is detected)
+    info = {}
+    encoding = get_backend('reliable_face_recognition').encode(test_image_data, info=info)
+    print("✅ Face detection successful!")
+    print(f"Encoding dimensions: {len(encoding)}")
+    assert encoding.ndim == 1 and len(encoding) > 0 and np.isfinite(encoding).all()
+    assert info['hint_used'] is False
 
 if __name__ == "__main__":
     test_face_detection()
\ No newline at end of file
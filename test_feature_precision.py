@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Test the opt-in float32 feature pipeline against the float64 output of every OpenCV backend
+"""
+
+import os
+import io
+import sys
+import base64
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server'))
+from face_backends import load_backend, run_operation
+from feature_precision import feature_precision, fft_magnitude
+from test_face_verification import create_test_face_image
+from debug_face_security import create_distinct_face_images
+
+# Backend -> function returning the extractor's feature array for an RGB image
+def _deepface_features(module, image):
+    face_image = module.process_image_from_base64(image)
+    return module.extract_face_features_deepface_style(face_image, module.detect_face_opencv(face_image))
+
+EXTRACTORS = {
+    'reliable_face_recognition': lambda module, image: module.encode_face(image, None, {}),
+    'face_recognition_service': lambda module, image: module.generate_face_encoding(image, None, {}),
+    'secure_face_recognition': lambda module, image: module.encode_face_ultra_secure(image, None, {}),
+    'simple_face_recognition': lambda module, image: module.encode_face(image, None, {}),
+    'simple_deepface_verification': _deepface_features,
+}
+
+# Largest element-wise difference allowed, relative to the encoding's norm. Most extractors agree
+# to ~1e-7; face_recognition_service moves a few HOG votes between bins for gradients that sit
+# exactly on a bin edge, where float32 and float64 round the angle differently.
+TOLERANCE = 1e-3
+
+def _photo(data_url):
+    return np.asarray(Image.open(io.BytesIO(base64.b64decode(data_url.split(',')[1]))).convert('RGB'))
+
+def test_float32_matches_float64():
+    """Every extractor's float32 encoding stays within TOLERANCE of float64, and so do distances"""
+    print("=== TESTING FLOAT32 FEATURE PIPELINE ===")
+    faces = [_photo(create_test_face_image()), _photo(create_distinct_face_images()[0])]
+    for name, extract in EXTRACTORS.items():
+        module = load_backend(name)
+        encodings = {}
+        for precision in ('float64', 'float32'):
+            with feature_precision(precision):
+                encodings[precision] = [np.asarray(extract(module, face), dtype=np.float64) for face in faces]
+
+        for full, single in zip(encodings['float64'], encodings['float32']):
+            error = np.max(np.abs(full - single)) / np.linalg.norm(full)
+            assert error < TOLERANCE, f"{name}: float32 differs by {error:.2e}"
+        distance_64 = np.linalg.norm(encodings['float64'][0] - encodings['float64'][1])
+        distance_32 = np.linalg.norm(encodings['float32'][0] - encodings['float32'][1])
+        assert abs(distance_64 - distance_32) < TOLERANCE * max(distance_64, 1.0), name
+        print(f"✓ {name}: distance {distance_64:.6f} (float64) vs {distance_32:.6f} (float32)")
+
+def test_float32_arrays_and_request_option():
+    """Extractors return float32 arrays in float32 mode; requests opt in with "precision" """
+    print("\n=== TESTING PRECISION SELECTION ===")
+    face = _photo(create_test_face_image())
+    module = load_backend('simple_deepface_verification')
+    with feature_precision('float32'):
+        assert _deepface_features(module, face).dtype == np.float32
+        spectrum = fft_magnitude(np.arange(64, dtype=np.uint8).reshape(8, 8))
+        assert spectrum.dtype == np.float32
+    assert _deepface_features(module, face).dtype == np.float64
+    assert np.allclose(spectrum, np.abs(np.fft.fftshift(np.fft.fft2(np.arange(64).reshape(8, 8)))), rtol=1e-5)
+
+    reliable = load_backend('reliable_face_recognition')
+    response = run_operation(reliable, 'encode', 'encode_face', {"image_data": face, "precision": "float32"}, {})
+    assert response["success"] and len(response["encoding"]) == 8991
+    try:
+        run_operation(reliable, 'encode', 'encode_face', {"image_data": face, "precision": "float16"}, {})
+        assert False, "an unknown precision should be rejected"
+    except Exception as e:
+        assert "Unknown precision" in str(e)
+    print("✓ float32 arrays inside the block, float64 outside, per-request option honoured")
+
+if __name__ == "__main__":
+    test_float32_matches_float64()
+    test_float32_arrays_and_request_option()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Test the shared upload decoder (reduced-resolution JPEG decoding, EXIF orientation)
+and the FaceImage view cache built on it
+"""
+
+import os
+import sys
+import io
+import base64
+import numpy as np
+import cv2
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server'))
+from image_io import decode_image
+from face_image import FaceImage
+
+def create_jpeg(width, height, exif=None):
+    """Create a smooth gradient JPEG as a data URL"""
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)
+    rgb = np.stack(np.broadcast_arrays(x[None, :], y[:, None], (x[None, :] + y[:, None]) / 2), axis=-1)
+    buffer = io.BytesIO()
+    Image.fromarray(rgb.astype(np.uint8)).save(buffer, 'JPEG', quality=90, exif=exif or Image.Exif())
+    return 'data:image/jpeg;base64,' + base64.b64encode(buffer.getvalue()).decode()
+
+def test_large_jpeg_decoded_at_reduced_scale():
+    """A 12MP upload is decoded at the coarsest DCT scale still covering max_side"""
+    print("=== TESTING REDUCED-RESOLUTION DECODE ===")
+    image_data = create_jpeg(4000, 3000)
+
+    info = {}
+    reduced = decode_image(image_data, max_side=1280, info=info)
+    assert reduced.shape == (1500, 2000, 3)
+    assert info['decode_scale'] == 0.5
+
+    full = decode_image(image_data, max_side=0)
+    assert full.shape == (3000, 4000, 3)
+    # Same picture, just fewer pixels
+    assert np.abs(reduced[::100, ::100].astype(int) - full[::200, ::200].astype(int)).mean() < 4
+    print("✓ 4000x3000 JPEG decoded at 2000x1500")
+
+def test_small_upload_and_exif_orientation():
+    """Small uploads keep full resolution; EXIF rotation is applied"""
+    info = {}
+    assert decode_image(create_jpeg(640, 480), info=info).shape == (480, 640, 3)
+    assert info['decode_scale'] == 1.0
+
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Rotated 90° clockwise
+    assert decode_image(create_jpeg(640, 480, exif)).shape == (640, 480, 3)
+
+    # The scale maps upright client coordinates: 3002 wide upright, decoded 1501 wide
+    # (the stored 4001 px side rounds up to 2001 at 1/2 scale)
+    info = {}
+    assert decode_image(create_jpeg(4001, 3002, exif), max_side=1280, info=info).shape == (2001, 1501, 3)
+    assert info['decode_scale'] == 0.5
+    print("✓ Small upload untouched, EXIF orientation applied")
+
+def test_writable_decode():
+    """writable=True copies read-only decodes and frame buffers; writable arrays are returned as they are"""
+    image_data = create_jpeg(320, 240)
+    assert decode_image(image_data, writable=True).flags.writeable
+    frame_pixels = np.frombuffer(bytes(240 * 320 * 3), dtype=np.uint8).reshape(240, 320, 3)
+    assert not decode_image(frame_pixels).flags.writeable
+    copied = decode_image(frame_pixels, writable=True)
+    assert copied.flags.writeable and np.array_equal(copied, frame_pixels)
+    pixels = np.zeros((240, 320, 3), dtype=np.uint8)
+    assert decode_image(pixels, writable=True) is pixels
+    print("✓ Writable arrays for face_recognition")
+
+def test_face_image_views_match_and_are_memoized():
+    """Cached crops equal the direct conversions and are computed once"""
+    print("\n=== TESTING FACEIMAGE VIEWS ===")
+    rgb = decode_image(create_jpeg(320, 240))
+    face = FaceImage(rgb)
+    face_box = (100, 60, 120, 120)
+
+    gray = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+    expected = cv2.resize(gray[36:204, 76:244], (160, 160))
+    crop = face.crop(face_box, 'gray', padding=0.2, size=(160, 160))
+    assert np.array_equal(crop, expected)
+    assert face.crop(face_box, 'gray', padding=0.2, size=(160, 160)) is crop
+    assert face.gray is face.gray
+
+    hsv = face.crop(face_box, 'hsv', padding=0.2, size=(160, 160))
+    color = cv2.resize(rgb[36:204, 76:244], (160, 160))
+    assert np.array_equal(hsv, cv2.cvtColor(color, cv2.COLOR_RGB2HSV))
+    assert np.array_equal(face.pyramid(face_box, 'gray', (160, 160), 2, padding=0.2), cv2.resize(expected, (80, 80)))
+    print("✓ Gray/HSV crops and pyramid levels match direct computation")
+
+if __name__ == "__main__":
+    test_large_jpeg_decoded_at_reduced_scale()
+    test_small_upload_and_exif_orientation()
+    test_writable_decode()
+    test_face_image_views_match_and_are_memoized()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Test the micro-batching scheduler and the Facenet input preprocessing of the batched DeepFace path
+"""
+
+import os
+import sys
+import time
+import types
+import threading
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server'))
+import facenet_batching
+from micro_batching import MicroBatcher
+from facenet_batching import fit_to_input, cosine_distance, verify_facenet
+
+def test_concurrent_requests_share_forward_passes():
+    """Reserved requests arriving apart are batched together and each gets back its own outputs"""
+    print("=== TESTING MICRO-BATCHING ===")
+    weights = np.random.default_rng(0).standard_normal((12, 4))
+    batch_sizes = []
+
+    def forward(batch):
+        batch_sizes.append(len(batch))
+        return batch @ weights
+
+    batcher = MicroBatcher(forward, window_ms=200, max_batch=16)
+    inputs = [np.random.default_rng(seed).standard_normal((2, 12)) for seed in range(6)]
+    outputs = [None] * len(inputs)
+    info = {"timings": {}}
+
+    def request(index):
+        with batcher.reserve() as slot:
+            time.sleep(0.005 * index)
+            outputs[index] = slot.submit(inputs[index], info if index == 0 else None)
+
+    threads = [threading.Thread(target=request, args=(index,)) for index in range(len(inputs))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for rows, result in zip(inputs, outputs):
+        assert np.allclose(result, rows @ weights)
+    assert batch_sizes == [12], batch_sizes
+    assert info["timings"]["batch_rows"] == 12
+    assert batcher.stats() == {"batches": 1, "rows": 12, "mean_batch_rows": 12.0}
+    print(f"✓ {len(inputs)} requests, {sum(batch_sizes)} crops in {len(batch_sizes)} forward pass")
+
+def test_window_max_batch_and_errors():
+    """A lone request does not wait out the window; max_batch splits batches; errors reach every waiter"""
+    print("\n=== TESTING BATCH LIMITS ===")
+    batch_sizes = []
+    batcher = MicroBatcher(lambda batch: batch_sizes.append(len(batch)) or batch * 2, window_ms=1000, max_batch=4)
+
+    start = time.perf_counter()
+    with batcher.reserve() as slot:
+        assert np.array_equal(slot.submit(np.ones((2, 3))), np.full((2, 3), 2.0))
+    assert time.perf_counter() - start < 0.5, "nobody else was preparing, the batch should not wait"
+
+    # Three 2-crop requests against max_batch 4: at most two requests per pass
+    with batcher.reserve():
+        threads = [threading.Thread(target=batcher.submit, args=(np.ones((2, 3)),)) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.05)
+    for thread in threads:
+        thread.join()
+    assert batch_sizes[1:] and all(size <= 4 for size in batch_sizes), batch_sizes
+    assert sum(batch_sizes[1:]) == 6
+
+    def broken(batch):
+        raise ValueError("model failed")
+    failing = MicroBatcher(broken, window_ms=5)
+    try:
+        failing.submit(np.ones((1, 3)))
+        assert False, "the forward pass error should reach the caller"
+    except ValueError as e:
+        assert str(e) == "model failed"
+    print(f"✓ batches {batch_sizes}, errors propagated")
+
+def test_facenet_input_preprocessing():
+    """Crops are scaled to fit, zero-padded to the model input, scaled to [0, 1] and flipped to BGR"""
+    print("\n=== TESTING FACENET INPUT ===")
+    face = np.zeros((80, 40, 3), dtype=np.float32)
+    face[:, :, 0] = 255
+    fitted = fit_to_input(face, (160, 160))
+    assert fitted.shape == (160, 160, 3)
+    assert np.allclose(fitted[:, 40:120, 2], 1.0) and np.allclose(fitted[:, 40:120, :2], 0.0)
+    assert np.allclose(fitted[:, :40], 0.0) and np.allclose(fitted[:, 120:], 0.0)
+    assert abs(cosine_distance(np.array([1.0, 0.0]), np.array([0.0, 2.0])) - 1.0) < 1e-12
+    print("✓ 80x40 crop centred in 160x160 input")
+
+class FakeFacenet:
+    """Keras-style Facenet stand-in: a fixed linear embedding of the 160x160 input, recording batch sizes."""
+
+    input_shape = (None, 160, 160, 3)
+
+    def __init__(self):
+        self.weights = np.random.default_rng(1).standard_normal((160 * 160 * 3, 16)).astype(np.float32)
+        self.batch_sizes = []
+
+    def __call__(self, batch, training=False):
+        self.batch_sizes.append(len(batch))
+        rows = np.asarray(batch, dtype=np.float32).reshape(len(batch), -1)
+        return (rows - rows.mean(axis=1, keepdims=True)) @ self.weights
+
+def fake_deepface(faces, model, threshold, barrier=None):
+    """
+    deepface package stand-in: extract_faces returns the face registered for a path, verify embeds
+    each image on its own like DeepFace's batch-1 path. barrier holds the first extract_faces of every
+    request until all of them are preparing.
+    """
+    def extract_faces(img_path, detector_backend='opencv', enforce_detection=True, align=True):
+        if barrier is not None and img_path.endswith('_1.jpg'):
+            barrier.wait(timeout=5)
+        return [{"face": faces[img_path], "confidence": 1.0}]
+
+    def verify(img1_path, img2_path, model_name='VGG-Face', detector_backend='opencv', enforce_detection=True):
+        embeddings = [model(fit_to_input(extract_faces(path)[0]["face"], (160, 160))[None])[0]
+                      for path in (img1_path, img2_path)]
+        distance = cosine_distance(*embeddings)
+        return {"verified": distance <= threshold, "distance": distance, "threshold": threshold, "model": model_name}
+
+    DeepFace = types.ModuleType('deepface.DeepFace')
+    DeepFace.build_model = lambda model_name: types.SimpleNamespace(model=model)
+    DeepFace.extract_faces = extract_faces
+    DeepFace.verify = verify
+    verification = types.ModuleType('deepface.modules.verification')
+    verification.find_threshold = lambda model_name, distance_metric: threshold
+    package = types.ModuleType('deepface')
+    package.DeepFace = DeepFace
+    package.modules = types.ModuleType('deepface.modules')
+    package.modules.verification = verification
+    return {'deepface': package, 'deepface.DeepFace': DeepFace,
+            'deepface.modules': package.modules, 'deepface.modules.verification': verification}
+
+def test_batched_facenet_matches_deepface_verify():
+    """Concurrent batched verifies share one forward pass and answer like DeepFace.verify"""
+    print("\n=== TESTING BATCHED FACENET VERIFY ===")
+    rng = np.random.default_rng(2)
+    people = [rng.uniform(0, 1, size=(120, 100, 3)).astype(np.float32) for _ in range(4)]
+    faces = {}
+    for index, person in enumerate(people):
+        faces[f"person{index}_1.jpg"] = person
+        # Same person, a little noise; every other request compares against someone else
+        other = person if index % 2 == 0 else people[index - 1]
+        faces[f"person{index}_2.jpg"] = np.clip(other + rng.normal(0, 0.02, other.shape), 0, 1).astype(np.float32)
+    pairs = [(f"person{index}_1.jpg", f"person{index}_2.jpg") for index in range(len(people))]
+
+    model = FakeFacenet()
+    saved_modules = {name: module for name, module in sys.modules.items() if name.split('.')[0] == 'deepface'}
+    saved = (facenet_batching.BATCH_WINDOW_MS, facenet_batching._model, facenet_batching._batcher)
+    try:
+        sys.modules.update(fake_deepface(faces, model, threshold=0.2))
+        facenet_batching.BATCH_WINDOW_MS = 0
+        expected = [verify_facenet(*pair) for pair in pairs]
+        assert model.batch_sizes == [1] * 8
+
+        sys.modules.update(fake_deepface(faces, model, threshold=0.2, barrier=threading.Barrier(len(pairs))))
+        facenet_batching.BATCH_WINDOW_MS = 1000
+        facenet_batching._model = facenet_batching._batcher = None
+        model.batch_sizes.clear()
+        results = [None] * len(pairs)
+        info = {"timings": {}}
+
+        def request(index):
+            results[index] = verify_facenet(*pairs[index], info if index == 0 else None)
+
+        threads = [threading.Thread(target=request, args=(index,)) for index in range(len(pairs))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        for name in [name for name in sys.modules if name.split('.')[0] == 'deepface']:
+            del sys.modules[name]
+        sys.modules.update(saved_modules)
+        facenet_batching.BATCH_WINDOW_MS, facenet_batching._model, facenet_batching._batcher = saved
+
+    assert model.batch_sizes == [8], model.batch_sizes
+    assert info["timings"]["batch_rows"] == 8
+    for result, reference in zip(results, expected):
+        assert result["verified"] == reference["verified"] and result["threshold"] == 0.2
+        assert abs(result["distance"] - reference["distance"]) < 1e-5, (result, reference)
+    assert [result["verified"] for result in results] == [True, False, True, False]
+    print(f"✓ {len(pairs)} verifies in one forward pass of {model.batch_sizes[0]} crops, same results")
+
+if __name__ == "__main__":
+    test_concurrent_requests_share_forward_passes()
+    test_window_max_batch_and_errors()
+    test_facenet_input_preprocessing()
+    test_batched_facenet_matches_deepface_verify()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Test per-request deadlines: timeouts between stages, skipped detection fallbacks, degraded feature groups
+"""
+
+import os
+import sys
+import time
+import contextlib
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server'))
+import request_budget
+from request_budget import (remaining_after_queue, Budget, DeadlineExceeded, deadline_scope, measured,
+                            optional_stage, learned_cost)
+from face_backends import BACKENDS, load_backend, run_operation
+from test_face_verification import create_test_face_image
+
+BLANK = np.full((240, 320, 3), 128, dtype=np.uint8)
+
+@contextlib.contextmanager
+def learned_costs(costs, probe_after=None):
+    """Run with the given stage costs (and probe interval), restoring the learned state afterwards."""
+    saved = dict(request_budget._costs), dict(request_budget._refusals), request_budget.PROBE_AFTER
+    try:
+        request_budget._costs.update(costs)
+        request_budget._refusals.clear()
+        if probe_after is not None:
+            request_budget.PROBE_AFTER = probe_after
+        yield
+    finally:
+        for learned, previous in zip((request_budget._costs, request_budget._refusals), saved):
+            learned.clear()
+            learned.update(previous)
+        request_budget.PROBE_AFTER = saved[2]
+
+def test_timeouts_and_skipped_fallbacks():
+    """An exhausted budget returns a timeout naming the stage instead of running the rest"""
+    print("=== TESTING REQUEST DEADLINES ===")
+    reliable = load_backend('reliable_face_recognition')
+    response = run_operation(reliable, 'encode', 'encode_face',
+                             {"image_data": create_test_face_image(), "deadline_ms": 0.001}, {})
+    assert response["timeout"] and not response["success"] and response["stage"] == 'decode', response
+
+    # No face in the first pass and fallbacks known to take longer than the budget: stop at detect
+    with learned_costs({'reliable_face_recognition:detection_fallbacks': 1e6}):
+        response = run_operation(reliable, 'encode', 'encode_face', {"image_data": BLANK, "deadline_ms": 5000}, {})
+    assert response["timeout"] and response["stage"] == 'detect', response
+
+    # Without a deadline the same image runs every fallback and fails normally
+    try:
+        run_operation(reliable, 'encode', 'encode_face', {"image_data": BLANK}, {})
+        assert False, "a blank image has no face"
+    except Exception as e:
+        assert "No face detected" in str(e)
+
+    data, expired = remaining_after_queue({"deadline_ms": 500}, time.monotonic() - 1)
+    assert data is None and expired["stage"] == 'queue'
+    data, expired = remaining_after_queue({"deadline_ms": 500}, time.monotonic())
+    assert expired is None and 0 < data["deadline_ms"] <= 500
+    try:
+        run_operation(reliable, 'encode', 'encode_face', {"image_data": BLANK, "deadline_ms": "soon"}, {})
+        assert False, "a non-numeric deadline should be rejected"
+    except Exception as e:
+        assert "Invalid deadline_ms" in str(e)
+    print("✓ timeout at decode, detection fallbacks skipped, queue expiry")
+
+def test_degraded_feature_groups():
+    """Optional LBP groups that do not fit are zero-filled and listed; the encoding keeps its layout"""
+    print("\n=== TESTING DEGRADED RESULTS ===")
+    secure = load_backend('secure_face_recognition')
+    image = create_test_face_image()
+    full = run_operation(secure, 'encode', 'encode_face_ultra_secure', {"image_data": image}, {})
+    assert "degraded" not in full
+
+    with learned_costs({'secure_lbp_scale_4': 1e6}):
+        degraded = run_operation(secure, 'encode', 'encode_face_ultra_secure',
+                                 {"image_data": image, "deadline_ms": 60000}, {})
+    assert degraded["success"] and degraded["degraded"] == ['secure_lbp_scale_4'], degraded
+    assert len(degraded["encoding"]) == len(full["encoding"])
+    assert degraded["encoding"] != full["encoding"]
+    print(f"✓ degraded {degraded['degraded']}, {len(degraded['encoding'])} values")
+
+def test_compare_never_degrades():
+    """A compare under the same budget computes every group, so the same face still matches"""
+    print("\n=== TESTING COMPARE UNDER A BUDGET ===")
+    image = create_test_face_image()
+    for name, costs in (('secure_face_recognition', {'secure_lbp_scale_2': 1e6, 'secure_lbp_scale_4': 1e6}),
+                        ('face_recognition_service', {'lbp_radius_2': 1e6, 'lbp_radius_3': 1e6})):
+        module = load_backend(name)
+        encode, compare = (BACKENDS[name][operation][1] for operation in ('encode', 'compare'))
+        known = run_operation(module, 'encode', encode, {"image_data": image}, {})["encoding"]
+        unbounded = run_operation(module, 'compare', compare, {"known_encoding": known, "unknown_image": image}, {})
+        with learned_costs(costs):
+            degraded = run_operation(module, 'encode', encode, {"image_data": image, "deadline_ms": 60000}, {})
+            bounded = run_operation(module, 'compare', compare,
+                                    {"known_encoding": known, "unknown_image": image, "deadline_ms": 60000}, {})
+        assert degraded["degraded"] == sorted(costs), degraded
+        assert "degraded" not in bounded and bounded["result"]["is_match"], bounded
+        assert abs(bounded["result"]["distance"] - unbounded["result"]["distance"]) < 1e-9
+        print(f"✓ {name}: distance {bounded['result']['distance']:.4f} with {sorted(costs)} unaffordable")
+
+def test_learned_costs_recover():
+    """Costs are learned from timed-out runs too, and a stage that got faster is probed back in"""
+    print("\n=== TESTING COST RECOVERY ===")
+    with learned_costs({}, probe_after=5):
+        # A stage that timed out still leaves its cost behind
+        try:
+            with measured('test_timed_out_stage'):
+                time.sleep(0.02)
+                raise DeadlineExceeded('test_timed_out_stage', 20)
+        except DeadlineExceeded:
+            pass
+        assert learned_cost('test_timed_out_stage') >= 20
+
+        # Learned slow without a deadline, then fast: refused under a 20 ms deadline until the probe
+        for _ in range(3):
+            optional_stage('test_stage', lambda: time.sleep(0.05), None)
+        assert learned_cost('test_stage') >= 50
+        results = []
+        for _ in range(8):
+            with deadline_scope(Budget(20)):
+                results.append(optional_stage('test_stage', lambda: 'full', 'partial'))
+        assert results == ['partial'] * 4 + ['full'] * 4, results
+        assert learned_cost('test_stage') < 20
+
+        # Detection fallbacks learned under load: the probe re-measures them and later requests run them
+        reliable = load_backend('reliable_face_recognition')
+        request_budget._costs['reliable_face_recognition:detection_fallbacks'] = 1e6
+        stages = []
+        for _ in range(6):
+            try:
+                response = run_operation(reliable, 'encode', 'encode_face',
+                                         {"image_data": BLANK, "deadline_ms": 5000}, {})
+                stages.append(response["stage"])
+            except Exception as e:
+                assert "No face detected" in str(e)
+                stages.append('ran')
+        assert stages == ['detect'] * 4 + ['ran'] * 2, stages
+        assert learned_cost('reliable_face_recognition:detection_fallbacks') < 5000
+    print(f"✓ recovered after {results.index('full')} refusals")
+
+if __name__ == "__main__":
+    test_timeouts_and_skipped_fallbacks()
+    test_degraded_feature_groups()
+    test_compare_never_degrades()
+    test_learned_costs_recover()
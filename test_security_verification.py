@@ -3,15 +3,23 @@
 Test security verification - ensure different people cannot access each other's accounts
 """
 
-import json
+import os
+import sys
 import base64
 import io
 import numpy as np
+import cv2
 from PIL import Image, ImageDraw
-import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server'))
+from face_backends import get_backend
+from image_io import decode_image
+from test_face_verification import create_test_face_image as create_face_a
+from test_face_upload import create_test_face_image as create_face_b
 
 def create_face_pattern_a():
-    """Create distinctive face pattern A"""
+    """Create distinctive face pattern A (the OpenCV detectors find no face in it; used by the benchmarks)"""
     img = Image.new('RGB', (300, 300), color='lightblue')
     draw = ImageDraw.Draw(img)
     
@@ -68,161 +76,61 @@ def image_to_base64(img):
     base64_string = base64.b64encode(image_bytes).decode('utf-8')
     return f"data:image/jpeg;base64,{base64_string}"
 
+def another_capture(image_data):
+    """The same face photographed again: a little brighter and a few pixels off-centre"""
+    image = np.clip(decode_image(image_data).astype(np.int16) + 12, 0, 255).astype(np.uint8)
+    shift = np.float32([[1, 0, 4], [0, 1, 3]])
+    return cv2.warpAffine(image, shift, image.shape[1::-1], borderMode=cv2.BORDER_REPLICATE)
+
+def check_verification(backend, stored_encoding, face, should_match):
+    """Compare a face against a stored encoding at the backend's tolerance; True if the outcome is the expected one"""
+    try:
+        result = backend.compare(stored_encoding, face)
+        distance = result['distance']
+        is_match = result['is_match']
+        print(f"   Distance: {distance:.4f}")
+        print(f"   Match: {is_match}")
+        if should_match:
+            print(f"   Expected: Should PASS (same person)")
+            print(f"   Result: {'✅ LEGITIMATE ACCESS' if is_match else '❌ LEGITIMATE USER BLOCKED'}")
+        else:
+            print(f"   Expected: Should FAIL (different people)")
+            print(f"   Result: {'❌ SECURITY BREACH!' if is_match else '✅ SECURE'}")
+        return is_match == should_match
+        
+    except Exception as e:
+        print(f"❌ Comparison failed: {e}")
+        return False
+
 def test_cross_verification():
     """Test that Person A's face cannot verify as Person B and vice versa"""
     print("=== CROSS-PERSON VERIFICATION SECURITY TEST ===")
     
-    # Create two distinct face patterns
-    face_a = create_face_pattern_a()
-    face_b = create_face_pattern_b()
-    
-    face_a_data = image_to_base64(face_a)
-    face_b_data = image_to_base64(face_b)
+    # Two different synthetic faces the detectors find; encoding raises if no face is detected
+    face_a = create_face_a()
+    face_b = create_face_b()
+    backend = get_backend('reliable_face_recognition')
     
     print("1. Encoding Face A...")
-    try:
-        result_a = subprocess.run(
-            ['python3', 'server/reliable_face_recognition.py', 'encode'],
-            input=json.dumps({"image_data": face_a_data}),
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
-        
-        if result_a.returncode != 0:
-            print(f"❌ Failed to encode Face A: {result_a.stderr}")
-            return
-            
-        response_a = json.loads(result_a.stdout)
-        if not response_a.get('success'):
-            print(f"❌ Face A encoding failed: {response_a.get('error')}")
-            return
-            
-        encoding_a = response_a['encoding']
-        print(f"✅ Face A encoded successfully (dimensions: {len(encoding_a)})")
-        
-    except Exception as e:
-        print(f"❌ Error encoding Face A: {e}")
-        return
+    encoding_a = backend.encode(face_a)
+    print(f"✅ Face A encoded successfully (dimensions: {len(encoding_a)})")
     
     print("\n2. Encoding Face B...")
-    try:
-        result_b = subprocess.run(
-            ['python3', 'server/reliable_face_recognition.py', 'encode'],
-            input=json.dumps({"image_data": face_b_data}),
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
-        
-        if result_b.returncode != 0:
-            print(f"❌ Failed to encode Face B: {result_b.stderr}")
-            return
-            
-        response_b = json.loads(result_b.stdout)
-        if not response_b.get('success'):
-            print(f"❌ Face B encoding failed: {response_b.get('error')}")
-            return
-            
-        encoding_b = response_b['encoding']
-        print(f"✅ Face B encoded successfully (dimensions: {len(encoding_b)})")
-        
-    except Exception as e:
-        print(f"❌ Error encoding Face B: {e}")
-        return
+    encoding_b = backend.encode(face_b)
+    print(f"✅ Face B encoded successfully (dimensions: {len(encoding_b)})")
     
     print("\n3. Testing Face A trying to verify as Face B (should FAIL)...")
-    try:
-        result = subprocess.run(
-            ['python3', 'server/reliable_face_recognition.py', 'compare'],
-            input=json.dumps({
-                "known_encoding": encoding_b,  # B's stored encoding
-                "unknown_image": face_a_data,  # A's face trying to verify
-                "tolerance": 0.8
-            }),
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
-        
-        if result.returncode == 0:
-            response = json.loads(result.stdout)
-            if response.get('success'):
-                distance = response['result']['distance']
-                is_match = response['result']['is_match']
-                print(f"   Distance: {distance:.4f}")
-                print(f"   Match: {is_match}")
-                print(f"   Expected: Should FAIL (different people)")
-                print(f"   Result: {'❌ SECURITY BREACH!' if is_match else '✅ SECURE'}")
-            else:
-                print(f"❌ Comparison failed: {response.get('error')}")
-        else:
-            print(f"❌ Process failed: {result.stderr}")
-            
-    except Exception as e:
-        print(f"❌ Error in cross-verification test: {e}")
+    assert check_verification(backend, encoding_b, face_a, should_match=False), "Face A verified as Face B"
     
     print("\n4. Testing Face B trying to verify as Face A (should FAIL)...")
-    try:
-        result = subprocess.run(
-            ['python3', 'server/reliable_face_recognition.py', 'compare'],
-            input=json.dumps({
-                "known_encoding": encoding_a,  # A's stored encoding
-                "unknown_image": face_b_data,  # B's face trying to verify
-                "tolerance": 0.8
-            }),
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
-        
-        if result.returncode == 0:
-            response = json.loads(result.stdout)
-            if response.get('success'):
-                distance = response['result']['distance']
-                is_match = response['result']['is_match']
-                print(f"   Distance: {distance:.4f}")
-                print(f"   Match: {is_match}")
-                print(f"   Expected: Should FAIL (different people)")
-                print(f"   Result: {'❌ SECURITY BREACH!' if is_match else '✅ SECURE'}")
-            else:
-                print(f"❌ Comparison failed: {response.get('error')}")
-        else:
-            print(f"❌ Process failed: {result.stderr}")
-            
-    except Exception as e:
-        print(f"❌ Error in reverse cross-verification test: {e}")
+    assert check_verification(backend, encoding_a, face_b, should_match=False), "Face B verified as Face A"
     
     print("\n5. Testing legitimate verification (Face A vs Face A)...")
-    try:
-        result = subprocess.run(
-            ['python3', 'server/reliable_face_recognition.py', 'compare'],
-            input=json.dumps({
-                "known_encoding": encoding_a,  # A's stored encoding
-                "unknown_image": face_a_data,  # A's face verifying
-                "tolerance": 0.8
-            }),
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
-        
-        if result.returncode == 0:
-            response = json.loads(result.stdout)
-            if response.get('success'):
-                distance = response['result']['distance']
-                is_match = response['result']['is_match']
-                print(f"   Distance: {distance:.4f}")
-                print(f"   Match: {is_match}")
-                print(f"   Expected: Should PASS (same person)")
-                print(f"   Result: {'✅ LEGITIMATE ACCESS' if is_match else '❌ LEGITIMATE USER BLOCKED'}")
-            else:
-                print(f"❌ Comparison failed: {response.get('error')}")
-        else:
-            print(f"❌ Process failed: {result.stderr}")
-            
-    except Exception as e:
-        print(f"❌ Error in legitimate verification test: {e}")
+    assert check_verification(backend, encoding_a, face_a, should_match=True), "Face A blocked on its own photo"
+    
+    print("\n6. Testing legitimate verification (Face A vs another capture of Face A)...")
+    assert check_verification(backend, encoding_a, another_capture(face_a), should_match=True), \
+        "Face A blocked on a second capture"
 
 if __name__ == "__main__":
     test_cross_verification()
\ No newline at end of file
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Test the optional per-stage timing breakdown of the face recognition workers
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server'))
+from stage_timings import request_info, with_timings
+from simple_face_recognition import encode_face, compare_faces_simple
+from test_face_verification import create_test_face_image
+
+def test_timings_only_when_requested():
+    """Requests without the flag get no timings and no extra keys"""
+    print("=== TESTING STAGE TIMINGS ===")
+    info = request_info({})
+    assert with_timings({"success": True}, info) == {"success": True}
+    print("✓ Timings off by default")
+
+def test_compare_reports_every_stage():
+    """A timed compare reports each stage and gives the same result as an untimed one"""
+    image_data = create_test_face_image()
+    known_encoding = encode_face(image_data)
+
+    info = request_info({"timings": True})
+    result = compare_faces_simple(known_encoding, image_data, info=info)
+    response = with_timings({"success": True, "result": result}, info)
+    timings = response["timings"]
+
+    for stage in ("decode", "detect", "extract", "distance", "total"):
+        assert timings[stage] >= 0, stage
+    assert timings["detect_passes"] >= 1
+    assert set(timings["features"]) >= {"windows", "regions", "edges"}
+    assert timings["total"] >= timings["decode"] + timings["detect"] + timings["extract"]
+    assert result == compare_faces_simple(known_encoding, image_data)
+    print(f"✓ Timings: {timings}")
+
+if __name__ == "__main__":
+    test_timings_only_when_requested()
+    test_compare_reports_every_stage()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Test binary request frames for the Python workers against the legacy JSON requests
+"""
+
+import os
+import sys
+import io
+import json
+import base64
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server'))
+from worker_protocol import encode_frame, read_request, FrameError
+from image_io import decode_image, upload_digest
+from face_backends import load_backend, run_operation
+from test_face_verification import create_test_face_image
+
+def test_frame_round_trip():
+    """Fields, encoded images and pixel buffers survive a frame unchanged"""
+    print("=== TESTING BINARY REQUEST FRAMES ===")
+    pixels = np.arange(4 * 5 * 3, dtype=np.uint8).reshape(4, 5, 3)
+    frame = encode_frame({"tolerance": 0.3, "known_encoding": [0.1, 0.2]},
+                         {"unknown_image": b"\xff\xd8jpeg", "captured_image": pixels})
+
+    data = read_request(io.BytesIO(frame))
+    assert data["tolerance"] == 0.3
+    assert data["known_encoding"] == [0.1, 0.2]
+    assert bytes(data["unknown_image"]) == b"\xff\xd8jpeg"
+    assert np.array_equal(data["captured_image"], pixels)
+    print("✓ Frame round trip")
+
+def test_frame_and_json_decode_to_same_image():
+    """A frame carrying raw bytes decodes to the same pixels as the data URL"""
+    data_url = create_test_face_image()
+    image_bytes = base64.b64decode(data_url.split(',')[1])
+
+    from_json = read_request(io.BytesIO(json.dumps({"image_data": data_url}).encode()))
+    from_frame = read_request(io.BytesIO(encode_frame({}, {"image_data": image_bytes})))
+
+    expected = np.array(Image.open(io.BytesIO(image_bytes)).convert('RGB'))
+    assert np.array_equal(decode_image(from_json["image_data"]), expected)
+    assert np.array_equal(decode_image(from_frame["image_data"]), expected)
+
+    # The secure backend's image hash is over the file bytes, whichever way they arrived
+    assert upload_digest(data_url).digest() == upload_digest(from_frame["image_data"]).digest()
+    assert upload_digest(expected).digest() == upload_digest(expected.copy()).digest()
+    secure = load_backend('secure_face_recognition')
+    encodings = [run_operation(secure, 'encode', 'encode_face_ultra_secure', data, {})["encoding"]
+                 for data in (from_json, from_frame)]
+    assert encodings[0] == encodings[1]
+    print("✓ JSON and binary requests decode identically")
+
+def test_malformed_frames_raise_value_error():
+    """Truncated or inconsistent frames raise FrameError, a ValueError the service turns into a 400"""
+    print("\n=== TESTING MALFORMED FRAMES ===")
+    frame = encode_frame({"tolerance": 0.3}, {"unknown_image": b"\xff\xd8jpeg" * 10})
+    malformed = {
+        "truncated buffer": frame[:-5],
+        "truncated header": b'FRM1' + (500).to_bytes(4, 'big') + b'{"a": 1',
+        "truncated length": b'FRM1\x00',
+        "shape mismatch": encode_frame({}, {"pixels": np.zeros((2, 2, 3), dtype=np.uint8)}).replace(b'[2, 2, 3]', b'[3, 3, 3]'),
+    }
+    for name, payload in malformed.items():
+        try:
+            read_request(io.BytesIO(payload))
+            assert False, f"{name} should be rejected"
+        except ValueError as e:
+            assert isinstance(e, FrameError) and "Invalid request frame" in str(e), (name, e)
+    print(f"✓ {len(malformed)} malformed frames rejected with FrameError")
+
+if __name__ == "__main__":
+    test_frame_round_trip()
+    test_frame_and_json_decode_to_same_image()
+    test_malformed_frames_raise_value_error()